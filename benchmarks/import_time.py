@@ -0,0 +1,100 @@
+"""
+Import-time benchmark, based on ``python -X importtime``.
+
+Each module is imported in a fresh interpreter, several times, and the
+median cumulative import time is reported together with the modules that
+cost the most on their own. Run from the repository root:
+
+    python benchmarks/import_time.py drillapi.app drillapi.lambda_handler
+
+``--json`` prints the measurements for scripts and the test suite
+(tests/test_import_time.py), ``--budget`` exits with status 1 when a median
+is above the given number of seconds.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def import_once(module: str) -> dict:
+    """Import ``module`` in a new interpreter and parse the importtime report."""
+    env = {**os.environ, "PYTHONPATH": str(ROOT / "src")}
+    code = f"import json, sys, {module}; print(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # "import time: <self us> | <cumulative us> | <indented module name>"
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        timings[name.strip()] = (int(own), int(cumulative))
+
+    return {
+        "seconds": timings[module][1] / 1_000_000,
+        "timings": timings,
+        "modules": json.loads(result.stdout),
+    }
+
+
+def measure(module: str, runs: int = 5, top: int = 15) -> dict:
+    samples = [import_once(module) for _ in range(runs)]
+    fastest = min(samples, key=lambda sample: sample["seconds"])
+    slowest_own = sorted(
+        fastest["timings"].items(), key=lambda item: item[1][0], reverse=True
+    )
+    return {
+        "median": statistics.median(sample["seconds"] for sample in samples),
+        "runs": [sample["seconds"] for sample in samples],
+        "modules": fastest["modules"],
+        "top": [
+            {"module": name, "self": own / 1_000_000, "cumulative": cum / 1_000_000}
+            for name, (own, cum) in slowest_own[:top]
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("modules", nargs="*", default=["drillapi.app"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget", type=float, help="seconds, per module")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    results = {module: measure(module, args.runs, args.top) for module in args.modules}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for module, result in results.items():
+            print(f"{module}: {result['median'] * 1000:.0f} ms (median of {args.runs})")
+            for entry in result["top"]:
+                print(
+                    f"  {entry['self'] * 1000:8.1f} ms self "
+                    f"{entry['cumulative'] * 1000:8.1f} ms cumulative  {entry['module']}"
+                )
+
+    if args.budget is not None and any(
+        result["median"] > args.budget for result in results.values()
+    ):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
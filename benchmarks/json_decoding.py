@@ -0,0 +1,95 @@
+"""
+Decoding of JSON GetFeatureInfo and ESRI REST responses: generic json.loads
+parsing against the typed bytes-in decoder (decode_json_features).
+
+Uses the ESRI fixture of tests/data/esri and synthetic GeoJSON and ESRI
+responses with polygon geometries, as returned by cantonal geoservices. Run
+from the repository root:
+
+    python benchmarks/json_decoding.py --vertices 2000
+"""
+
+import argparse
+import json
+import random
+import sys
+import timeit
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from drillapi.services import processing
+
+
+def _ring(vertices: int) -> list:
+    random.seed(vertices)
+    return [
+        [2574000 + random.random() * 1000, 1249000 + random.random() * 1000]
+        for _ in range(vertices)
+    ]
+
+
+def samples(vertices: int) -> dict:
+    properties = {"category": "Autorisé", "code": 1, "remark": "Zone B"}
+    geojson = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "layerName": f"layer_{i}",
+                "geometry": {"type": "Polygon", "coordinates": [_ring(vertices)]},
+                "properties": properties,
+            }
+            for i in range(3)
+        ],
+    }
+    esri = {
+        "features": [
+            {
+                "layerName": f"layer_{i}",
+                "attributes": properties,
+                "geometry": {"rings": [_ring(vertices)]},
+            }
+            for i in range(3)
+        ]
+    }
+    return {
+        "esri/identify_fr.json": (
+            ROOT / "tests/data/esri/identify_fr.json"
+        ).read_bytes(),
+        "GeoJSON, 3 polygons": json.dumps(geojson).encode("utf-8"),
+        "ESRI, 3 polygons": json.dumps(esri).encode("utf-8"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--vertices", type=int, default=2000, help="per polygon")
+    parser.add_argument("--seconds", type=float, default=1.0, help="per measure")
+    args = parser.parse_args()
+
+    for name, content in samples(args.vertices).items():
+
+        def generic(content=content):
+            return processing._parse_json(content.decode("utf-8", errors="ignore"))
+
+        def typed(content=content):
+            return processing.decode_json_features(content)
+
+        assert generic() == typed()
+        timings = {}
+        for label, decode in [("generic", generic), ("typed", typed)]:
+            number, total = timeit.Timer(decode).autorange()
+            number = max(1, int(number * args.seconds / max(total, 1e-9)))
+            timings[label] = timeit.timeit(decode, number=number) / number * 1e6
+        print(
+            f"{name:24} {len(content) / 1000:8.1f} kB   "
+            f"generic {timings['generic']:9.1f} us   "
+            f"typed {timings['typed']:9.1f} us   "
+            f"x{timings['generic'] / timings['typed']:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Requests per second of the drill category routes, with and without the fast
+JSON response path (FAST_JSON_RESPONSE).
+
+Runs the application in-process with the FastAPI TestClient. The geoservices
+are mocked with the Jura fixture and the result cache is enabled, so the
+numbers are dominated by routing, the TestClient itself and response
+serialization. The serialization alone is measured too, against what FastAPI
+does with a response_model (validation, then serialization to bytes). Run
+from the repository root:
+
+    python benchmarks/json_response.py --seconds 5
+"""
+
+import argparse
+import asyncio
+import logging
+import sys
+import time
+import timeit
+from functools import partial
+from pathlib import Path
+
+import httpx
+import respx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from fastapi.routing import serialize_response
+from fastapi.testclient import TestClient
+from fastapi.utils import create_model_field
+
+from drillapi.app import app
+from drillapi.cantons_configuration import cantons
+from drillapi.config import settings
+from drillapi.models.models import (
+    GroundCategory,
+    ResultDetail,
+    SuitabilityFeature,
+)
+from drillapi.services import responses, security
+
+IDENTIFY_URL = "https://api3.geo.admin.ch/rest/services/ech/MapServer/identify"
+JU_WMS_URL = "https://geoservices.jura.ch/wms"
+POINT_URL = "/v1/drill-category/2574738/1249285"
+BULK_POINTS = [{"coord_x": 2574738 + 5 * i, "coord_y": 1249285} for i in range(200)]
+
+
+def requests_per_second(send, seconds: float) -> float:
+    send()  # fill the caches
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        send()
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def serialization():
+    """Microseconds per response, FastAPI response_model vs fast path."""
+    features = [
+        SuitabilityFeature(
+            coord_x=point["coord_x"],
+            coord_y=point["coord_y"],
+            canton="JU",
+            canton_config=cantons.CANTONS["cantons_configurations"]["JU"],
+            ground_category=GroundCategory(),
+            result_detail=ResultDetail(),
+        )
+        for point in BULK_POINTS
+    ]
+    loop = asyncio.new_event_loop()
+    for name, content, type_, fast in [
+        ("point", features[0], SuitabilityFeature, responses.feature_json),
+        ("bulk of 200", features, list[SuitabilityFeature], responses.features_json),
+    ]:
+        field = create_model_field(name="response", type_=type_, mode="serialization")
+
+        def standard(field=field, content=content):
+            return loop.run_until_complete(
+                serialize_response(
+                    field=field, response_content=content, dump_json=True
+                )
+            )
+
+        assert standard() == fast(content)
+        number = 2000 if name == "point" else 100
+        before = timeit.timeit(standard, number=number) / number * 1e6
+        after = timeit.timeit(partial(fast, content), number=number) / number * 1e6
+        print(
+            f"{name:12} before {before:8.1f} us      after {after:8.1f} us      "
+            f"x{before / after:.2f}"
+        )
+    loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--seconds", type=float, default=3.0, help="per scenario")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    settings.RESULT_CACHE = True
+    settings.WARMUP_ENABLED = False
+    security.limiter.enabled = False
+    client = TestClient(app)
+
+    def point():
+        assert client.get(POINT_URL).status_code == 200
+
+    def bulk():
+        response = client.post("/v1/drill-category/bulk", json={"points": BULK_POINTS})
+        assert response.status_code == 200
+
+    print("Serialization only")
+    serialization()
+
+    print("Requests per second, TestClient")
+    with respx.mock(assert_all_called=False) as mock:
+        mock.get(IDENTIFY_URL).mock(
+            return_value=httpx.Response(
+                200, json={"results": [{"attributes": {"ak": "JU"}}]}
+            )
+        )
+        mock.get(JU_WMS_URL).mock(
+            return_value=httpx.Response(
+                200,
+                content=(ROOT / "tests/data/wms/getfeatureinfo_ju.gml").read_bytes(),
+            )
+        )
+        mock.route(host="testserver").pass_through()
+
+        for name, send in [("point", point), ("bulk of 200", bulk)]:
+            results = {}
+            for fast in (False, True):
+                settings.FAST_JSON_RESPONSE = fast
+                results[fast] = requests_per_second(send, args.seconds)
+            print(
+                f"{name:12} before {results[False]:8.1f} req/s   "
+                f"after {results[True]:8.1f} req/s   "
+                f"x{results[True] / results[False]:.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
-from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-from .routes import drill_category, cantons, checker
+from .routes import drill_category, cantons, checker, bulk, metrics, admin, health
+from .routes import live
+from .routes import templating
+from .services import cache, change_detection, clients, offload, warmup
 from .services.security import limiter, rate_limit_handler, RateLimitExceeded
 from .config import settings
 import logging
@@ -23,14 +28,35 @@ for name in ["uvicorn", "uvicorn.error", "fastapi", "mangum"]:
     logger.propagate = True
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background_tasks = []
+    if settings.WARMUP_ENABLED:
+        background_tasks.append(asyncio.create_task(warmup.warm_up()))
+    else:
+        warmup.mark_ready()
+    if settings.RESULT_CACHE and settings.CHANGE_DETECTION_INTERVAL > 0:
+        background_tasks.append(
+            asyncio.create_task(
+                change_detection.run_periodically(settings.CHANGE_DETECTION_INTERVAL)
+            )
+        )
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await clients.aclose()
+    offload.shutdown()
+    cache.close_result_cache()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["GET"],
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
 )
 
@@ -38,17 +64,20 @@ app.add_middleware(
 app.include_router(drill_category.router)
 app.include_router(cantons.router)
 app.include_router(checker.router)
+app.include_router(bulk.router)
+app.include_router(live.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
+app.include_router(health.router)
 
 # Limiter
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, rate_limit_handler)
 
-templates = Jinja2Templates(directory=str(settings.TEMPLATES_DIR))
-
 
 @app.get("/")
 async def root(request: Request):
-    return templates.TemplateResponse(
+    return templating.get_templates().TemplateResponse(
         request,
         "index.html",
         {"docs_url": "/docs", "redoc_url": "/redoc"},
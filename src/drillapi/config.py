@@ -1,6 +1,6 @@
 from pathlib import Path
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from typing import List
+from typing import List, Literal
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -13,5 +13,134 @@ class Settings(BaseSettings):
     ALLOWED_ORIGINS: List[str] = ["http://localhost:5173"]
     ENVIRONMENT: str = "production"
 
+    # Connections to upstream geoservices, kept alive between requests
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    # Warm-up at startup: open connections to geo.admin.ch and cantonal hosts,
+    # /ready answers 200 once it is done or timed out
+    WARMUP_ENABLED: bool = True
+    WARMUP_TIMEOUT: float = 10.0
+    # Also query the first ground control point of each canton to prime caches
+    WARMUP_GROUND_CONTROL_POINTS: bool = False
+
+    # Canonical point URLs: coordinates snapped to a grid (meters), 0 to disable
+    CANONICAL_URL_SNAP: float = 0.0
+    # "redirect" (307 to the canonical URL) or "content-location" (answer directly)
+    CANONICAL_URL_MODE: Literal["redirect", "content-location"] = "redirect"
+    # Cache-Control max-age of point responses, no caching headers when not set
+    POINT_CACHE_MAX_AGE: int | None = None
+    # Serialize drill category responses directly to bytes, same output
+    FAST_JSON_RESPONSE: bool = True
+
+    # Geoservice responses larger than this are aborted while being read,
+    # "max_body_size" in a canton configuration overrides it
+    MAX_RESPONSE_BYTES: int = 10 * 1024 * 1024
+
+    # Executor for parsing and raster classification: inline on the event loop,
+    # in a thread pool, or in a process pool (bulk on several cores)
+    PARSE_EXECUTOR: Literal["inline", "thread", "process"] = "inline"
+    PARSE_EXECUTOR_WORKERS: int = 4
+    # Smaller payloads are parsed inline, the hand-off would cost more
+    PARSE_OFFLOAD_MIN_BYTES: int = 64 * 1024
+
+    # Cancel point lookups when the client disconnects, polled at this interval
+    CANCEL_ON_DISCONNECT: bool = False
+    DISCONNECT_POLL_INTERVAL: float = 0.1
+    # Header with a client session token, a newer request of the session
+    # cancels the previous one
+    SESSION_HEADER: str = "X-Session-Token"
+    # Live WebSocket route: time a position waits for a newer one before
+    # its lookup starts, bursts of mouse moves give a single lookup
+    LIVE_COALESCE_INTERVAL: float = 0.05
+    # Messages of all the live sockets of a client address count against
+    # RATE_LIMIT, the socket is closed (1008) past it. Open live sockets per
+    # process, further connections are closed (1013)
+    LIVE_MAX_CONNECTIONS: int = 200
+
+    # Outbound limits per upstream host: requests in flight and requests per
+    # second (token bucket of UPSTREAM_RATE_BURST), unlimited when not set.
+    # "max_concurrency", "max_rate" and "rate_burst" in a canton
+    # configuration override them for its host
+    UPSTREAM_MAX_CONCURRENCY: int | None = None
+    UPSTREAM_MAX_RATE: float | None = None
+    UPSTREAM_RATE_BURST: int = 10
+    # Concurrency per upstream host found at run time (AIMD): grows while the
+    # latency stays within TOLERANCE times the lowest seen, cut by BACKOFF on
+    # slow responses, timeouts, 429 and 5xx. The static concurrency above, or
+    # UPSTREAM_ADAPTIVE_MAX, caps it
+    UPSTREAM_ADAPTIVE: bool = False
+    UPSTREAM_ADAPTIVE_INITIAL: int = 4
+    UPSTREAM_ADAPTIVE_MAX: int = 64
+    UPSTREAM_ADAPTIVE_TOLERANCE: float = 2.0
+    UPSTREAM_ADAPTIVE_BACKOFF: float = 0.7
+    # Share of the concurrency of a host bulk, checker and change detection
+    # requests may hold, interactive requests waiting are served first. Lanes
+    # need a host limit (a concurrency, a rate or UPSTREAM_ADAPTIVE): with the
+    # defaults every request starts at once and nothing is prioritized
+    UPSTREAM_BACKGROUND_SHARE: float = 0.5
+
+    # Bulk classification (experimental)
+    BULK_MAX_POINTS: int = 1000
+    # Calls per client, separate from RATE_LIMIT: one call holds up to
+    # BULK_MAX_POINTS points
+    BULK_RATE_LIMIT: str = "10/minute"
+    BULK_CONCURRENCY: int = 10
+    BULK_RASTER_SAMPLING: bool = False
+    # Simplified canton polygons (GeoJSON, EPSG:2056, "ak" property) used to
+    # assign cantons to bulk points without calling geo.admin.ch
+    CANTON_BOUNDARIES_PATH: Path | None = None
+    CANTON_BORDER_TOLERANCE: float = 50.0
+
+    # Start the cantonal request with a guessed canton while geo.admin.ch identify runs
+    SPECULATIVE_FETCH: bool = False
+    CANTON_GRID_CELL_SIZE: float = 500.0
+    CANTON_GRID_MAX_CELLS: int = 100_000
+    # Skip geo.admin.ch identify inside cells whose four corners are in the same canton
+    CANTON_GRID_CACHE: bool = False
+    CANTON_GRID_CACHE_PATH: Path | None = None
+    CANTON_GRID_SAVE_INTERVAL: float = 60.0
+
+    # Cache of cantonal geoservice results, in memory and optionally in SQLite
+    RESULT_CACHE: bool = False
+    RESULT_CACHE_TTL: float = 86_400.0
+    # Grid (meters) points are snapped to before building the cache key
+    RESULT_CACHE_SNAP: float = 1.0
+    RESULT_CACHE_MEMORY_SIZE: int = 10_000
+    # SQLite file shared by the workers of a host, kept across restarts
+    RESULT_CACHE_PATH: Path | None = None
+    RESULT_CACHE_MAX_ENTRIES: int = 1_000_000
+    # Hash table in shared memory, shared by the uvicorn workers of a host
+    SHARED_MEMORY_CACHE: bool = False
+    SHARED_MEMORY_NAME: str = "drillapi"
+    SHARED_MEMORY_SLOTS: int = 16384
+    SHARED_MEMORY_SLOT_SIZE: int = 2048
+    RESULT_CACHE_COMPACT_INTERVAL: float = 300.0
+    RESULT_CACHE_IDENTIFY_TTL: float = 604_800.0
+    # Time entries are kept past their TTL, served when the geoservice fails
+    RESULT_CACHE_STALE_TTL: float = 0.0
+    # Serve entries past their TTL at once and refresh them in the background
+    RESULT_CACHE_STALE_WHILE_REVALIDATE: bool = False
+    # Time a node waits for another node already fetching the same point
+    RESULT_CACHE_LOCK_TIMEOUT: float = 10.0
+    # HTTP cache (RFC 9111) of upstream geoservice responses, by full URL
+    HTTP_CACHE: bool = False
+    HTTP_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+
+    # Interval (seconds) of the check of cantonal data updates, 0 to disable
+    CHANGE_DETECTION_INTERVAL: float = 0.0
+    # Cached points fetched again per canton and check
+    CHANGE_DETECTION_SAMPLES: int = 3
+    # Bearer token of the /v1/admin routes, disabled when not set
+    ADMIN_TOKEN: str | None = None
+
+    # Shared tier on a Redis protocol server, redis://[:password@]host[:port][/db]
+    REDIS_URL: str | None = None
+    REDIS_TIMEOUT: float = 0.5
+    # Time the Redis tier is skipped after a connection error
+    REDIS_RETRY_INTERVAL: float = 30.0
+    # Time the purge generation read from the Redis tier is reused, the delay
+    # before a purge on another node clears the local tiers
+    REDIS_GENERATION_INTERVAL: float = 1.0
+
 
 settings = Settings()
@@ -1,5 +1,50 @@
-from .app import app
+"""
+AWS Lambda entrypoint.
+
+The module is imported once per execution environment and kept across warm
+invocations, together with the event loop, the shared HTTP clients and the
+in-memory caches. The ASGI lifespan is therefore not run per invocation (it
+would close the clients every time), and scheduled warm-up pings are answered
+without going through the ASGI stack.
+"""
+
+import asyncio
+import logging
+
 from mangum import Mangum
 
-# Lambda entrypoint
-handler = Mangum(app)
+from .app import app
+from .services import warmup
+
+logger = logging.getLogger(__name__)
+
+asgi_handler = Mangum(app, lifespan="off")
+
+
+def is_warmup_event(event) -> bool:
+    """EventBridge scheduled events and ``{"warmup": true}`` test events."""
+    return isinstance(event, dict) and (
+        event.get("source") == "aws.events" or event.get("warmup") is True
+    )
+
+
+def _event_loop():
+    """Loop kept across invocations, Mangum runs the ASGI app on it too."""
+    try:
+        return asyncio.get_event_loop()
+    except RuntimeError:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        return loop
+
+
+def handler(event, context):
+    loop = _event_loop()
+    if is_warmup_event(event):
+        # The first ping of an execution environment opens the upstream
+        # connections, later pings only keep it from being reclaimed
+        if not warmup.state["ready"]:
+            loop.run_until_complete(warmup.warm_up())
+        logger.debug("Warm-up ping, %d hosts", len(warmup.state["hosts"]))
+        return {"warm": True, "hosts": warmup.state["hosts"]}
+    return asgi_handler(event, context)
@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from datetime import datetime
+from pydantic import BaseModel, Field
 from typing import Optional, List, Literal
 from enum import IntEnum
 
@@ -30,6 +31,19 @@ class ResultDetail(BaseModel):
     message: str = ""
     full_url: Optional[str] = ""
     detail: Optional[str] = ""
+    # Served from the cache past its TTL (geoservice unavailable or refreshing)
+    stale: bool = False
+    cached_at: datetime | None = None
+    # Layer that reached the highest category, the other layers were not awaited
+    deciding_layer: str | None = None
+
+
+# Result of one canton when a point lies on a canton border
+class CantonContribution(BaseModel):
+    canton: str
+    harmonized_value: GroundSuitability
+    source_values: str = ""
+    full_url: str | None = ""
 
 
 class SuitabilityFeature(BaseModel):
@@ -39,6 +53,17 @@ class SuitabilityFeature(BaseModel):
     canton_config: Optional[dict] = None
     ground_category: GroundCategory
     result_detail: ResultDetail
+    canton_contributions: list[CantonContribution] = []
+
+
+# For bulk classification only
+class Coordinate(BaseModel):
+    coord_x: float = Field(..., gt=2400000, le=2900000)
+    coord_y: float = Field(..., gt=1070000, le=1300000)
+
+
+class BulkRequest(BaseModel):
+    points: list[Coordinate]
 
 
 # For checker only
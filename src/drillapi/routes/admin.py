@@ -0,0 +1,57 @@
+import secrets
+
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+
+from ..config import settings
+from ..services import change_detection, security
+
+router = APIRouter()
+
+
+def check_admin_token(authorization: str | None):
+    """
+    Admin routes need `Authorization: Bearer <ADMIN_TOKEN>`, and do not
+    exist when ADMIN_TOKEN is not set.
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(404, "Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(
+        token.encode("utf-8"), settings.ADMIN_TOKEN.encode("utf-8")
+    ):
+        raise HTTPException(401, "Invalid admin token")
+
+
+@router.delete(
+    "/v1/admin/cache",
+    summary="Purge cached results",
+    response_description="Number of cache entries removed",
+    include_in_schema=False,
+)
+@security.limiter.limit(settings.RATE_LIMIT)
+async def purge_cache(
+    request: Request,
+    canton: str | None = Query(
+        None, min_length=2, max_length=2, description="Canton code, e.g. 'JU'"
+    ),
+    config_version: str | None = Query(
+        None, alias="config-version", description="Canton configuration version"
+    ),
+    authorization: str | None = Header(None),
+):
+    """
+    Purge the cached results of a canton and/or a canton configuration
+    version, everything when neither is given.
+
+    **Returns:**
+    - `dict`: `removed`, the number of result cache entries removed
+
+    **Raises:**
+    - `HTTPException 401`: If the admin token is missing or wrong
+    - `HTTPException 404`: If ADMIN_TOKEN is not configured
+    """
+    check_admin_token(authorization)
+    removed = await change_detection.invalidate(
+        canton.upper() if canton else None, config_version
+    )
+    return {"removed": removed}
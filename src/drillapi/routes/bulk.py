@@ -0,0 +1,46 @@
+from fastapi import APIRouter, HTTPException, Query, Request
+
+from ..config import settings
+from ..models.models import BulkRequest, SuitabilityFeature
+from ..services import bulk, outbound, responses, security
+from ..services.error_handler import handle_errors
+
+router = APIRouter()
+
+
+@router.post(
+    "/v1/drill-category/bulk",
+    response_model=list[SuitabilityFeature],
+    summary="Get drill category for many points (experimental)",
+)
+@security.limiter.limit(settings.BULK_RATE_LIMIT)
+@handle_errors
+async def get_drill_category_bulk(
+    request: Request,
+    payload: BulkRequest,
+    exclude_inactive_cantons: bool = Query(
+        True,
+        alias="exclude-inactive-cantons",
+        description="If false, inactive cantons are also used.",
+    ),
+):
+    """
+    Return the drill category of every point of the request body, in the same order.
+
+    **Rate limit:** `BULK_RATE_LIMIT` calls, separate from the global `RATE_LIMIT`.
+
+    **Raises:**
+    - `HTTPException 413`: If more than `BULK_MAX_POINTS` points are sent
+    """
+    if len(payload.points) > settings.BULK_MAX_POINTS:
+        raise HTTPException(
+            413, f"Too many points, maximum is {settings.BULK_MAX_POINTS}"
+        )
+
+    points = [(point.coord_x, point.coord_y) for point in payload.points]
+    # Spare upstream capacity only, interactive lookups go first
+    with outbound.background():
+        features = await bulk.classify_points(points, exclude_inactive_cantons)
+    if settings.FAST_JSON_RESPONSE:
+        return responses.json_response(responses.features_json(features))
+    return features
@@ -1,18 +1,17 @@
 from fastapi import APIRouter, Request
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 import logging
-from ..services import security
+from ..services import cache, outbound, security
+from . import templating
 from ..routes.cantons import get_cantons_data
 from ..config import settings
 
-from ..routes.drill_category import get_drill_category
+from ..routes.drill_category import compute_drill_category
 from ..models.models import CheckerResult
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-templates = Jinja2Templates(directory=str(settings.TEMPLATES_DIR))
 
 
 @router.get("/checker/", response_class=HTMLResponse)
@@ -33,7 +32,7 @@ async def checker_page(request: Request, canton: str | None = None):
         if canton not in full_config:
             logger.info(f"CHECKER: No configuration for canton: {canton}")
 
-            return templates.TemplateResponse(
+            return templating.get_templates().TemplateResponse(
                 request,
                 "checker.html",
                 {
@@ -68,12 +67,14 @@ async def checker_page(request: Request, canton: str | None = None):
             try:
                 logger.info(f"CHECKER: getting drill category for : {x}/{y}")
 
-                feature = await get_drill_category(
-                    request=request,
-                    coord_x=x,
-                    coord_y=y,
-                    exclude_inactive_cantons=False,
-                )
+                # Spare upstream capacity only, interactive lookups go first.
+                # Checks the geoservices themselves, never cached or stale results
+                with outbound.background(), cache.uncached():
+                    feature = await compute_drill_category(
+                        coord_x=x,
+                        coord_y=y,
+                        exclude_inactive_cantons=False,
+                    )
 
                 calculated = (
                     feature.ground_category.harmonized_value
@@ -106,7 +107,7 @@ async def checker_page(request: Request, canton: str | None = None):
 
             results.append(result)
 
-    return templates.TemplateResponse(
+    return templating.get_templates().TemplateResponse(
         request,
         "checker.html",
         {
@@ -1,6 +1,19 @@
-from fastapi import APIRouter, Request, Query, Path
+import asyncio
+import hashlib
+import math
+
+from fastapi import APIRouter, Request, Response, Query, Path
+from fastapi.responses import RedirectResponse
 from drillapi.cantons_configuration import cantons
-from ..services import processing, security
+from ..services import (
+    cache,
+    cancellation,
+    canton_grid,
+    processing,
+    responses,
+    security,
+    speculative,
+)
 from ..services.error_handler import handle_errors
 from ..config import settings
 from ..models.models import (
@@ -14,6 +27,10 @@ import logging
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# LV95 coordinates accepted by the route, lower bound excluded
+X_BOUNDS = (2400000, 2900000)
+Y_BOUNDS = (1070000, 1300000)
+
 
 @router.get(
     "/v1/drill-category/{coord_x}/{coord_y}",
@@ -23,15 +40,68 @@ logger = logging.getLogger(__name__)
 @handle_errors
 async def get_drill_category(
     request: Request,
-    coord_x: float = Path(..., gt=2400000, le=2900000),
-    coord_y: float = Path(..., gt=1070000, le=1300000),
+    response: Response,
+    coord_x: float = Path(..., gt=X_BOUNDS[0], le=X_BOUNDS[1]),
+    coord_y: float = Path(..., gt=Y_BOUNDS[0], le=Y_BOUNDS[1]),
     exclude_inactive_cantons: bool = Query(
         True,
         alias="exclude-inactive-cantons",
         description="If false, inactive cantons are also used.",
     ),
 ):
-    """Return drill category at a given coordinate using WMS GetFeatureInfo or ESRI REST feature service."""
+    """
+    Return drill category at a given coordinate using WMS GetFeatureInfo or ESRI REST feature service.
+
+    **Raises:**
+    - `HTTPException 409`: If a newer request with the same session token
+      (`SESSION_HEADER`) was received before this one completed
+    """
+
+    # One URL per grid cell, so that edge caches share lookups of nearby clicks
+    if settings.CANONICAL_URL_SNAP > 0:
+        coord_x = _snap_within(coord_x, settings.CANONICAL_URL_SNAP, X_BOUNDS)
+        coord_y = _snap_within(coord_y, settings.CANONICAL_URL_SNAP, Y_BOUNDS)
+        canonical_url = _canonical_url(request, coord_x, coord_y)
+        if canonical_url != str(request.url):
+            if settings.CANONICAL_URL_MODE == "redirect":
+                # Temporary: the snap grid is a setting and may change
+                redirect = RedirectResponse(canonical_url, status_code=307)
+                if settings.POINT_CACHE_MAX_AGE is not None:
+                    redirect.headers["Cache-Control"] = (
+                        f"public, max-age={settings.POINT_CACHE_MAX_AGE}"
+                    )
+                return redirect
+            response.headers["Content-Location"] = canonical_url
+
+    # Abandoned requests do not keep awaiting the upstream geoservices
+    try:
+        suitability_feature = await cancellation.run_cancellable(
+            request,
+            compute_drill_category(coord_x, coord_y, exclude_inactive_cantons),
+            session=request.headers.get(settings.SESSION_HEADER),
+        )
+    except cancellation.ClientDisconnected:
+        # Nobody reads it, nginx convention for "client closed request"
+        return Response(status_code=499)
+
+    body = None
+    if settings.FAST_JSON_RESPONSE or settings.POINT_CACHE_MAX_AGE is not None:
+        body = responses.feature_json(suitability_feature)
+
+    if settings.POINT_CACHE_MAX_AGE is not None:
+        not_modified = _set_cache_headers(request, response, suitability_feature, body)
+        if not_modified is not None:
+            return not_modified
+
+    if settings.FAST_JSON_RESPONSE:
+        return responses.json_response(body, response.headers)
+    return suitability_feature
+
+
+async def compute_drill_category(
+    coord_x: float, coord_y: float, exclude_inactive_cantons: bool = True
+) -> SuitabilityFeature:
+    """Drill category at a coordinate, shared by the route and the checker."""
 
     # Default feature for selected coordinates
     suitability_feature = SuitabilityFeature(
@@ -41,8 +111,92 @@ async def get_drill_category(
         result_detail=ResultDetail(),
     )
 
+    # Speculatively start the cantonal request while the canton is being identified
+    speculation = speculative.start(coord_x, coord_y)
+    try:
+        return await _resolve_drill_category(
+            suitability_feature, speculation, exclude_inactive_cantons
+        )
+    finally:
+        speculative.cancel(speculation)
+
+
+def _snap_within(value: float, grid: float, bounds: tuple) -> float:
+    """Coordinate snapped to the grid point nearest to it within the bounds."""
+    low, high = bounds
+    snapped = cache.snap(value, grid)
+    if snapped <= low:
+        snapped = (math.floor(low / grid) + 1) * grid
+    elif snapped > high:
+        snapped = math.floor(high / grid) * grid
+    # Grid coarser than the bounds, left as is
+    return snapped if low < snapped <= high else value
+
+
+def _format_coordinate(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(round(value, 6))
+
+
+def _canonical_url(request: Request, coord_x: float, coord_y: float) -> str:
+    path = request.url.path.rsplit("/", 2)[0]
+    return str(
+        request.url.replace(
+            path=f"{path}/{_format_coordinate(coord_x)}/{_format_coordinate(coord_y)}"
+        )
+    )
+
+
+def _set_cache_headers(
+    request: Request,
+    response: Response,
+    suitability_feature: SuitabilityFeature,
+    body: bytes,
+):
+    """
+    Cache-Control, ETag and Vary headers for edge caches. The ETag combines the
+    canton config version with the content, a matching If-None-Match gets a 304
+    response, returned. Unavailable geoservices and stale results are not
+    cacheable.
+    """
+    if (
+        suitability_feature.ground_category.harmonized_value
+        == GroundSuitability.GEOSERVICE_UNAVAILABLE
+        or suitability_feature.result_detail.stale
+    ):
+        response.headers["Cache-Control"] = "no-store"
+        return None
+
+    version = (
+        cache.config_version(suitability_feature.canton_config)
+        if suitability_feature.canton_config
+        else "none"
+    )
+    body_hash = hashlib.sha256(body).hexdigest()[:16]
+    headers = {
+        "Cache-Control": f"public, max-age={settings.POINT_CACHE_MAX_AGE}",
+        "ETag": f'W/"{version}-{body_hash}"',
+        "Vary": "Accept-Encoding",
+    }
+    if "Content-Location" in response.headers:
+        headers["Content-Location"] = response.headers["Content-Location"]
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+async def _resolve_drill_category(
+    suitability_feature: SuitabilityFeature,
+    speculation,
+    exclude_inactive_cantons: bool,
+):
+    coord_x = suitability_feature.coord_x
+    coord_y = suitability_feature.coord_y
+
     # Determine canton from coordinates using GeoadminAPI
-    canton_result = await processing.get_canton_from_coordinates(coord_x, coord_y)
+    canton_result = await canton_grid.get_canton_from_coordinates(coord_x, coord_y)
 
     if not canton_result:
         message = (
@@ -50,11 +204,46 @@ async def get_drill_category(
         )
         logger.warning(message)
         # Not in Switzerland
-        suitability_feature.ground_category.harmonized_value = 6
+        suitability_feature.ground_category.harmonized_value = (
+            GroundSuitability.NOT_IN_SWITZERLAND
+        )
         suitability_feature.result_detail.message = message
         return suitability_feature
 
-    code_canton = canton_result[0]["attributes"]["ak"]
+    # Points on a canton border are returned in every neighbouring canton
+    codes = list(dict.fromkeys(r["attributes"]["ak"] for r in canton_result))
+    speculation = speculative.confirm(speculation, codes)
+
+    if len(codes) == 1:
+        speculative.observe(coord_x, coord_y, codes[0])
+        return await _get_drill_category_in_canton(
+            suitability_feature, codes[0], speculation, exclude_inactive_cantons
+        )
+
+    # Evaluate all the cantons concurrently, the most restrictive result wins
+    logger.info("Coordinates (%s, %s) on border of %s", coord_x, coord_y, codes)
+    canton_features = await asyncio.gather(
+        *(
+            _get_drill_category_in_canton(
+                suitability_feature.model_copy(deep=True),
+                code_canton,
+                speculation,
+                exclude_inactive_cantons,
+            )
+            for code_canton in codes
+        )
+    )
+    return processing.combine_canton_features(canton_features)
+
+
+async def _get_drill_category_in_canton(
+    suitability_feature: SuitabilityFeature,
+    code_canton: str,
+    speculation,
+    exclude_inactive_cantons: bool,
+):
+    coord_x = suitability_feature.coord_x
+    coord_y = suitability_feature.coord_y
     canton_config = cantons.CANTONS["cantons_configurations"].get(code_canton)
 
     suitability_feature.canton = code_canton
@@ -65,7 +254,7 @@ async def get_drill_category(
 
     # Exclude inactive or missing cantons
     # Inactive cantons are activated when called from checker in order to help debug network issues
-    if exclude_inactive_cantons and (is_missing_config or not is_active):
+    if is_missing_config or (exclude_inactive_cantons and not is_active):
         logger.warning(
             "No configuration for canton %s at (%s, %s) or inactive canton",
             code_canton,
@@ -73,38 +262,15 @@ async def get_drill_category(
             coord_y,
         )
 
-        suitability_feature.ground_category.harmonized_value = 5
-        suitability_feature.result_detail.message = "Canton not active or not existing"
-        return suitability_feature
-
-    # Fetch features (WMS or ESRI REST) from external geoservices and process into feature
-    result = await processing.fetch_features_for_point(coord_x, coord_y, canton_config)
-
-    # Handle external geoservice unavailability
-    if result.get("geoservice_unavailable"):
         suitability_feature.ground_category.harmonized_value = (
-            GroundSuitability.GEOSERVICE_UNAVAILABLE
-        )
-        suitability_feature.ground_category.source_values = "geoservice unavailable"
-        # Keep canton_config so the frontend can access cantonal_energy_service_url
-        suitability_feature.result_detail = ResultDetail(
-            message="External geoservice unavailable",
-            full_url=result.get("full_url", ""),
-            detail=result.get("error"),
+            GroundSuitability.NOT_AVAILABLE
         )
+        suitability_feature.result_detail.message = "Canton not active or not existing"
         return suitability_feature
 
-    # Feature(s) found, process to reclassification
-    processed_ground_category = processing.process_ground_category(
-        result["features"],
-        canton_config["layers"],
+    # Fetch features (WMS or ESRI REST) from external geoservices and process into feature
+    result = await speculative.fetch_features_for_point(
+        speculation, coord_x, coord_y, code_canton, canton_config
     )
 
-    # Fill the model with full data - all process worked for this location
-    suitability_feature.ground_category = processed_ground_category
-    suitability_feature.result_detail = ResultDetail(
-        message="Success",
-        full_url=result["full_url"],
-        detail=result["error"],
-    )
-    return suitability_feature
+    return processing.apply_fetch_result(suitability_feature, result, canton_config)
@@ -0,0 +1,23 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from ..services import warmup
+
+router = APIRouter()
+
+
+@router.get(
+    "/ready",
+    summary="Readiness of this worker",
+    response_description="Warm-up outcome",
+)
+async def get_ready():
+    """
+    Readiness probe for load balancers: answers once the startup warm-up
+    is done or timed out.
+
+    **Returns:**
+    - `dict`: `ready`, `timed_out`, `duration` (seconds) and the warm-up
+      outcome per upstream host, with status 200 when ready, 503 otherwise
+    """
+    return JSONResponse(warmup.state, status_code=200 if warmup.state["ready"] else 503)
@@ -0,0 +1,130 @@
+"""
+Live drill category over a WebSocket, for hover and click in map frontends.
+
+The client sends positions, ``{"coord_x": ..., "coord_y": ...}`` in EPSG:2056,
+and receives the SuitabilityFeature of the positions it did not supersede.
+Only the latest position matters: a lookup starts once no newer position came
+in for LIVE_COALESCE_INTERVAL seconds, and a lookup still running when a newer
+position arrives is cancelled. Lookups share the upstream connections and the
+caches of the HTTP routes.
+
+Messages count against RATE_LIMIT per client address like HTTP requests, the
+socket is closed with 1008 (policy violation) past it. At most
+LIVE_MAX_CONNECTIONS sockets are open per process, others are closed with 1013
+(try again later).
+"""
+
+import asyncio
+import logging
+
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect, status
+from pydantic import ValidationError
+
+from ..config import settings
+from ..models.models import Coordinate
+from ..services import metrics, responses, security
+from .drill_category import compute_drill_category
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Live sockets open in this process
+_connections = 0
+# Bound at import, like the limits of the HTTP routes
+MESSAGE_RATE_LIMIT = settings.RATE_LIMIT
+
+
+async def _lookup(position: Coordinate, exclude_inactive_cantons: bool):
+    # Cancelled while sleeping when the client moves on
+    if settings.LIVE_COALESCE_INTERVAL > 0:
+        await asyncio.sleep(settings.LIVE_COALESCE_INTERVAL)
+    return await compute_drill_category(
+        position.coord_x, position.coord_y, exclude_inactive_cantons
+    )
+
+
+@router.websocket("/v1/drill-category/live")
+async def drill_category_live(
+    websocket: WebSocket,
+    exclude_inactive_cantons: bool = Query(
+        True,
+        alias="exclude-inactive-cantons",
+        description="If false, inactive cantons are also used.",
+    ),
+):
+    """
+    Stream of drill categories, one SuitabilityFeature message per position
+    looked up. Invalid messages are answered with ``{"detail": ...}``.
+    """
+    global _connections
+    if _connections >= settings.LIVE_MAX_CONNECTIONS:
+        metrics.increment("live.rejected")
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        return
+
+    await websocket.accept()
+    _connections += 1
+    metrics.increment("live.connections")
+    loop = asyncio.get_running_loop()
+    receive = asyncio.ensure_future(websocket.receive_text())
+    lookup = None
+    lookup_started = 0.0
+
+    try:
+        while True:
+            waiting = {receive} if lookup is None else {receive, lookup}
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if lookup in done:
+                try:
+                    feature = lookup.result()
+                except Exception:
+                    logger.exception("Live lookup failed")
+                    await websocket.send_json({"detail": "Internal server error"})
+                else:
+                    await websocket.send_text(
+                        responses.feature_json(feature).decode("utf-8")
+                    )
+                lookup = None
+
+            if receive in done:
+                # Raises WebSocketDisconnect when the client is gone
+                text = receive.result()
+                if not security.hit(websocket, MESSAGE_RATE_LIMIT, "live"):
+                    metrics.increment("live.rate_limited")
+                    await websocket.close(
+                        code=status.WS_1008_POLICY_VIOLATION,
+                        reason="Rate limit exceeded",
+                    )
+                    break
+                receive = asyncio.ensure_future(websocket.receive_text())
+                try:
+                    position = Coordinate.model_validate_json(text)
+                except ValidationError:
+                    await websocket.send_json(
+                        {
+                            "detail": "Invalid position, expected "
+                            '{"coord_x": <x>, "coord_y": <y>} in EPSG:2056'
+                        }
+                    )
+                    continue
+
+                metrics.increment("live.positions")
+                if lookup is not None:
+                    lookup.cancel()
+                    if loop.time() - lookup_started < settings.LIVE_COALESCE_INTERVAL:
+                        metrics.increment("live.coalesced")
+                    else:
+                        metrics.increment("live.superseded")
+                lookup = asyncio.ensure_future(
+                    _lookup(position, exclude_inactive_cantons)
+                )
+                lookup_started = loop.time()
+    except WebSocketDisconnect:
+        logger.debug("Live client disconnected")
+    finally:
+        _connections -= 1
+        receive.cancel()
+        if lookup is not None:
+            lookup.cancel()
@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Request
+
+from ..config import settings
+from ..services import metrics, security
+
+router = APIRouter()
+
+
+@router.get(
+    "/v1/metrics",
+    summary="Get internal metrics of this worker",
+    response_description="Counters, timings and gauges",
+)
+@security.limiter.limit(settings.RATE_LIMIT)
+async def get_metrics(request: Request):
+    """
+    Retrieve the in-process metrics of the worker that answers the request
+    (cache hit rates, upstream timings, ...).
+
+    **Returns:**
+    - `dict`: `counters`, `timings` (seconds) and `gauges`
+    """
+    return metrics.snapshot()
@@ -0,0 +1,17 @@
+"""
+HTML templates, created on first use.
+
+Jinja2 is only needed by the home page and the checker, loading it lazily
+keeps it out of the cold start of the JSON API.
+"""
+
+import functools
+
+from ..config import settings
+
+
+@functools.cache
+def get_templates():
+    from fastapi.templating import Jinja2Templates
+
+    return Jinja2Templates(directory=str(settings.TEMPLATES_DIR))
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+
+from drillapi.cantons_configuration import cantons
+
+from ..config import settings
+from ..models.models import (
+    GroundCategory,
+    GroundSuitability,
+    ResultDetail,
+    SuitabilityFeature,
+)
+from . import cache, canton_grid, processing
+
+logger = logging.getLogger(__name__)
+
+
+async def identify_cantons(points: list, semaphore: asyncio.Semaphore) -> list:
+    """
+    Canton code (or None outside Switzerland) for each point.
+
+    When canton polygons are configured, points are assigned locally and only
+    the ones close to a canton border are sent to geo.admin.ch.
+    """
+    codes = [None] * len(points)
+    to_identify = range(len(points))
+
+    if settings.CANTON_BOUNDARIES_PATH:
+        # Only imported when needed: numpy is optional ("bulk" extra)
+        from .canton_assignment import load_canton_assigner
+
+        assigner = load_canton_assigner(
+            str(settings.CANTON_BOUNDARIES_PATH), settings.CANTON_BORDER_TOLERANCE
+        )
+        assigned, ambiguous = assigner.assign(
+            [p[0] for p in points], [p[1] for p in points]
+        )
+        codes = [code or None for code in assigned.tolist()]
+        to_identify = ambiguous.nonzero()[0].tolist()
+        logger.info(
+            "BULK: %d/%d points need geo.admin.ch identify",
+            len(to_identify),
+            len(points),
+        )
+
+    await cache.prefetch_cantons([points[i] for i in to_identify])
+
+    async def _identify(index):
+        coord_x, coord_y = points[index]
+        async with semaphore:
+            canton_result = await canton_grid.get_canton_from_coordinates(
+                coord_x, coord_y
+            )
+        codes[index] = canton_result[0]["attributes"]["ak"] if canton_result else None
+
+    await asyncio.gather(*(_identify(i) for i in to_identify))
+    return codes
+
+
+async def classify_canton_points(
+    points: list, features: list, canton_config: dict, semaphore: asyncio.Semaphore
+):
+    """
+    Classify points that all belong to the same canton, filling `features` in place.
+    """
+    if settings.BULK_RASTER_SAMPLING and canton_config.get("raster_sampling"):
+        # Only imported when needed: numpy and Pillow are optional ("bulk" extra)
+        from . import raster
+
+        await raster.classify_points_raster(points, canton_config, features)
+        return
+
+    await cache.prefetch_features(points, canton_config)
+
+    async def _fetch(point, feature):
+        async with semaphore:
+            result = await cache.fetch_features_for_point(
+                point[0], point[1], canton_config
+            )
+        processing.apply_fetch_result(feature, result, canton_config)
+
+    await asyncio.gather(*(_fetch(p, f) for p, f in zip(points, features)))
+
+
+async def classify_points(points: list, exclude_inactive_cantons: bool = True):
+    """
+    Drill category for a list of (coord_x, coord_y) points.
+
+    Points are grouped by canton so that cantons configured for raster sampling
+    can be answered with a few GetMap images instead of one request per point.
+    """
+    semaphore = asyncio.Semaphore(settings.BULK_CONCURRENCY)
+
+    features = [
+        SuitabilityFeature(
+            coord_x=coord_x,
+            coord_y=coord_y,
+            ground_category=GroundCategory(),
+            result_detail=ResultDetail(),
+        )
+        for coord_x, coord_y in points
+    ]
+
+    codes = await identify_cantons(points, semaphore)
+
+    groups = {}
+    for index, code_canton in enumerate(codes):
+        feature = features[index]
+
+        if code_canton is None:
+            # Not in Switzerland
+            feature.ground_category.harmonized_value = (
+                GroundSuitability.NOT_IN_SWITZERLAND
+            )
+            feature.result_detail.message = (
+                "No canton found for coordinates using GeoadminAPI"
+            )
+            continue
+
+        canton_config = cantons.CANTONS["cantons_configurations"].get(code_canton)
+        feature.canton = code_canton
+        feature.canton_config = canton_config
+
+        is_active = canton_config.get("active", False) if canton_config else False
+        if canton_config is None or (exclude_inactive_cantons and not is_active):
+            feature.ground_category.harmonized_value = GroundSuitability.NOT_AVAILABLE
+            feature.result_detail.message = "Canton not active or not existing"
+            continue
+
+        groups.setdefault(code_canton, []).append(index)
+
+    logger.info("BULK: %d points in %d cantons", len(points), len(groups))
+
+    await asyncio.gather(
+        *(
+            classify_canton_points(
+                [points[i] for i in indexes],
+                [features[i] for i in indexes],
+                cantons.CANTONS["cantons_configurations"][code_canton],
+                semaphore,
+            )
+            for code_canton, indexes in groups.items()
+        )
+    )
+    return features
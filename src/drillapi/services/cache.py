@@ -0,0 +1,685 @@
+"""
+Result cache for cantonal geoservice lookups.
+
+Entries are keyed on (canton, canton config version, snapped coordinate), so a
+configuration change never serves results computed with the old mapping.
+The cache is made of tiers, looked up in order and back-filled on hit:
+
+- MemoryCache: per process LRU, the fastest
+- SharedMemoryCache: a hash table in shared memory, read and written by all
+  the uvicorn workers of a host (see shared_cache.py)
+- SQLiteCache: one WAL-mode database file shared by all the workers of a
+  host and kept across restarts, with TTL based background compaction and
+  a maximum number of entries
+- RedisCache: a server speaking the Redis protocol, shared by all the nodes
+  (see redis_cache.py)
+
+A purge increments a generation counter kept in the shared tiers. The memory
+tier and the HTTP cache compare it on each read (the Redis one is re-read at
+most every REDIS_GENERATION_INTERVAL seconds) and are cleared when another
+worker purged, so a purge reaches every worker.
+
+Misses are fetched once per process, and once per cluster when a shared tier
+provides in-flight locks.
+
+Only successful upstream results are cached, geoservice errors never are.
+Entries can be kept past their TTL (RESULT_CACHE_STALE_TTL) to be served,
+marked stale, while they are refreshed or when the geoservice fails.
+Harmonized values are recomputed from the cached features on each request.
+Lookups within `uncached()` (the checker) always reach the geoservices.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+
+from ..config import settings
+from . import http_cache, metrics, outbound, processing
+
+logger = logging.getLogger(__name__)
+
+
+# CACHE KEYS
+_config_versions = {}
+
+
+def config_version(canton_config: dict) -> str:
+    """
+    Short hash of a canton configuration, changes whenever the configuration does.
+    """
+    cached = _config_versions.get(id(canton_config))
+    if cached is not None and cached[0] is canton_config:
+        return cached[1]
+    dump = json.dumps(canton_config, sort_keys=True, default=str)
+    version = hashlib.sha256(dump.encode("utf-8")).hexdigest()[:12]
+    _config_versions[id(canton_config)] = (canton_config, version)
+    return version
+
+
+def snap(value: float, grid: float) -> float:
+    """Snap a coordinate to a grid of `grid` meters."""
+    if grid <= 0:
+        return value
+    return round(value / grid) * grid
+
+
+def cache_key(namespace: str, canton: str, version: str, coord_x, coord_y) -> str:
+    grid = settings.RESULT_CACHE_SNAP
+    return (
+        f"{namespace}:{canton}:{version}:"
+        f"{snap(coord_x, grid):.2f}:{snap(coord_y, grid):.2f}"
+    )
+
+
+# TIERS
+class MemoryCache:
+    """In-process LRU cache with per entry expiry."""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+
+    async def get(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires, _, _ = entry
+        if expires < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def get_many(self, keys: list) -> dict:
+        values = {}
+        for key in keys:
+            value = await self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    async def set(self, key, value, ttl: float, canton: str, version: str):
+        self.entries[key] = (value, time.time() + ttl, canton, version)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def purge(self, canton: str | None = None, version: str | None = None) -> int:
+        keys = [
+            key
+            for key, (_, _, entry_canton, entry_version) in self.entries.items()
+            if (canton is None or entry_canton == canton)
+            and (version is None or entry_version == version)
+        ]
+        for key in keys:
+            del self.entries[key]
+        return len(keys)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class SQLiteCache:
+    """
+    SQLite cache shared by the processes of a host.
+
+    Reads, writes and compaction run in worker threads: WAL readers never
+    wait for writers, but a read can still wait for the disk.
+    """
+
+    name = "sqlite"
+
+    def __init__(
+        self,
+        path,
+        max_entries: int = 1_000_000,
+        compact_interval: float = 300.0,
+    ):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.compact_interval = compact_interval
+        self._local = threading.local()
+        self._last_compaction = time.monotonic()
+        self._compaction = None
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                canton TEXT NOT NULL,
+                config_version TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+            """
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_canton ON entries (canton, config_version)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires)"
+        )
+        # Purge generation, a single row
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS purges (generation INTEGER NOT NULL)"
+        )
+        connection.execute(
+            "INSERT INTO purges SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM purges)"
+        )
+        connection.commit()
+
+    def _connection(self):
+        """One connection per thread, sqlite3 connections cannot be shared."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            import sqlite3
+
+            connection = sqlite3.connect(self.path, timeout=5.0)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    async def get(self, key: str):
+        return await asyncio.to_thread(self._read, key)
+
+    def _read(self, key: str):
+        row = (
+            self._connection()
+            .execute("SELECT value, expires FROM entries WHERE key = ?", (key,))
+            .fetchone()
+        )
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    async def get_many(self, keys: list) -> dict:
+        return await asyncio.to_thread(self._read_many, keys)
+
+    def _read_many(self, keys: list) -> dict:
+        values = {}
+        now = time.time()
+        # Below the SQLite limit of host parameters
+        for start in range(0, len(keys), 500):
+            chunk = keys[start : start + 500]
+            rows = (
+                self._connection()
+                .execute(
+                    "SELECT key, value FROM entries WHERE expires >= ? AND key IN "
+                    f"({', '.join('?' * len(chunk))})",
+                    (now, *chunk),
+                )
+                .fetchall()
+            )
+            values.update((key, json.loads(value)) for key, value in rows)
+        return values
+
+    async def set(self, key, value, ttl: float, canton: str, version: str):
+        now = time.time()
+        await asyncio.to_thread(
+            self._write,
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+            (key, canton, version, json.dumps(value), now + ttl, now),
+        )
+        self._schedule_compaction()
+
+    async def purge(self, canton: str | None = None, version: str | None = None) -> int:
+        clauses = []
+        params = []
+        if canton is not None:
+            clauses.append("canton = ?")
+            params.append(canton)
+        if version is not None:
+            clauses.append("config_version = ?")
+            params.append(version)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return await asyncio.to_thread(
+            self._write, f"DELETE FROM entries{where}", tuple(params)
+        )
+
+    async def generation(self) -> int:
+        return await asyncio.to_thread(self._read_generation)
+
+    def _read_generation(self) -> int:
+        query = "SELECT generation FROM purges"
+        return self._connection().execute(query).fetchone()[0]
+
+    async def bump_generation(self):
+        await asyncio.to_thread(
+            self._write, "UPDATE purges SET generation = generation + 1", ()
+        )
+
+    def _write(self, query: str, params: tuple) -> int:
+        connection = self._connection()
+        with connection:
+            return connection.execute(query, params).rowcount
+
+    def _schedule_compaction(self):
+        if time.monotonic() - self._last_compaction < self.compact_interval:
+            return
+        if self._compaction is not None and not self._compaction.done():
+            return
+        self._last_compaction = time.monotonic()
+        self._compaction = asyncio.create_task(asyncio.to_thread(self.compact))
+
+    def compact(self) -> int:
+        """Delete expired entries, then the oldest ones above max_entries."""
+        connection = self._connection()
+        with connection:
+            removed = connection.execute(
+                "DELETE FROM entries WHERE expires < ?", (time.time(),)
+            ).rowcount
+            removed += connection.execute(
+                """
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entries ORDER BY updated DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            ).rowcount
+        if removed:
+            logger.info("Result cache compaction removed %d entries", removed)
+        return removed
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+def _remaining(value, ttl: float) -> float:
+    """
+    Seconds left before an entry stored for `ttl` seconds expires. Entries
+    carry their storage time, a hit copied to a faster tier keeps its expiry.
+    """
+    stored_at = value.get("stored_at") if isinstance(value, dict) else None
+    if stored_at is None:
+        return ttl
+    return stored_at + ttl - time.time()
+
+
+class TieredCache:
+    """Look up tiers in order, back-fill the faster tiers on hit."""
+
+    def __init__(self, tiers: list):
+        self.tiers = tiers
+        # Tiers shared with the other workers keep the purge generation
+        self.shared = [tier for tier in tiers if hasattr(tier, "generation")]
+        self.local = [tier for tier in tiers if isinstance(tier, MemoryCache)]
+        self._generation = None
+
+    async def generation(self) -> tuple:
+        """Purge generation of the shared tiers, empty without any."""
+        return tuple([await tier.generation() for tier in self.shared])
+
+    async def _check_generation(self):
+        """Clear the local tiers when another worker purged since the last read."""
+        if not self.shared:
+            return
+        generation = await self.generation()
+        if self._generation is not None and generation != self._generation:
+            metrics.increment("result_cache.purged_elsewhere")
+            for tier in self.local:
+                tier.clear()
+        self._generation = generation
+
+    async def _backfill(
+        self, index: int, key: str, value, ttl: float, canton: str, version: str
+    ):
+        remaining = _remaining(value, ttl)
+        if remaining <= 0:
+            return
+        for upper in self.tiers[:index]:
+            await upper.set(key, value, remaining, canton, version)
+
+    async def get(self, key: str, ttl: float, canton: str, version: str):
+        await self._check_generation()
+        for index, tier in enumerate(self.tiers):
+            value = await tier.get(key)
+            if value is not None:
+                metrics.increment(f"result_cache.hit.{tier.name}")
+                await self._backfill(index, key, value, ttl, canton, version)
+                return value
+        metrics.increment("result_cache.miss")
+        return None
+
+    async def get_many(self, keys: list, ttl: float, canton: str, version: str):
+        """Values found for `keys`, one round trip per tier."""
+        await self._check_generation()
+        found = {}
+        missing = list(keys)
+        for index, tier in enumerate(self.tiers):
+            if not missing:
+                break
+            values = await tier.get_many(missing)
+            for key, value in values.items():
+                found[key] = value
+                await self._backfill(index, key, value, ttl, canton, version)
+            missing = [key for key in missing if key not in values]
+        return found
+
+    async def set(self, key, value, ttl: float, canton: str, version: str):
+        for tier in self.tiers:
+            await tier.set(key, value, ttl, canton, version)
+
+    async def purge(self, canton: str | None = None, version: str | None = None) -> int:
+        await self._check_generation()
+        removed = 0
+        for tier in self.tiers:
+            removed += await tier.purge(canton, version)
+        if self.shared:
+            for tier in self.shared:
+                await tier.bump_generation()
+            self._generation = await self.generation()
+        return removed
+
+    async def lock(self, key: str, ttl: float) -> bool:
+        """
+        Take the in-flight lock of a key on the shared tiers. False when another
+        node is already fetching it.
+        """
+        for tier in self.tiers:
+            if hasattr(tier, "lock") and not await tier.lock(key, ttl):
+                return False
+        return True
+
+    async def locked(self, key: str) -> bool:
+        """Whether another node holds the in-flight lock of a key."""
+        for tier in self.tiers:
+            if hasattr(tier, "locked") and await tier.locked(key):
+                return True
+        return False
+
+    async def unlock(self, key: str):
+        for tier in self.tiers:
+            if hasattr(tier, "unlock"):
+                await tier.unlock(key)
+
+
+_result_cache = None
+
+
+def get_result_cache() -> TieredCache:
+    """Result cache built from the settings on first use."""
+    global _result_cache
+    if _result_cache is None:
+        tiers = [MemoryCache(settings.RESULT_CACHE_MEMORY_SIZE)]
+        if settings.SHARED_MEMORY_CACHE:
+            from drillapi.cantons_configuration import cantons
+
+            from .shared_cache import SharedMemoryCache
+
+            try:
+                tiers.append(
+                    SharedMemoryCache(
+                        settings.SHARED_MEMORY_NAME,
+                        cantons.CANTONS,
+                        settings.SHARED_MEMORY_SLOTS,
+                        settings.SHARED_MEMORY_SLOT_SIZE,
+                    )
+                )
+            except (OSError, ValueError) as e:
+                logger.warning("Shared memory cache disabled: %s", e)
+        if settings.RESULT_CACHE_PATH:
+            tiers.append(
+                SQLiteCache(
+                    settings.RESULT_CACHE_PATH,
+                    settings.RESULT_CACHE_MAX_ENTRIES,
+                    settings.RESULT_CACHE_COMPACT_INTERVAL,
+                )
+            )
+        if settings.REDIS_URL:
+            from .redis_cache import RedisCache
+
+            tiers.append(
+                RedisCache(
+                    settings.REDIS_URL,
+                    settings.REDIS_TIMEOUT,
+                    settings.REDIS_RETRY_INTERVAL,
+                    generation_interval=settings.REDIS_GENERATION_INTERVAL,
+                )
+            )
+        _result_cache = TieredCache(tiers)
+    return _result_cache
+
+
+async def purge_generation() -> tuple:
+    """Purge generation of the result cache, checked by the HTTP cache."""
+    return await get_result_cache().generation()
+
+
+http_cache.response_store.generation_source = purge_generation
+
+
+def close_result_cache():
+    """Release the cache tiers (application shutdown)."""
+    global _result_cache
+    if _result_cache is not None:
+        for tier in _result_cache.tiers:
+            if hasattr(tier, "close"):
+                tier.close()
+    _result_cache = None
+
+
+def reset_result_cache():
+    """Forget the cache instance, rebuilt from the settings on next use."""
+    global _result_cache
+    _result_cache = None
+
+
+# CACHED LOOKUPS
+# Entries are stored as {"stored_at": timestamp, "result": ...} and kept
+# RESULT_CACHE_STALE_TTL seconds past their TTL to be served stale
+_in_flight = {}
+_background_tasks = set()
+# Recently fetched points per canton, sampled by change detection
+_recent_points = defaultdict(lambda: deque(maxlen=1000))
+
+
+# Set by `uncached`, lookups of the current task skip the result and HTTP caches
+bypass = http_cache.bypass
+
+
+@contextmanager
+def uncached():
+    """
+    Fetch the lookups of the block from the geoservices: neither the result
+    cache nor the HTTP cache is read or written and no stale result is served.
+    """
+    token = bypass.set(True)
+    try:
+        yield
+    finally:
+        bypass.reset(token)
+
+
+def recent_points(canton: str) -> list:
+    return list(_recent_points[canton])
+
+
+def _lifetime(ttl: float) -> float:
+    return ttl + settings.RESULT_CACHE_STALE_TTL
+
+
+def _is_fresh(entry: dict, ttl: float) -> bool:
+    return time.time() - entry["stored_at"] <= ttl
+
+
+def _stale_result(entry: dict):
+    """Result of an entry past its TTL, marked as such when it is a dict."""
+    result = entry["result"]
+    if isinstance(result, dict):
+        result = {**result, "stale": True, "cached_at": entry["stored_at"]}
+    return result
+
+
+async def _single_flight(key: str, factory):
+    """
+    Run `factory()` once per key in this process, concurrent callers share
+    the result.
+    """
+    task = _in_flight.get(key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(factory())
+        _in_flight[key] = task
+        task.add_done_callback(
+            lambda t: _in_flight.pop(key) if _in_flight.get(key) is t else None
+        )
+    else:
+        metrics.increment("result_cache.coalesced")
+    return await asyncio.shield(task)
+
+
+async def _fetch_once(key, fetch, ttl: float, canton: str, version: str):
+    """
+    Fetch an entry and store it, returns (result, success). When another node
+    holds the in-flight lock, wait for its result instead. Fetch anyway once
+    the lock is released without a result (errors are not stored) or after
+    the lock timeout.
+    """
+    result_cache = get_result_cache()
+    locked = await result_cache.lock(key, settings.RESULT_CACHE_LOCK_TIMEOUT)
+    if not locked:
+        metrics.increment("result_cache.lock_wait")
+        deadline = time.monotonic() + settings.RESULT_CACHE_LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            # Checked before the entry, which is stored before the unlock
+            released = not await result_cache.locked(key)
+            entry = await result_cache.get(key, _lifetime(ttl), canton, version)
+            if entry is not None and _is_fresh(entry, ttl):
+                return entry["result"], True
+            if released:
+                break
+
+    try:
+        result, success = await fetch()
+        if success:
+            entry = {"stored_at": time.time(), "result": result}
+            await result_cache.set(key, entry, _lifetime(ttl), canton, version)
+        return result, success
+    finally:
+        if locked:
+            await result_cache.unlock(key)
+
+
+def _revalidate(key: str, fetch, ttl: float, canton: str, version: str):
+    """Refresh an entry in the background (stale-while-revalidate)."""
+    if key in _in_flight:
+        return
+    with outbound.background():
+        task = asyncio.ensure_future(
+            _single_flight(key, lambda: _fetch_once(key, fetch, ttl, canton, version))
+        )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+async def _cached(key: str, fetch, ttl: float, canton: str, version: str):
+    """
+    Result of `fetch()` behind the result cache. `fetch` returns
+    (result, success), only successful results are stored.
+
+    Entries past their TTL are refreshed in the background and served stale
+    with RESULT_CACHE_STALE_WHILE_REVALIDATE, otherwise refreshed inline.
+    When the refresh fails they are served stale (last known good).
+    """
+    entry = await get_result_cache().get(key, _lifetime(ttl), canton, version)
+    if entry is not None:
+        if _is_fresh(entry, ttl):
+            return entry["result"]
+        metrics.increment("result_cache.stale")
+        if settings.RESULT_CACHE_STALE_WHILE_REVALIDATE:
+            _revalidate(key, fetch, ttl, canton, version)
+            return _stale_result(entry)
+
+    result, success = await _single_flight(
+        key, lambda: _fetch_once(key, fetch, ttl, canton, version)
+    )
+    if not success and entry is not None:
+        metrics.increment("result_cache.last_known_good")
+        return _stale_result(entry)
+    return result
+
+
+async def fetch_features_for_point(coord_x: float, coord_y: float, config: dict):
+    """
+    processing.fetch_features_for_point behind the result cache.
+    """
+    if not settings.RESULT_CACHE or bypass.get():
+        return await processing.fetch_features_for_point(coord_x, coord_y, config)
+
+    canton = config["name"]
+    version = config_version(config)
+    key = cache_key("features", canton, version, coord_x, coord_y)
+
+    async def _fetch():
+        result = await processing.fetch_features_for_point(coord_x, coord_y, config)
+        success = not result.get("geoservice_unavailable")
+        if success:
+            _recent_points[canton].append((coord_x, coord_y))
+        return result, success
+
+    return await _cached(key, _fetch, settings.RESULT_CACHE_TTL, canton, version)
+
+
+async def get_cached_features(coord_x: float, coord_y: float, config: dict):
+    """Cached result of fetch_features_for_point, fresh or stale, or None."""
+    canton = config["name"]
+    version = config_version(config)
+    key = cache_key("features", canton, version, coord_x, coord_y)
+    entry = await get_result_cache().get(
+        key, _lifetime(settings.RESULT_CACHE_TTL), canton, version
+    )
+    return entry["result"] if entry is not None else None
+
+
+async def get_canton_from_coordinates(coord_x: float, coord_y: float):
+    """
+    processing.get_canton_from_coordinates behind the result cache.
+    Empty results (outside Switzerland or geo.admin.ch error) are not cached.
+    """
+    if not settings.RESULT_CACHE or bypass.get():
+        return await processing.get_canton_from_coordinates(coord_x, coord_y)
+
+    key = cache_key("identify", "", "", coord_x, coord_y)
+
+    async def _fetch():
+        results = await processing.get_canton_from_coordinates(coord_x, coord_y)
+        return results, bool(results)
+
+    return await _cached(key, _fetch, settings.RESULT_CACHE_IDENTIFY_TTL, "", "")
+
+
+async def prefetch_features(points: list, config: dict):
+    """
+    Load the cached results of many points of a canton at once (one pipelined
+    round trip to the shared tiers), so that the following per point lookups
+    are answered from memory.
+    """
+    if not settings.RESULT_CACHE or not points:
+        return
+    canton = config["name"]
+    version = config_version(config)
+    keys = [cache_key("features", canton, version, x, y) for x, y in points]
+    await get_result_cache().get_many(
+        keys, _lifetime(settings.RESULT_CACHE_TTL), canton, version
+    )
+
+
+async def prefetch_cantons(points: list):
+    """Same as prefetch_features, for geo.admin.ch identify results."""
+    if not settings.RESULT_CACHE or not points:
+        return
+    keys = [cache_key("identify", "", "", x, y) for x, y in points]
+    await get_result_cache().get_many(
+        keys, _lifetime(settings.RESULT_CACHE_IDENTIFY_TTL), "", ""
+    )
@@ -0,0 +1,82 @@
+"""
+Cancellation of drill category lookups nobody waits for anymore.
+
+Map frontends fire a request on every click and abandon the previous one.
+With CANCEL_ON_DISCONNECT, the lookup is cancelled (geo.admin.ch identify and
+the cantonal request) when the client disconnects. Clients can also send a
+session token (SESSION_HEADER): a newer request of the same session cancels
+its predecessor, which is answered with 409.
+
+Lookups shared with other requests through the result cache single-flight
+keep running for the other waiters.
+"""
+
+import asyncio
+import logging
+
+from fastapi import HTTPException, Request
+
+from ..config import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class _Run:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.superseded = False
+
+
+# Latest run per session token
+_sessions = {}
+
+
+async def run_cancellable(request: Request, coro, session: str | None = None):
+    """
+    Await `coro`, cancelled when the client disconnects or a newer request of
+    the same session starts.
+
+    **Raises:**
+    - `ClientDisconnected`: the client went away
+    - `HTTPException 409`: superseded by a newer request of the session
+    """
+    if not session and not settings.CANCEL_ON_DISCONNECT:
+        return await coro
+
+    run = _Run(asyncio.ensure_future(coro))
+    if session:
+        previous = _sessions.get(session)
+        if previous is not None and not previous.task.done():
+            logger.debug("Session %s: cancelling the previous request", session)
+            previous.superseded = True
+            previous.task.cancel()
+        _sessions[session] = run
+
+    poll_interval = (
+        settings.DISCONNECT_POLL_INTERVAL if settings.CANCEL_ON_DISCONNECT else None
+    )
+    try:
+        while not run.task.done():
+            await asyncio.wait({run.task}, timeout=poll_interval)
+            if not run.task.done() and await request.is_disconnected():
+                logger.debug("Client disconnected, lookup cancelled")
+                run.task.cancel()
+                metrics.increment("cancelled.disconnected")
+                raise ClientDisconnected()
+
+        if run.task.cancelled() and run.superseded:
+            metrics.increment("cancelled.superseded")
+            raise HTTPException(
+                409, "Superseded by a newer request of the same session"
+            )
+        return run.task.result()
+    finally:
+        if not run.task.done():
+            run.task.cancel()
+        if session and _sessions.get(session) is run:
+            del _sessions[session]
@@ -0,0 +1,154 @@
+"""
+Vectorized canton assignment for batches of LV95 coordinates.
+
+Canton polygons are read from a GeoJSON FeatureCollection in EPSG:2056
+(for example a simplified export of swissBOUNDARIES3D), with the canton code
+in the "ak" property. Points are first filtered with the canton bounding
+boxes, then tested against the polygons with an even-odd ray casting.
+
+Simplified polygons are not exact: every point closer than `border_tolerance`
+meters to a canton boundary, or not inside exactly one canton, is flagged as
+ambiguous and must be resolved with the geo.admin.ch identify service.
+"""
+
+import functools
+import json
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Number of points tested at once against all the edges of a ring
+CHUNK_SIZE = 512
+
+
+def _rings_from_geometry(geometry: dict) -> list:
+    if geometry["type"] == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif geometry["type"] == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        raise ValueError(f"Unsupported canton geometry type: {geometry['type']}")
+    return [
+        np.asarray(ring, dtype=np.float64)[:, :2]
+        for polygon in polygons
+        for ring in polygon
+    ]
+
+
+def _ring_edges(rings: list) -> np.ndarray:
+    """All the edges of a canton as an (E, 4) array of x1, y1, x2, y2."""
+    edges = []
+    for ring in rings:
+        start = ring
+        end = np.roll(ring, -1, axis=0)
+        edges.append(np.hstack([start, end]))
+    return np.vstack(edges)
+
+
+class CantonAssigner:
+    """
+    Assign cantons to arrays of coordinates using simplified canton polygons.
+    """
+
+    def __init__(self, polygons: dict, border_tolerance: float = 50.0):
+        """
+        polygons: canton code -> list of rings, each ring an (N, 2) array.
+        Holes are plain rings, the even-odd rule takes care of them.
+        """
+        self.codes = list(polygons)
+        self.border_tolerance = border_tolerance
+        self.edges = [_ring_edges(rings) for rings in polygons.values()]
+        self.bboxes = np.array(
+            [
+                [
+                    edges[:, [0, 2]].min(),
+                    edges[:, [1, 3]].min(),
+                    edges[:, [0, 2]].max(),
+                    edges[:, [1, 3]].max(),
+                ]
+                for edges in self.edges
+            ]
+        ).reshape(-1, 4)
+
+    @classmethod
+    def from_geojson(cls, path, border_tolerance: float = 50.0):
+        with open(path, encoding="utf-8") as f:
+            collection = json.load(f)
+
+        polygons = {}
+        for feature in collection["features"]:
+            code = feature["properties"]["ak"]
+            polygons.setdefault(code, []).extend(
+                _rings_from_geometry(feature["geometry"])
+            )
+        logger.info("Loaded %d canton polygons from %s", len(polygons), path)
+        return cls(polygons, border_tolerance)
+
+    def assign(self, xs, ys):
+        """
+        Return (codes, ambiguous) for arrays of LV95 coordinates.
+
+        codes is an array of canton codes ("" when unknown), ambiguous is a
+        boolean mask of the points that need a geo.admin.ch identify call.
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+
+        inside_count = np.zeros(xs.shape, dtype=np.int64)
+        near_border = np.zeros(xs.shape, dtype=bool)
+        codes = np.full(xs.shape, "", dtype=object)
+
+        for code, edges, bbox in zip(self.codes, self.edges, self.bboxes):
+            tolerance = self.border_tolerance
+            candidates = np.flatnonzero(
+                (xs >= bbox[0] - tolerance)
+                & (ys >= bbox[1] - tolerance)
+                & (xs <= bbox[2] + tolerance)
+                & (ys <= bbox[3] + tolerance)
+            )
+
+            for start in range(0, len(candidates), CHUNK_SIZE):
+                chunk = candidates[start : start + CHUNK_SIZE]
+                inside, distance = self._test_points(xs[chunk], ys[chunk], edges)
+
+                inside_count[chunk] += inside
+                codes[chunk[inside]] = code
+                near_border[chunk] |= distance < tolerance
+
+        ambiguous = near_border | (inside_count != 1)
+        codes[ambiguous] = ""
+        return codes, ambiguous
+
+    @staticmethod
+    def _test_points(px, py, edges):
+        """
+        Even-odd ray casting and distance to the closest edge, as (P, E) broadcasts.
+        """
+        px = px[:, None]
+        py = py[:, None]
+        x1, y1, x2, y2 = (edges[:, i][None, :] for i in range(4))
+
+        crosses = (y1 > py) != (y2 > py)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        inside = np.count_nonzero(crosses & (px < x_cross), axis=1) % 2 == 1
+
+        dx = x2 - x1
+        dy = y2 - y1
+        length2 = dx * dx + dy * dy
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.clip(((px - x1) * dx + (py - y1) * dy) / length2, 0.0, 1.0)
+        t = np.where(length2 > 0, t, 0.0)
+        distance = np.hypot(px - (x1 + t * dx), py - (y1 + t * dy)).min(axis=1)
+
+        return inside, distance
+
+
+@functools.lru_cache(maxsize=1)
+def load_canton_assigner(path: str, border_tolerance: float):
+    """
+    CantonAssigner for a polygons file, loaded once per path and tolerance.
+    """
+    return CantonAssigner.from_geojson(path, border_tolerance)
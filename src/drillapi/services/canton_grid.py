@@ -0,0 +1,227 @@
+"""
+Coarse grid of LV95 cells used to avoid geo.admin.ch identify calls.
+
+Two kinds of knowledge are kept:
+- the canton last identified inside each cell, a cheap guess used to start
+  the cantonal request before geo.admin.ch has answered (SPECULATIVE_FETCH)
+- the canton identified at each grid corner. Once the four corners of a cell
+  have been identified in the same canton, the cell is confirmed and later
+  points inside it skip geo.admin.ch identify (CANTON_GRID_CACHE)
+
+Corners are identified in the background after a regular identify call and
+shared by neighbouring cells. The grid is bounded and can persist to disk.
+"""
+
+import asyncio
+import atexit
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+
+import httpx
+
+from ..config import settings
+from . import cache, metrics, outbound, processing
+
+logger = logging.getLogger(__name__)
+
+# Corner on a canton border or outside Switzerland, never confirms a cell
+NO_CANTON = ""
+
+# Failed identify of a corner: network, HTTP (timeouts included) and JSON errors
+IDENTIFY_ERRORS = (httpx.HTTPError, json.JSONDecodeError)
+
+
+class CantonGrid:
+    def __init__(self, cell_size: float = 500.0, max_cells: int = 100_000):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.cells = OrderedDict()
+        self.corners = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def cell(self, coord_x: float, coord_y: float) -> tuple:
+        """Index of the cell containing the coordinates."""
+        return (
+            math.floor(coord_x / self.cell_size),
+            math.floor(coord_y / self.cell_size),
+        )
+
+    def cell_corners(self, coord_x: float, coord_y: float) -> list:
+        """Indexes of the four corners of the cell containing the coordinates."""
+        ix, iy = self.cell(coord_x, coord_y)
+        return [(ix, iy), (ix + 1, iy), (ix, iy + 1), (ix + 1, iy + 1)]
+
+    def guess(self, coord_x: float, coord_y: float):
+        """Canton last identified in the cell of the coordinates, or None."""
+        key = self.cell(coord_x, coord_y)
+        code = self.cells.get(key)
+        if code is not None:
+            self.cells.move_to_end(key)
+        return code
+
+    def observe(self, coord_x: float, coord_y: float, code: str):
+        """Remember the canton identified by geo.admin.ch at the coordinates."""
+        self._put(self.cells, self.cell(coord_x, coord_y), code)
+
+    def confirmed(self, coord_x: float, coord_y: float):
+        """
+        Canton of the cell when its four corners agree, otherwise None.
+        Counts as a hit or a miss of the cache.
+        """
+        codes = {
+            self.corners.get(corner) for corner in self.cell_corners(coord_x, coord_y)
+        }
+        code = codes.pop() if len(codes) == 1 else None
+        if code:
+            self.hits += 1
+            return code
+        self.misses += 1
+        return None
+
+    def unknown_corners(self, coord_x: float, coord_y: float) -> list:
+        return [c for c in self.cell_corners(coord_x, coord_y) if c not in self.corners]
+
+    def set_corner(self, corner: tuple, code: str):
+        self._put(self.corners, corner, code)
+
+    def _put(self, store: OrderedDict, key: tuple, code: str):
+        store[key] = code
+        store.move_to_end(key)
+        while len(store) > self.max_cells:
+            store.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "corners": len(self.corners),
+            "cells": len(self.cells),
+        }
+
+    def clear(self):
+        self.cells.clear()
+        self.corners.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def save(self, path):
+        """Write the identified corners to disk (atomic replace)."""
+        data = {
+            "cell_size": self.cell_size,
+            "corners": [[ix, iy, code] for (ix, iy), code in self.corners.items()],
+        }
+        # Per process, workers saving at exit must not write the same file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Read corners saved by `save`. Files for another cell size are ignored."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning("Cannot load canton grid cache %s: %s", path, e)
+            return
+
+        if data.get("cell_size") != self.cell_size:
+            logger.warning("Canton grid cache %s has another cell size, ignored", path)
+            return
+        for ix, iy, code in data.get("corners", []):
+            self.set_corner((ix, iy), code)
+        logger.info("Loaded %d canton grid corners from %s", len(self.corners), path)
+
+
+canton_grid = CantonGrid(settings.CANTON_GRID_CELL_SIZE, settings.CANTON_GRID_MAX_CELLS)
+if settings.CANTON_GRID_CACHE and settings.CANTON_GRID_CACHE_PATH:
+    canton_grid.load(settings.CANTON_GRID_CACHE_PATH)
+metrics.register_gauge("canton_grid", canton_grid.stats)
+
+# Background corner identification
+_learning = set()
+_background_tasks = set()
+_last_save = time.monotonic()
+
+
+async def get_canton_from_coordinates(coord_x: float, coord_y: float):
+    """
+    geo.admin.ch identify results, skipped for cells confirmed by the grid cache
+    unless the result cache is bypassed.
+    """
+    if not settings.CANTON_GRID_CACHE or cache.bypass.get():
+        return await cache.get_canton_from_coordinates(coord_x, coord_y)
+
+    code = canton_grid.confirmed(coord_x, coord_y)
+    if code:
+        return [{"attributes": {"ak": code}}]
+
+    results = await cache.get_canton_from_coordinates(coord_x, coord_y)
+
+    corners = [
+        c for c in canton_grid.unknown_corners(coord_x, coord_y) if c not in _learning
+    ]
+    if results and corners:
+        _learning.update(corners)
+        with outbound.background():
+            task = asyncio.create_task(_learn_corners(corners))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+    return results
+
+
+async def _learn_corners(corners: list):
+    """Identify the canton at grid corners and store them in the grid."""
+    try:
+        for ix, iy in corners:
+            try:
+                results = await processing.identify_canton(
+                    ix * canton_grid.cell_size, iy * canton_grid.cell_size
+                )
+            except IDENTIFY_ERRORS as e:
+                # Learned again by a later lookup, an outage never sticks
+                logger.info("Canton grid corner %s not identified: %r", (ix, iy), e)
+                continue
+            # No results: outside Switzerland. Marked too, otherwise every
+            # lookup in the cell would identify it again
+            codes = {r["attributes"]["ak"] for r in results}
+            canton_grid.set_corner(
+                (ix, iy), codes.pop() if len(codes) == 1 else NO_CANTON
+            )
+    finally:
+        _learning.difference_update(corners)
+    _maybe_save()
+
+
+def _maybe_save():
+    global _last_save
+    path = settings.CANTON_GRID_CACHE_PATH
+    if not path or time.monotonic() - _last_save < settings.CANTON_GRID_SAVE_INTERVAL:
+        return
+    _last_save = time.monotonic()
+    try:
+        canton_grid.save(path)
+    except OSError as e:
+        logger.warning("Cannot save canton grid cache %s: %s", path, e)
+
+
+@atexit.register
+def _save_on_exit():
+    if settings.CANTON_GRID_CACHE and settings.CANTON_GRID_CACHE_PATH:
+        try:
+            canton_grid.save(settings.CANTON_GRID_CACHE_PATH)
+        except OSError as e:
+            logger.warning("Cannot save canton grid cache: %s", e)
@@ -0,0 +1,130 @@
+"""
+Detection of cantonal data updates, so that long result cache TTLs are safe.
+
+Periodically, for each active canton:
+- the ground control points are fetched and their features hashed, a hash
+  different from the previous run means the canton updated its data
+- a few recently cached points are fetched again and compared with the
+  cached features
+
+When a change is found, the cached entries of that canton only are purged.
+Features are hashed after parsing rather than the raw bodies, some servers
+put timestamps in their responses.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import random
+
+from drillapi.cantons_configuration import cantons
+
+from ..config import settings
+from . import cache, http_cache, metrics, outbound, processing
+
+logger = logging.getLogger(__name__)
+
+# canton -> {(coord_x, coord_y): hash} of the ground control points
+_control_hashes = {}
+
+
+def features_hash(features: list) -> str:
+    """
+    Hash of parsed features, whatever their order: split layers are
+    requested concurrently and their features appended as they complete.
+    """
+    dumps = sorted(json.dumps(f, sort_keys=True, default=str) for f in features)
+    return hashlib.sha256("\n".join(dumps).encode("utf-8")).hexdigest()
+
+
+async def invalidate(
+    canton: str | None = None, config_version: str | None = None
+) -> int:
+    """
+    Purge the cached results of a canton and/or a config version, with the
+    HTTP cache entries of the canton geoservice. Returns the number of
+    result entries removed.
+    """
+    removed = await cache.get_result_cache().purge(canton, config_version)
+    config = cantons.CANTONS["cantons_configurations"].get(canton or "")
+    if config and config.get("query_url"):
+        http_cache.response_store.discard_prefix(config["query_url"])
+    logger.info(
+        "Cache purged (canton=%s, config_version=%s): %d entries",
+        canton,
+        config_version,
+        removed,
+    )
+    return removed
+
+
+async def _control_points_changed(code: str, config: dict) -> bool:
+    previous = _control_hashes.get(code, {})
+    current = {}
+    for point in config.get("ground_control_point", []):
+        coord_x, coord_y = point[0], point[1]
+        result = await processing.fetch_features_for_point(coord_x, coord_y, config)
+        if result.get("geoservice_unavailable"):
+            continue
+        current[(coord_x, coord_y)] = features_hash(result["features"])
+    _control_hashes[code] = {**previous, **current}
+    return any(
+        previous[point] != value
+        for point, value in current.items()
+        if point in previous
+    )
+
+
+async def _cached_points_changed(code: str, config: dict) -> bool:
+    points = cache.recent_points(code)
+    for coord_x, coord_y in random.sample(
+        points, min(settings.CHANGE_DETECTION_SAMPLES, len(points))
+    ):
+        cached = await cache.get_cached_features(coord_x, coord_y, config)
+        if cached is None:
+            continue
+        result = await processing.fetch_features_for_point(coord_x, coord_y, config)
+        if result.get("geoservice_unavailable"):
+            continue
+        if features_hash(result["features"]) != features_hash(cached["features"]):
+            return True
+    return False
+
+
+async def check_canton(code: str, config: dict) -> bool:
+    """Check one canton, purge its cached entries when its data changed."""
+    try:
+        changed = await _control_points_changed(code, config)
+        changed = changed or await _cached_points_changed(code, config)
+    except Exception:
+        logger.exception("Change detection failed for canton %s", code)
+        return False
+
+    if changed:
+        logger.warning("Data of canton %s changed, purging its cached results", code)
+        metrics.increment(f"change_detection.changed.{code}")
+        await invalidate(canton=code)
+    return changed
+
+
+async def check_all() -> list:
+    """Check every active canton, returns the codes of the changed ones."""
+    active = {
+        code: config
+        for code, config in cantons.CANTONS["cantons_configurations"].items()
+        if config.get("active")
+    }
+    with outbound.background():
+        changed = await asyncio.gather(
+            *(check_canton(code, config) for code, config in active.items())
+        )
+    metrics.increment("change_detection.runs")
+    return [code for code, is_changed in zip(active, changed) if is_changed]
+
+
+async def run_periodically(interval: float):
+    """Background job started with the application."""
+    while True:
+        await check_all()
+        await asyncio.sleep(interval)
@@ -0,0 +1,46 @@
+"""
+Shared httpx client for upstream geoservices.
+
+Connections are kept alive between requests (and opened in advance by the
+warm-up), so most requests skip DNS, TCP and TLS setup. Connections belong
+to an event loop, a new client is created when the loop changes.
+"""
+
+import asyncio
+
+import httpx
+
+from ..config import settings
+from . import http_cache
+
+_clients = {}
+
+
+def get_client() -> httpx.AsyncClient:
+    """Client of the running event loop, timeouts are set per request."""
+    loop = asyncio.get_running_loop()
+    key = settings.HTTP_CACHE
+    entry = _clients.get(key)
+    if entry is None or entry[0] is not loop or entry[1].is_closed:
+        limits = httpx.Limits(
+            max_connections=settings.HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+        )
+        client = httpx.AsyncClient(
+            timeout=20.0,
+            transport=http_cache.transport(limits),
+            limits=limits,
+        )
+        _clients[key] = (loop, client)
+        entry = _clients[key]
+    return entry[1]
+
+
+async def aclose():
+    """Close the clients of the running event loop (application shutdown)."""
+    loop = asyncio.get_running_loop()
+    for key, (client_loop, client) in list(_clients.items()):
+        if client_loop is loop:
+            await client.aclose()
+            del _clients[key]
@@ -0,0 +1,336 @@
+"""
+HTTP cache for upstream geoservice responses, following RFC 9111 for a
+shared cache.
+
+Responses are stored by full request URL and served while fresh
+(Cache-Control s-maxage / max-age, Expires, or a heuristic based on
+Last-Modified). Stale responses carrying a validator are revalidated with
+If-None-Match / If-Modified-Since, so unchanged data costs a 304.
+
+Requests within cache.uncached() neither read nor write the store.
+The store is cleared when the purge generation of the result cache changed
+since the last read, after a purge in another worker.
+
+Bodies are only buffered for storage up to the size limit of the request
+(MAX_BYTES_EXTENSION, else MAX_RESPONSE_BYTES). Larger responses are passed
+on as they are read, not stored, and the caller enforces its limit.
+"""
+
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import NamedTuple
+
+import httpx
+
+from ..config import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Heuristic freshness: 10% of the time since Last-Modified (RFC 9111 4.2.2)
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX = 86_400.0
+CACHEABLE_STATUS = {200, 203, 300, 301, 308, 404, 410}
+# Not updated from a 304 response (RFC 9111 3.2)
+UNCHANGED_HEADERS = {"content-length", "content-encoding", "transfer-encoding"}
+# Request extension holding the body size limit of the caller
+MAX_BYTES_EXTENSION = "drillapi.max_bytes"
+# Invalid dates and numbers in headers
+_INVALID = (TypeError, ValueError)
+
+
+class CachedResponse(NamedTuple):
+    status_code: int
+    headers: list
+    content: bytes
+    stored_at: float
+    vary: tuple
+
+
+def parse_cache_control(value: str) -> dict:
+    directives = {}
+    for part in value.split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def _http_date(value):
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except _INVALID:
+        return None
+
+
+def _seconds(value):
+    try:
+        return max(int(value), 0)
+    except _INVALID:
+        return None
+
+
+def freshness_lifetime(headers: httpx.Headers, stored_at: float) -> float:
+    """Seconds a response stays fresh, as seen by a shared cache."""
+    directives = parse_cache_control(headers.get("cache-control", ""))
+    if "no-cache" in directives:
+        return 0.0
+    for directive in ("s-maxage", "max-age"):
+        seconds = _seconds(directives.get(directive))
+        if seconds is not None:
+            return float(seconds)
+
+    date = _http_date(headers.get("date")) or stored_at
+    expires = _http_date(headers.get("expires"))
+    if "expires" in headers:
+        # Invalid dates, such as "0", mean already expired
+        return max(expires - date, 0.0) if expires else 0.0
+
+    last_modified = _http_date(headers.get("last-modified"))
+    if last_modified and last_modified < date:
+        return min((date - last_modified) * HEURISTIC_FRACTION, HEURISTIC_MAX)
+    return 0.0
+
+
+def current_age(entry: CachedResponse, now: float) -> float:
+    headers = httpx.Headers(entry.headers)
+    return (_seconds(headers.get("age")) or 0) + max(now - entry.stored_at, 0.0)
+
+
+def is_fresh(entry: CachedResponse, now: float) -> bool:
+    headers = httpx.Headers(entry.headers)
+    return freshness_lifetime(headers, entry.stored_at) > current_age(entry, now)
+
+
+def is_storable(request: httpx.Request, response: httpx.Response) -> bool:
+    if request.method != "GET" or response.status_code not in CACHEABLE_STATUS:
+        return False
+    request_directives = parse_cache_control(request.headers.get("cache-control", ""))
+    directives = parse_cache_control(response.headers.get("cache-control", ""))
+    if {"no-store", "private"} & (directives.keys() | request_directives.keys()):
+        return False
+    if response.headers.get("vary", "").strip() == "*":
+        return False
+    # Only worth storing when it can be served fresh or revalidated
+    return bool(
+        freshness_lifetime(response.headers, time.time())
+        or "etag" in response.headers
+        or "last-modified" in response.headers
+    )
+
+
+def _vary(request: httpx.Request, headers: httpx.Headers) -> tuple:
+    names = [n.strip().lower() for n in headers.get("vary", "").split(",") if n.strip()]
+    return tuple((name, request.headers.get(name)) for name in names)
+
+
+class ResponseStore:
+    """LRU of cached responses bounded by the total size of their bodies."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+        # Async callable returning the purge generation, set by the result cache
+        self.generation_source = None
+        self.generation = None
+
+    async def check_generation(self):
+        """Clear the store when the purge generation changed since the last read."""
+        if self.generation_source is None:
+            return
+        generation = await self.generation_source()
+        if self.generation is not None and generation != self.generation:
+            metrics.increment("http_cache.purged_elsewhere")
+            self.clear()
+        self.generation = generation
+
+    def get(self, url: str):
+        entry = self.entries.get(url)
+        if entry is not None:
+            self.entries.move_to_end(url)
+        return entry
+
+    def put(self, url: str, entry: CachedResponse):
+        if len(entry.content) > self.max_bytes:
+            return
+        self.discard(url)
+        self.entries[url] = entry
+        self.size += len(entry.content)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted.content)
+
+    def discard(self, url: str):
+        entry = self.entries.pop(url, None)
+        if entry is not None:
+            self.size -= len(entry.content)
+
+    def discard_prefix(self, prefix: str):
+        for url in [url for url in self.entries if url.startswith(prefix)]:
+            self.discard(url)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "bytes": self.size}
+
+
+# Set in the requesting task when a response is served without a request, the
+# adaptive outbound limits do not take its latency into account
+served_fresh = contextvars.ContextVar("served_fresh", default=False)
+
+# Set by cache.uncached(): requests of the current task skip the store and ask
+# upstream caches for a fresh response too
+bypass = contextvars.ContextVar("cache_bypass", default=False)
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    """Chunks already read from a response, then the rest of it."""
+
+    def __init__(self, chunks: list, rest, response: httpx.Response):
+        self.chunks = chunks
+        self.rest = rest
+        self.response = response
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+        async for chunk in self.rest:
+            yield chunk
+
+    async def aclose(self):
+        await self.response.aclose()
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """Transport serving and revalidating responses from a ResponseStore."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, store: ResponseStore):
+        self.transport = transport
+        self.store = store
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if bypass.get():
+            metrics.increment("http_cache.bypass")
+            request.headers["Cache-Control"] = "no-cache"
+            return await self.transport.handle_async_request(request)
+        if request.method != "GET":
+            return await self.transport.handle_async_request(request)
+
+        await self.store.check_generation()
+        url = str(request.url)
+        now = time.time()
+        entry = self.store.get(url)
+        if entry is not None and entry.vary != _vary(
+            request, httpx.Headers(entry.headers)
+        ):
+            entry = None
+
+        if entry is not None and is_fresh(entry, now):
+            metrics.increment("http_cache.hit")
+            served_fresh.set(True)
+            return self._response(entry, request)
+
+        if entry is not None:
+            stored_headers = httpx.Headers(entry.headers)
+            if "etag" in stored_headers:
+                request.headers["If-None-Match"] = stored_headers["etag"]
+            if "last-modified" in stored_headers:
+                request.headers["If-Modified-Since"] = stored_headers["last-modified"]
+
+        response = await self.transport.handle_async_request(request)
+
+        if response.status_code == 304 and entry is not None:
+            await response.aclose()
+            metrics.increment("http_cache.revalidated")
+            entry = self._refresh(entry, response.headers)
+            self.store.put(url, entry)
+            return self._response(entry, request)
+
+        metrics.increment("http_cache.miss")
+        if not is_storable(request, response):
+            return response
+
+        max_bytes = min(
+            self.store.max_bytes,
+            request.extensions.get(MAX_BYTES_EXTENSION, settings.MAX_RESPONSE_BYTES),
+        )
+        length = response.headers.get("content-length", "")
+        if length.isdigit() and int(length) > max_bytes:
+            metrics.increment("http_cache.too_large")
+            return response
+
+        chunks = []
+        size = 0
+        rest = response.stream.__aiter__()
+        try:
+            async for chunk in rest:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > max_bytes:
+                    # Passed on unbuffered, the caller enforces its own limit
+                    metrics.increment("http_cache.too_large")
+                    return httpx.Response(
+                        response.status_code,
+                        headers=response.headers,
+                        stream=_ReplayStream(chunks, rest, response),
+                        request=request,
+                        extensions=response.extensions,
+                    )
+        except BaseException:
+            await response.aclose()
+            raise
+        await response.aclose()
+        content = b"".join(chunks)
+        entry = CachedResponse(
+            response.status_code,
+            response.headers.multi_items(),
+            content,
+            time.time(),
+            _vary(request, response.headers),
+        )
+        self.store.put(url, entry)
+        return self._response(entry, request)
+
+    @staticmethod
+    def _refresh(entry: CachedResponse, headers: httpx.Headers) -> CachedResponse:
+        """Stored response with the headers of a 304 (RFC 9111 4.3.4)."""
+        updated = {name.lower() for name in headers} - UNCHANGED_HEADERS
+        merged = [(k, v) for k, v in entry.headers if k.lower() not in updated]
+        merged += [(k, v) for k, v in headers.multi_items() if k.lower() in updated]
+        return entry._replace(headers=merged, stored_at=time.time())
+
+    @staticmethod
+    def _response(entry: CachedResponse, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(
+            entry.status_code,
+            headers=entry.headers,
+            stream=httpx.ByteStream(entry.content),
+            request=request,
+        )
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+response_store = ResponseStore(settings.HTTP_CACHE_MAX_BYTES)
+metrics.register_gauge("http_cache", response_store.stats)
+
+
+def transport(limits: httpx.Limits):
+    """
+    Transport for an httpx.AsyncClient calling geoservices, None (httpx
+    default) when HTTP_CACHE is disabled. The client ignores its own limits
+    when given a transport, they are set on the connection pool here.
+    """
+    if not settings.HTTP_CACHE:
+        return None
+    return CachingTransport(httpx.AsyncHTTPTransport(limits=limits), response_store)
@@ -0,0 +1,51 @@
+"""
+Lightweight in-process metrics, exposed as JSON on /v1/metrics.
+
+Values are per worker process and reset on restart.
+"""
+
+from collections import defaultdict
+
+_counters = defaultdict(int)
+_timings = {}
+_gauges = {}
+
+
+def increment(name: str, value: int = 1):
+    _counters[name] += value
+
+
+def observe(name: str, seconds: float):
+    """Record a duration in seconds."""
+    timing = _timings.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+    timing["count"] += 1
+    timing["total"] += seconds
+    timing["max"] = max(timing["max"], seconds)
+
+
+def register_gauge(name: str, func):
+    """Register a callable returning the current value of a gauge."""
+    _gauges[name] = func
+
+
+def snapshot() -> dict:
+    timings = {
+        name: {
+            "count": t["count"],
+            "total": round(t["total"], 6),
+            "mean": round(t["total"] / t["count"], 6) if t["count"] else 0.0,
+            "max": round(t["max"], 6),
+        }
+        for name, t in _timings.items()
+    }
+    return {
+        "counters": dict(_counters),
+        "timings": timings,
+        "gauges": {name: func() for name, func in _gauges.items()},
+    }
+
+
+def reset():
+    """Reset counters and timings, gauges stay registered."""
+    _counters.clear()
+    _timings.clear()
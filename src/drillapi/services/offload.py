@@ -0,0 +1,72 @@
+"""
+Executor for CPU-bound work: parsing of geoservice responses and raster
+classification.
+
+Parsing a large GML response blocks the event loop, and with it every other
+request of the worker. With PARSE_EXECUTOR=thread or process, payloads from
+PARSE_OFFLOAD_MIN_BYTES on run in a pool, smaller ones stay inline where a
+hand-off would cost more than the work. A process pool also spreads the work
+of bulk requests over several cores, the functions and their arguments must
+then be picklable.
+
+Metrics: ``parse.inline`` (time of inline runs), ``parse.queued`` (time an
+offloaded run waited for a worker) and ``parse.duration`` (time it ran).
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ..config import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+
+
+def get_executor():
+    key = (settings.PARSE_EXECUTOR, settings.PARSE_EXECUTOR_WORKERS)
+    executor = _executors.get(key)
+    if executor is None:
+        if settings.PARSE_EXECUTOR == "process":
+            executor = ProcessPoolExecutor(max_workers=settings.PARSE_EXECUTOR_WORKERS)
+        else:
+            executor = ThreadPoolExecutor(
+                max_workers=settings.PARSE_EXECUTOR_WORKERS,
+                thread_name_prefix="drillapi-parse",
+            )
+        logger.info("Parse executor: %s, %d workers", *key)
+        _executors[key] = executor
+    return executor
+
+
+def _timed(submitted: float, func, *args):
+    # Wall clock, comparable between processes
+    started = time.time()
+    result = func(*args)
+    return result, started - submitted, time.time() - started
+
+
+async def run(func, *args, size: int):
+    """Run ``func(*args)``, in the executor when ``size`` (bytes) is large enough."""
+    if settings.PARSE_EXECUTOR == "inline" or size < settings.PARSE_OFFLOAD_MIN_BYTES:
+        started = time.perf_counter()
+        result = func(*args)
+        metrics.observe("parse.inline", time.perf_counter() - started)
+        return result
+
+    result, queued, duration = await asyncio.get_running_loop().run_in_executor(
+        get_executor(), _timed, time.time(), func, *args
+    )
+    metrics.observe("parse.queued", queued)
+    metrics.observe("parse.duration", duration)
+    return result
+
+
+def shutdown():
+    """Stop the executors (application shutdown), queued work is cancelled."""
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
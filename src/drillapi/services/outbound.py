@@ -0,0 +1,399 @@
+"""
+Outbound limits per upstream host.
+
+Bulk runs could open as many requests to a cantonal server as the connection
+pool allows, which got us throttled upstream and turned into
+``geoservice_unavailable`` for interactive users. Every request to a host goes
+through ``slot``: a semaphore caps the requests in flight and a token bucket
+their start rate. Defaults are UPSTREAM_MAX_CONCURRENCY and UPSTREAM_MAX_RATE
+(unlimited when not set), overridden per canton by ``max_concurrency``,
+``max_rate`` and ``rate_burst`` in its configuration. There is one limiter per
+host, cantons sharing a host get the strictest of their limits.
+
+With UPSTREAM_ADAPTIVE, the concurrency limit of a host is found at run time
+instead (AIMD): it grows by one per round of requests while the host answers
+quickly, and is cut by UPSTREAM_ADAPTIVE_BACKOFF at most once per round trip
+when latency rises past UPSTREAM_ADAPTIVE_TOLERANCE times the baseline
+(lowest latency seen, drifting up slowly), on timeouts, 429 and 5xx, and on
+requests cancelled in flight. The static concurrency becomes its ceiling.
+
+Metrics: ``outbound.wait`` and ``outbound.wait.<host>`` (time spent waiting
+for a slot), ``outbound.throttled`` (requests delayed by the token bucket),
+``outbound.wait.interactive`` and ``outbound.wait.background`` (per lane),
+``outbound.backoff`` (adaptive limit cuts) and the limits per host.
+"""
+
+import asyncio
+import collections
+import contextvars
+import functools
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+from drillapi.cantons_configuration import cantons
+
+from ..config import settings
+from . import http_cache, metrics
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, in the order waiting requests are served
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+LANES = (INTERACTIVE, BACKGROUND)
+
+# Lane of the requests of the current task, inherited by the tasks it starts
+lane = contextvars.ContextVar("outbound_lane", default=INTERACTIVE)
+
+
+@contextmanager
+def background():
+    """Send the upstream requests of the block in the background lane."""
+    token = lane.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        lane.reset(token)
+
+
+class TokenBucket:
+    """
+    `rate` tokens per second, up to `burst` saved. Interactive requests reserve
+    their token in arrival order, background requests take one at a time
+    whatever interactive requests leave over.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._background = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token, returns the time to wait before it is due."""
+        self._refill()
+        # Reservations go negative, so that waiters start in arrival order
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self, lane: str = INTERACTIVE) -> bool:
+        """Wait for a token, returns whether the request was delayed."""
+        if lane == INTERACTIVE:
+            delay = self.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return delay > 0
+
+        # No reservation, interactive requests arriving meanwhile go first
+        delayed = False
+        async with self._background:
+            self._refill()
+            while self.tokens < 1:
+                delayed = True
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+        return delayed
+
+
+class ConcurrencyLimit:
+    """
+    Requests in flight to a host, granted per lane: waiting interactive
+    requests always go first, background requests hold at most
+    UPSTREAM_BACKGROUND_SHARE of the limit.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.lane_in_flight = {lane: 0 for lane in LANES}
+        self._waiters = {lane: collections.deque() for lane in LANES}
+
+    def _background_budget(self) -> int:
+        return max(1, int(int(self.limit) * settings.UPSTREAM_BACKGROUND_SHARE))
+
+    def _can_start(self, lane: str) -> bool:
+        if self.in_flight >= int(self.limit):
+            return False
+        if lane == INTERACTIVE:
+            return True
+        return (
+            not self._waiters[INTERACTIVE]
+            and self.lane_in_flight[BACKGROUND] < self._background_budget()
+        )
+
+    def _grant(self, lane: str):
+        self.in_flight += 1
+        self.lane_in_flight[lane] += 1
+
+    async def acquire(self, lane: str = INTERACTIVE):
+        if not self._waiters[lane] and self._can_start(lane):
+            self._grant(lane)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted while being cancelled, pass it on
+                self.release(lane)
+            else:
+                self._waiters[lane].remove(waiter)
+            raise
+
+    def release(self, lane: str = INTERACTIVE):
+        self.in_flight -= 1
+        self.lane_in_flight[lane] -= 1
+        self._wake()
+
+    def _wake(self):
+        for lane in LANES:
+            waiters = self._waiters[lane]
+            while waiters and self._can_start(lane):
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    self._grant(lane)
+                    waiter.set_result(None)
+
+    def waiting(self) -> bool:
+        return any(self._waiters.values())
+
+
+class AdaptiveLimit(ConcurrencyLimit):
+    """Concurrency limit adjusted on the latency and errors of the requests."""
+
+    def __init__(self, initial: int, maximum: int):
+        super().__init__(min(initial, maximum))
+        self.maximum = maximum
+        self.baseline = None
+        self._last_backoff = 0.0
+
+    def record(self, latency: float, overloaded: bool):
+        """Outcome of a request, before its release."""
+        now = time.monotonic()
+        slow = (
+            self.baseline is not None
+            and latency > self.baseline * settings.UPSTREAM_ADAPTIVE_TOLERANCE
+        )
+        if overloaded or slow:
+            # Requests of one round see the same congestion, back off once
+            if now - self._last_backoff > latency:
+                self.limit = max(1.0, self.limit * settings.UPSTREAM_ADAPTIVE_BACKOFF)
+                self._last_backoff = now
+                metrics.increment("outbound.backoff")
+        elif self.waiting() or self.in_flight >= int(self.limit):
+            # Only grow a limit that is actually reached
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._wake()
+
+        if not overloaded:
+            # Follows drops at once, increases slowly
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += (latency - self.baseline) * 0.01
+
+
+class HostLimiter:
+    def __init__(
+        self,
+        concurrency: int | None,
+        rate: float | None,
+        burst: int,
+        adaptive: bool = False,
+    ):
+        self.limits = (concurrency, rate, burst, adaptive)
+        if adaptive:
+            self.concurrency = AdaptiveLimit(
+                settings.UPSTREAM_ADAPTIVE_INITIAL,
+                concurrency or settings.UPSTREAM_ADAPTIVE_MAX,
+            )
+        elif concurrency:
+            self.concurrency = ConcurrencyLimit(concurrency)
+        else:
+            self.concurrency = None
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.in_flight = 0
+
+    def tighten(self, limits: tuple):
+        """
+        Apply stricter limits in place, keeping the requests in flight and the
+        state of the adaptive limit.
+        """
+        concurrency, rate, burst, _ = limits
+        if concurrency and concurrency != self.limits[0]:
+            if isinstance(self.concurrency, AdaptiveLimit):
+                self.concurrency.maximum = concurrency
+                self.concurrency.limit = min(self.concurrency.limit, concurrency)
+            elif self.concurrency is not None:
+                self.concurrency.limit = float(concurrency)
+            else:
+                # Unlimited until now, no request was counted
+                self.concurrency = ConcurrencyLimit(concurrency)
+        if rate and self.bucket is not None:
+            self.bucket.rate = rate
+            self.bucket.burst = burst
+            self.bucket.tokens = min(self.bucket.tokens, burst)
+        elif rate:
+            self.bucket = TokenBucket(rate, burst)
+        self.limits = limits
+
+
+# host -> (event loop, HostLimiter), waiters belong to an event loop
+_limiters = {}
+
+
+def host_limits(config: dict | None) -> tuple:
+    """(max concurrency, max rate, burst, adaptive) of a canton configuration."""
+    config = config or {}
+    return (
+        config.get("max_concurrency") or settings.UPSTREAM_MAX_CONCURRENCY,
+        config.get("max_rate") or settings.UPSTREAM_MAX_RATE,
+        config.get("rate_burst") or settings.UPSTREAM_RATE_BURST,
+        settings.UPSTREAM_ADAPTIVE,
+    )
+
+
+@functools.lru_cache(maxsize=256)
+def _hostname(url: str) -> str:
+    return urlsplit(url).hostname or ""
+
+
+def _canton_hosts(config: dict) -> set:
+    return {_hostname(config[k]) for k in ("query_url", "wms_url") if config.get(k)}
+
+
+def _strictest(values) -> float | None:
+    limited = [value for value in values if value]
+    return min(limited) if limited else None
+
+
+def _combine(limits: list) -> tuple:
+    concurrency, rate, burst, adaptive = zip(*limits)
+    return (_strictest(concurrency), _strictest(rate), min(burst), adaptive[0])
+
+
+@functools.cache
+def _canton_configs_per_host() -> dict:
+    """Configurations of the cantons using each host, built once."""
+    hosts = {}
+    for config in cantons.CANTONS["cantons_configurations"].values():
+        for host in _canton_hosts(config):
+            hosts.setdefault(host, []).append(config)
+    return hosts
+
+
+def limits_for_host(host: str, config: dict | None = None) -> tuple:
+    """Strictest limits of the cantons using `host` and of `config`."""
+    configs = _canton_configs_per_host().get(host, [])
+    if config is not None:
+        configs = [*configs, config]
+    return _combine([host_limits(c) for c in configs or [None]])
+
+
+def _overloaded(error: Exception) -> bool:
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+
+def get_limiter(host: str, config: dict | None = None) -> HostLimiter:
+    loop = asyncio.get_running_loop()
+    limits = limits_for_host(host, config)
+    entry = _limiters.get(host)
+    if entry is None or entry[0] is not loop:
+        entry = _limiters[host] = (loop, HostLimiter(*limits))
+    elif limits != entry[1].limits:
+        # Only ever tightened, whatever order the configurations come in
+        entry[1].tighten(_combine([entry[1].limits, limits]))
+    return entry[1]
+
+
+@asynccontextmanager
+async def slot(url: str, config: dict | None = None):
+    """
+    Wait until a request to the host of `url` may start. Raise HTTP errors
+    within the block, so that the adaptive limit sees them.
+    """
+    host = _hostname(url)
+    limiter = get_limiter(host, config)
+    if limiter.concurrency is None and limiter.bucket is None:
+        yield
+        return
+
+    request_lane = lane.get()
+    started = time.perf_counter()
+    # Token first: a request waiting for its start time holds no slot
+    if limiter.bucket is not None and await limiter.bucket.acquire(request_lane):
+        metrics.increment("outbound.throttled")
+    # Released where it was acquired, even if the limits change meanwhile
+    concurrency = limiter.concurrency
+    if concurrency is not None:
+        await concurrency.acquire(request_lane)
+    try:
+        waited = time.perf_counter() - started
+        metrics.observe("outbound.wait", waited)
+        metrics.observe(f"outbound.wait.{host}", waited)
+        metrics.observe(f"outbound.wait.{request_lane}", waited)
+
+        adaptive = isinstance(concurrency, AdaptiveLimit)
+        limiter.in_flight += 1
+        fresh_token = http_cache.served_fresh.set(False)
+        request_started = time.perf_counter()
+        try:
+            yield
+        except asyncio.CancelledError:
+            # Given up on (timeout, hedged request): slow, whatever the cause
+            if adaptive:
+                concurrency.record(time.perf_counter() - request_started, True)
+            raise
+        except Exception as e:
+            # Other errors (invalid responses, size limit) say nothing about load
+            if adaptive and _overloaded(e):
+                concurrency.record(time.perf_counter() - request_started, True)
+            raise
+        else:
+            if adaptive and not http_cache.served_fresh.get():
+                concurrency.record(time.perf_counter() - request_started, False)
+        finally:
+            http_cache.served_fresh.reset(fresh_token)
+            limiter.in_flight -= 1
+    finally:
+        if concurrency is not None:
+            concurrency.release(request_lane)
+
+
+def in_flight() -> dict:
+    """Requests in flight per limited host."""
+    hosts = {}
+    for host, (_, limiter) in _limiters.items():
+        if limiter.concurrency is not None or limiter.bucket is not None:
+            hosts[host] = limiter.in_flight
+    return hosts
+
+
+def adaptive_limits() -> dict:
+    """Current adaptive concurrency limit per host."""
+    return {
+        host: round(limiter.concurrency.limit, 2)
+        for host, (_, limiter) in _limiters.items()
+        if isinstance(limiter.concurrency, AdaptiveLimit)
+    }
+
+
+metrics.register_gauge("outbound.in_flight", in_flight)
+metrics.register_gauge("outbound.adaptive_limit", adaptive_limits)
@@ -1,11 +1,23 @@
+import asyncio
+import functools
 import httpx
 import json
+from datetime import UTC, datetime
 import re
 import xml.etree.ElementTree as ET
+from typing import Any
 from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
+from typing_extensions import TypedDict
 import logging
-from owslib.etree import etree
-from ..models.models import GroundCategory
+from ..config import settings
+from . import clients, http_cache, metrics, offload, outbound
+from ..models.models import (
+    CantonContribution,
+    GroundCategory,
+    GroundSuitability,
+    ResultDetail,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -26,12 +38,11 @@ def normalize_string(value: str) -> str:
 
 
 # CANTON LOOKUP (geo.admin.ch)
-async def get_canton_from_coordinates(coord_x: float, coord_y: float):
+async def identify_canton(coord_x: float, coord_y: float) -> list:
     """
-    Query geo.admin.ch to find the canton (AK code) for EPSG:2056 coordinates.
-    Returns: list of dicts (geo.admin.ch "results" array)
+    geo.admin.ch identify results (canton AK code) for EPSG:2056 coordinates.
+    Raises on network, HTTP and JSON errors.
     """
-
     url = "https://api3.geo.admin.ch/rest/services/ech/MapServer/identify"
     params = {
         "geometry": f"{coord_x},{coord_y}",
@@ -42,12 +53,20 @@ async def get_canton_from_coordinates(coord_x: float, coord_y: float):
         "lang": "en",
     }
 
+    client = clients.get_client()
+    async with outbound.slot(url):
+        resp = await client.get(url, params=params, timeout=10.0)
+        resp.raise_for_status()
+    return resp.json().get("results", [])
+
+
+async def get_canton_from_coordinates(coord_x: float, coord_y: float):
+    """
+    Query geo.admin.ch to find the canton (AK code) for EPSG:2056 coordinates.
+    Returns: list of dicts (geo.admin.ch "results" array)
+    """
     try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            resp = await client.get(url, params=params)
-            resp.raise_for_status()
-            payload = resp.json()
-            results = payload.get("results", [])
+        results = await identify_canton(coord_x, coord_y)
     except httpx.RequestError as e:
         logger.error(
             "Network error fetching canton for (%.2f, %.2f): %s", coord_x, coord_y, e
@@ -69,12 +88,192 @@ async def get_canton_from_coordinates(coord_x: float, coord_y: float):
     return results
 
 
+# BOUNDED READS
+class ResponseTooLarge(Exception):
+    """The body of a geoservice response exceeds the size limit of the canton."""
+
+    def __init__(self, url: str, max_bytes: int):
+        super().__init__(f"Response larger than {max_bytes} bytes, read aborted")
+        self.url = url
+
+
+def max_body_size(config: dict) -> int:
+    return config.get("max_body_size") or settings.MAX_RESPONSE_BYTES
+
+
+async def get_bounded(
+    client: httpx.AsyncClient, url: str, params: dict, max_bytes: int
+):
+    """
+    GET with a streamed read of the body, aborted as soon as it exceeds
+    `max_bytes` (or announces it in Content-Length), so that a runaway
+    geoservice cannot make a request hold megabytes of GML.
+
+    Returns the response and its body, the status is not checked. The limit
+    is passed to the HTTP cache, which buffers no more than that.
+    """
+    async with client.stream(
+        "GET",
+        url,
+        params=params,
+        extensions={http_cache.MAX_BYTES_EXTENSION: max_bytes},
+    ) as resp:
+        full_url = str(resp.request.url)
+        length = resp.headers.get("content-length", "")
+        if length.isdigit() and int(length) > max_bytes:
+            raise ResponseTooLarge(full_url, max_bytes)
+
+        body = bytearray()
+        async for chunk in resp.aiter_bytes():
+            body += chunk
+            if len(body) > max_bytes:
+                raise ResponseTooLarge(full_url, max_bytes)
+        return resp, bytes(body)
+
+
+def _too_large(error: ResponseTooLarge) -> dict:
+    logger.error("%s — URL: %s", error, error.url)
+    return {
+        "features": [],
+        "full_url": error.url,
+        "error": str(error),
+        "geoservice_unavailable": True,
+        "too_large": True,
+    }
+
+
 # FETCH WMS OR ESRI FEATURES
+def _unavailable(full_url: str, error_message: str) -> dict:
+    logger.error("%s — URL: %s", error_message, full_url)
+    return {
+        "features": [],
+        "full_url": full_url,
+        "error": error_message,
+        "geoservice_unavailable": True,
+    }
+
+
+async def _fetch_and_parse(
+    client: httpx.AsyncClient, url: str, params: dict, config: dict
+) -> dict:
+    """One upstream request, parsed into a result of fetch_features_for_point."""
+    full_url = ""
+    try:
+        async with outbound.slot(url, config):
+            resp, content = await get_bounded(
+                client, url, params, max_body_size(config)
+            )
+            full_url = str(resp.request.url)
+            resp.raise_for_status()
+    except ResponseTooLarge as e:
+        return _too_large(e)
+    except Exception as e:
+        return _unavailable(full_url or url, f"WMS request failed: {e}")
+
+    try:
+        features = await offload.run(
+            parse_wms_getfeatureinfo,
+            content,
+            config["info_format"],
+            config,
+            size=len(content),
+        )
+    except HTTPException as e:
+        # ESRI REST services answer errors with a non-JSON body
+        if "arcgis" in config["info_format"].lower():
+            return _unavailable(full_url, f"WMS request failed: {e.detail}")
+        # Re-raise genuine internal errors (e.g., invalid JSON/XML from parse_wms_getfeatureinfo)
+        raise
+    except Exception as e:
+        return _unavailable(full_url, f"Failed to parse WMS or ESRI REST response: {e}")
+
+    return {"features": features, "full_url": full_url, "error": None}
+
+
+def _wms_params(coord_x: float, coord_y: float, config: dict, layers: list) -> dict:
+    delta = config["bbox_delta"]
+    width = 101
+    height = 101
+
+    minx, miny = coord_x - delta, coord_y - delta
+    maxx, maxy = coord_x + delta, coord_y + delta
+    bbox = f"{minx},{miny},{maxx},{maxy}"
+
+    layers_list = ",".join([layer["name"] for layer in layers])
+
+    i = int((coord_x - minx) / (maxx - minx) * width)
+    j = int((maxy - coord_y) / (maxy - miny) * height)
+
+    return {
+        "SERVICE": "WMS",
+        "VERSION": "1.3.0",
+        "REQUEST": "GetFeatureInfo",
+        "QUERY_LAYERS": layers_list,
+        "LAYERS": layers_list,
+        "INFO_FORMAT": config.get("info_format", "text/plain"),
+        "I": str(i),
+        "J": str(j),
+        "CRS": "EPSG:2056",
+        "WIDTH": str(width),
+        "HEIGHT": str(height),
+        "BBOX": bbox,
+        "STYLES": config.get("style", ""),
+        "FEATURE_COUNT": config.get("feature_count", 10),
+    }
+
+
+async def _fetch_layers(requests: list, config: dict) -> dict:
+    """
+    Run one request per layer concurrently. As soon as a layer maps to the
+    highest category of the canton, no other layer can change the result:
+    the outstanding requests are cancelled, their responses never parsed,
+    failed layers are ignored, and the deciding layer is reported.
+    """
+    highest = highest_category(config["layers"])
+    tasks = {asyncio.ensure_future(request): layer for layer, request in requests}
+    pending = set(tasks)
+    features = []
+    full_url = ""
+    unavailable = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                result = task.result()
+                if result.get("geoservice_unavailable"):
+                    unavailable = unavailable or result
+                    continue
+
+                layer = tasks[task]
+                features.extend(result["features"])
+                full_url = result["full_url"]
+                mapped_values = []
+                map_layer(layer, result["features"], mapped_values, [])
+                if mapped_values and max(mapped_values) >= highest:
+                    if pending:
+                        metrics.increment("layers.short_circuit")
+                        metrics.increment("layers.cancelled", len(pending))
+                    return {
+                        "features": features,
+                        "full_url": full_url,
+                        "error": None,
+                        "deciding_layer": layer["name"],
+                    }
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return unavailable or {"features": features, "full_url": full_url, "error": None}
+
+
 async def fetch_features_for_point(coord_x: float, coord_y: float, config: dict):
     """
     Fetch features for a coordinate using either:
-      - ESRI REST Feature Service (info_format='arcgis/json'), or
-      - WMS GetFeatureInfo for other formats.
+      - ESRI REST Feature Service (info_format='arcgis/json'), one request per layer, or
+      - WMS GetFeatureInfo for other formats, one request per layer when
+        the canton configuration has "split_layers".
 
     Returns:
         dict: {
@@ -84,157 +283,152 @@ async def fetch_features_for_point(coord_x: float, coord_y: float, config: dict)
         }
     """
     info_format = config["info_format"].lower()
+    client = clients.get_client()
+
+    # ESRI REST
+    if "arcgis" in info_format:
+        if any(layer.get("id") is None for layer in config["layers"]):
+            raise RuntimeError("Layer config missing 'id' for ESRI REST service")
+
+        params = {
+            "geometry": f"{coord_x},{coord_y}",
+            "geometryType": "esriGeometryPoint",
+            "spatialRel": "esriSpatialRelIntersects",
+            "outFields": "*",
+            "returnGeometry": "false",
+            "f": "json",
+        }
+        return await _fetch_layers(
+            [
+                (
+                    layer,
+                    _fetch_and_parse(
+                        client,
+                        f"{config['query_url'].rstrip('/')}/{layer['id']}/query",
+                        params,
+                        config,
+                    ),
+                )
+                for layer in config["layers"]
+            ],
+            config,
+        )
+
+    # WMS GetFeatureInfo
+    query_url = config["query_url"]
+    if config.get("split_layers") and len(config["layers"]) > 1:
+        return await _fetch_layers(
+            [
+                (
+                    layer,
+                    _fetch_and_parse(
+                        client,
+                        query_url,
+                        _wms_params(coord_x, coord_y, config, [layer]),
+                        config,
+                    ),
+                )
+                for layer in config["layers"]
+            ],
+            config,
+        )
+    return await _fetch_and_parse(
+        client,
+        query_url,
+        _wms_params(coord_x, coord_y, config, config["layers"]),
+        config,
+    )
+
+
+# PARSE WMS or REST responses
+class _JsonFeature(TypedDict, total=False):
+    """GeoJSON or ESRI REST feature, the geometry is skipped."""
+
+    properties: dict[str, Any] | None
+    attributes: dict[str, Any] | None
+    layerName: Any
+
+
+class _JsonFeatureCollection(TypedDict, total=False):
+    type: Any
+    features: list[_JsonFeature]
+
+
+@functools.cache
+def _json_features_adapter() -> TypeAdapter:
+    return TypeAdapter(_JsonFeatureCollection)
+
+
+def decode_json_features(content: bytes):
+    """
+    Properties (GeoJSON) or attributes (ESRI REST) of the features, with their
+    layerName, decoded straight from the response bytes. Geometries are never
+    turned into Python objects. None when the body is not UTF-8 JSON of the
+    expected structure.
+    """
+    try:
+        data = _json_features_adapter().validate_json(content)
+    except ValidationError:
+        return None
+
+    key = "properties" if data.get("type") == "FeatureCollection" else "attributes"
     features = []
-    full_url = ""
-    error_message = None
-
-    async with httpx.AsyncClient(timeout=20.0) as client:
-        # ESRI REST
-        if "arcgis" in info_format:
-            for layer in config["layers"]:
-                layer_id = layer.get("id")
-                if layer_id is None:
-                    raise RuntimeError(
-                        "Layer config missing 'id' for ESRI REST service"
-                    )
-
-                esri_url = f"{config['query_url'].rstrip('/')}/{layer_id}/query"
-
-                params = {
-                    "geometry": f"{coord_x},{coord_y}",
-                    "geometryType": "esriGeometryPoint",
-                    "spatialRel": "esriSpatialRelIntersects",
-                    "outFields": "*",
-                    "returnGeometry": "false",
-                    "f": "json",
-                }
-                try:
-                    resp = await client.get(esri_url, params=params)
-                    full_url = str(resp.request.url)
-                    resp.raise_for_status()
-
-                    data = resp.json()
-                    features = data.get("features") or []
-                except Exception as e:
-                    error_message = f"WMS request failed: {e}"
-                    logger.error("%s — URL: %s", error_message, full_url or esri_url)
-                    return {
-                        "features": [],
-                        "full_url": full_url or esri_url,
-                        "error": error_message,
-                        "geoservice_unavailable": True,
-                    }
+    for feature in data.get("features", []):
+        values = feature.get(key) or {}
+        values["layerName"] = feature.get("layerName")
+        features.append(values)
+    return features
 
-        # WMS GetFeatureInfo
-        else:
-            delta = config["bbox_delta"]
-            width = 101
-            height = 101
-
-            minx, miny = coord_x - delta, coord_y - delta
-            maxx, maxy = coord_x + delta, coord_y + delta
-            bbox = f"{minx},{miny},{maxx},{maxy}"
-
-            layers_list = ",".join([layer["name"] for layer in config["layers"]])
-
-            i = int((coord_x - minx) / (maxx - minx) * width)
-            j = int((maxy - coord_y) / (maxy - miny) * height)
-
-            params_wms = {
-                "SERVICE": "WMS",
-                "VERSION": "1.3.0",
-                "REQUEST": "GetFeatureInfo",
-                "QUERY_LAYERS": layers_list,
-                "LAYERS": layers_list,
-                "INFO_FORMAT": config.get("info_format", "text/plain"),
-                "I": str(i),
-                "J": str(j),
-                "CRS": "EPSG:2056",
-                "WIDTH": str(width),
-                "HEIGHT": str(height),
-                "BBOX": bbox,
-                "STYLES": config.get("style", ""),
-                "FEATURE_COUNT": config.get("feature_count", 10),
-            }
-
-            query_url = config["query_url"]
-            try:
-                resp = await client.get(query_url, params=params_wms)
-                full_url = str(resp.request.url)
-                resp.raise_for_status()
-            except Exception as e:
-                error_message = f"WMS request failed: {e}"
-                logger.error("%s — URL: %s", error_message, full_url or query_url)
-                return {
-                    "features": [],
-                    "full_url": full_url or query_url,
-                    "error": error_message,
-                    "geoservice_unavailable": True,
-                }
 
-        try:
-            features = parse_wms_getfeatureinfo(
-                resp.content, config["info_format"], config
-            )
+def _parse_json(text: str):
+    """Generic JSON parsing, for bodies decode_json_features does not handle."""
+    try:
+        data = json.loads(text)
+    except Exception as e:
+        raise HTTPException(500, f"Invalid JSON: {e}")
 
-            return {
-                "features": features,
-                "full_url": full_url,
-                "error": error_message,
-            }
-
-        except HTTPException:
-            # Re-raise genuine internal errors (e.g., invalid JSON/XML from parse_wms_getfeatureinfo)
-            raise
-        except Exception as e:
-            error_message = f"Failed to parse WMS or ESRI REST response: {e}"
-            logger.error("%s — URL: %s", error_message, full_url)
-            return {
-                "features": [],
-                "full_url": full_url,
-                "error": error_message,
-                "geoservice_unavailable": True,
-            }
+    features = []
+    # GeoJSON FeatureCollection
+    if isinstance(data, dict) and data.get("type") == "FeatureCollection":
+        for feature in data.get("features", []):
+            props = feature.get("properties", {})
+            props["layerName"] = feature.get("layerName")
+            if isinstance(props, dict):
+                features.append(props)
+
+    #  ESRI REST JSON
+    elif isinstance(data, dict) and "features" in data:
+        for feature in data["features"]:
+            # ESRI features usually have an "attributes" dict
+            attrs = feature.get("attributes", {})
+            # optionally add layerName if needed
+            attrs["layerName"] = feature.get("layerName")
+            features.append(attrs)
+
+    return features
 
 
-# PARSE WMS or REST responses
 def parse_wms_getfeatureinfo(content: bytes, info_format: str, config: dict):
     """
     Parser for differents geoservices outputs
     """
 
-    text = content.decode("utf-8", errors="ignore")
     info_format = (info_format or "").lower().strip()
 
     # JSON / ESRI REST / GEOJSON PARSING
     if "json" in info_format or "arcgis" in info_format:
-        try:
-            data = json.loads(text)
-        except Exception as e:
-            raise HTTPException(500, f"Invalid JSON: {e}")
-
-        features = []
-        # GeoJSON FeatureCollection
-        if isinstance(data, dict) and data.get("type") == "FeatureCollection":
-            for feature in data.get("features", []):
-                props = feature.get("properties", {})
-                props["layerName"] = feature.get("layerName")
-                if isinstance(props, dict):
-                    features.append(props)
-
-        #  ESRI REST JSON
-        elif isinstance(data, dict) and "features" in data:
-            for feature in data["features"]:
-                # ESRI features usually have an "attributes" dict
-                attrs = feature.get("attributes", {})
-                # optionally add layerName if needed
-                attrs["layerName"] = feature.get("layerName")
-                features.append(attrs)
-
+        features = decode_json_features(content)
+        if features is None:
+            features = _parse_json(content.decode("utf-8", errors="ignore"))
         return features
 
     else:
         # GML / XML PARSING  (OWSLib-compatible)
+        # Imported on first use, keeps owslib and lxml out of the cold start
+        from owslib.etree import etree
+
+        text = content.decode("utf-8", errors="ignore")
+
         try:
             root = etree.fromstring(text.encode("utf-8"))
         except Exception:
@@ -283,6 +477,55 @@ def parse_wms_getfeatureinfo(content: bytes, info_format: str, config: dict):
         return features
 
 
+def map_layer(
+    layer_cfg: dict, ground_features: list, mapped_values: list, source_values: list
+):
+    """
+    Append the harmonized values (and source descriptions) the features map
+    to in one layer, return the last property value found.
+    """
+    property_name = layer_cfg.get("property_name")
+    property_values = layer_cfg.get("property_values")
+
+    property_name_value = None
+
+    for feature in ground_features:
+        # ESRI REST support
+        if isinstance(feature, dict):
+            if "attributes" in feature and isinstance(feature["attributes"], dict):
+                property_name_value = feature["attributes"].get(property_name)
+            else:
+                property_name_value = feature.get(property_name)
+        else:
+            property_name_value = feature
+
+        property_name_value = normalize_string(property_name_value)
+        if property_values:
+            for item in property_values:
+                # Match with values for layers that have a defined mapping
+                if item.get("name") == property_name_value:
+                    mapped_values.append(item.get("target_harmonized_value"))
+                    source_values.append(item.get("desc"))
+
+        # For some cantons, only the presence or absence of feature is used to define suitability
+        else:
+            if layer_cfg.get("property_name") == feature.get("layerName"):
+                mapped_values.append(layer_cfg.get("target_harmonized_value"))
+
+    return property_name_value
+
+
+def highest_category(config_layers: list) -> int:
+    """Highest harmonized value the layers of a canton can map to."""
+    values = []
+    for layer_cfg in config_layers:
+        for item in layer_cfg.get("property_values") or []:
+            values.append(item.get("target_harmonized_value") or 0)
+        if not layer_cfg.get("property_values"):
+            values.append(layer_cfg.get("target_harmonized_value") or 0)
+    return max(values, default=GroundSuitability.FORBIDDEN)
+
+
 def process_ground_category(
     ground_features: list,
     config_layers: list,
@@ -303,41 +546,16 @@ def process_ground_category(
     #  - Each possible value in each layer
     #  - Some geoservices associate one layer to one category. In this case, layer names are compared, not attribute values
     for layer_cfg in config_layers:
-        layer_name = layer_cfg.get("name")
-        property_name = layer_cfg.get("property_name")
-        property_values = layer_cfg.get("property_values")
-
-        property_name_value = None
-
-        for feature in ground_features:
-            # ESRI REST support
-            if isinstance(feature, dict):
-                if "attributes" in feature and isinstance(feature["attributes"], dict):
-                    property_name_value = feature["attributes"].get(property_name)
-                else:
-                    property_name_value = feature.get(property_name)
-            else:
-                property_name_value = feature
-
-            property_name_value = normalize_string(property_name_value)
-            if property_values:
-                for item in property_values:
-                    # Match with values for layers that have a defined mapping
-                    if item.get("name") == property_name_value:
-                        mapped_values.append(item.get("target_harmonized_value"))
-                        source_values.append(item.get("desc"))
-
-            # For some cantons, only the presence or absence of feature is used to define suitability
-            else:
-                if layer_cfg.get("property_name") == feature.get("layerName"):
-                    mapped_values.append(layer_cfg.get("target_harmonized_value"))
+        property_name_value = map_layer(
+            layer_cfg, ground_features, mapped_values, source_values
+        )
 
         # Helping dict useful to identify issues. Only "harmonized_value" is useful for frontend application
         if property_name_value:
             layer_results.append(
                 {
-                    "layer": layer_name,
-                    "property_name": property_name,
+                    "layer": layer_cfg.get("name"),
+                    "property_name": layer_cfg.get("property_name"),
                     "value": property_name_value,
                 }
             )
@@ -348,7 +566,7 @@ def process_ground_category(
 
     # If no value is found, fallback value is = 4
     if not harmonized_value:
-        harmonized_value = 4
+        harmonized_value = GroundSuitability.UNKNOWN
 
     source_values_str = ""
     if source_values:
@@ -359,3 +577,88 @@ def process_ground_category(
         harmonized_value=harmonized_value,
         source_values=source_values_str,
     )
+
+
+def apply_fetch_result(suitability_feature, result: dict, canton_config: dict):
+    """
+    Fill a SuitabilityFeature with the outcome of fetch_features_for_point.
+    """
+
+    # Handle external geoservice unavailability
+    if result.get("geoservice_unavailable"):
+        suitability_feature.ground_category.harmonized_value = (
+            GroundSuitability.GEOSERVICE_UNAVAILABLE
+        )
+        suitability_feature.ground_category.source_values = "geoservice unavailable"
+        # Keep canton_config so the frontend can access cantonal_energy_service_url
+        suitability_feature.result_detail = ResultDetail(
+            message=(
+                "Geoservice response too large"
+                if result.get("too_large")
+                else "External geoservice unavailable"
+            ),
+            full_url=result.get("full_url", ""),
+            detail=result.get("error"),
+        )
+        return suitability_feature
+
+    # Feature(s) found, process to reclassification
+    processed_ground_category = process_ground_category(
+        result["features"],
+        canton_config["layers"],
+    )
+
+    # Fill the model with full data - all process worked for this location
+    suitability_feature.ground_category = processed_ground_category
+    suitability_feature.result_detail = ResultDetail(
+        message="Success",
+        full_url=result["full_url"],
+        detail=result["error"],
+        deciding_layer=result.get("deciding_layer"),
+    )
+    if result.get("stale"):
+        # Last known good result from the cache
+        suitability_feature.result_detail.stale = True
+        suitability_feature.result_detail.cached_at = datetime.fromtimestamp(
+            result["cached_at"], UTC
+        )
+    return suitability_feature
+
+
+def combine_canton_features(canton_features: list):
+    """
+    Combine the results of the cantons sharing a border point.
+
+    Conservative: FORBIDDEN from any canton wins, then a canton that could not
+    be checked (geoservice unavailable, problem), then the most restrictive of
+    WITH_RESTRICTIONS and OK. Cantons without data (unknown, not available,
+    not in Switzerland) never override a category. Each canton result is
+    reported in canton_contributions.
+    """
+
+    def severity(feature):
+        value = feature.ground_category.harmonized_value
+        if value == GroundSuitability.FORBIDDEN:
+            rank = 3
+        elif value in (
+            GroundSuitability.GEOSERVICE_UNAVAILABLE,
+            GroundSuitability.PROBLEM,
+        ):
+            rank = 2
+        elif value < GroundSuitability.FORBIDDEN:
+            rank = 1
+        else:
+            rank = 0
+        return (rank, value)
+
+    combined = max(canton_features, key=severity).model_copy()
+    combined.canton_contributions = [
+        CantonContribution(
+            canton=feature.canton,
+            harmonized_value=feature.ground_category.harmonized_value,
+            source_values=feature.ground_category.source_values,
+            full_url=feature.result_detail.full_url,
+        )
+        for feature in canton_features
+    ]
+    return combined
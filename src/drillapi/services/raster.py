@@ -0,0 +1,315 @@
+"""
+Experimental raster sampling of cantonal WMS GetMap images.
+
+Instead of one GetFeatureInfo request per point, one GetMap image is rendered
+per cluster of points with a categorized style. Every pixel colour is mapped
+to a layer property value through the canton "raster_sampling" colour table,
+and all the points of the cluster are sampled from the decoded image.
+
+Points that fall on a zone edge (antialiased or mixed neighbourhood) or on a
+colour missing from the table are resolved with a regular GetFeatureInfo.
+
+Example of canton configuration:
+
+    "raster_sampling": {
+        "layers": "ju.env_18_03_geothermie_limitation_forages_sondes_geothermiques",
+        "style": "",
+        "format": "image/png",
+        "resolution": 2,
+        "colour_table": [
+            {"rgb": [56, 168, 0], "value": "Autorisé"},
+            {"rgb": [255, 0, 0], "value": "Interdit"},
+        ],
+    }
+"""
+
+import asyncio
+import io
+import logging
+import math
+
+import httpx
+import numpy as np
+from PIL import Image
+
+from ..config import settings
+from ..models.models import GroundCategory, ResultDetail
+from . import cache, clients, offload, outbound, processing
+
+logger = logging.getLogger(__name__)
+
+# Pixel classes that are not an index of the colour table
+UNMATCHED = -1
+EMPTY = -2
+
+MAX_IMAGE_SIZE = 2048
+DEFAULT_RESOLUTION = 2.0
+EDGE_PADDING_PIXELS = 2
+
+# Failures of a GetMap request or of its image, the points fall back to
+# GetFeatureInfo: HTTP errors, images over the size limit of the canton,
+# undecodable images (OSError), unexpected image shapes (ValueError) and a
+# broken parse executor (RuntimeError)
+RASTER_ERRORS = (
+    httpx.HTTPError,
+    processing.ResponseTooLarge,
+    OSError,
+    ValueError,
+    RuntimeError,
+    Image.DecompressionBombError,
+)
+
+
+def cluster_points(points: list, cell_size: float) -> dict:
+    """
+    Group point indexes by square cells of `cell_size` meters.
+    """
+    clusters = {}
+    for index, (coord_x, coord_y) in enumerate(points):
+        key = (math.floor(coord_x / cell_size), math.floor(coord_y / cell_size))
+        clusters.setdefault(key, []).append(index)
+    return clusters
+
+
+def cluster_bbox(xs: np.ndarray, ys: np.ndarray, resolution: float):
+    """
+    Bounding box of a cluster, padded so that every point has a full pixel neighbourhood.
+    Returns (minx, miny, maxx, maxy, width, height).
+    """
+    padding = resolution * EDGE_PADDING_PIXELS
+    minx = math.floor((xs.min() - padding) / resolution) * resolution
+    miny = math.floor((ys.min() - padding) / resolution) * resolution
+    width = math.ceil((xs.max() + padding - minx) / resolution)
+    height = math.ceil((ys.max() + padding - miny) / resolution)
+    return (
+        minx,
+        miny,
+        minx + width * resolution,
+        miny + height * resolution,
+        width,
+        height,
+    )
+
+
+def decode_image(content: bytes) -> np.ndarray:
+    """
+    Decode a GetMap image into an RGBA array of shape (height, width, 4).
+    """
+    with Image.open(io.BytesIO(content)) as image:
+        return np.asarray(image.convert("RGBA"))
+
+
+def classify_pixels(rgba: np.ndarray, colour_table: list) -> np.ndarray:
+    """
+    Map every pixel to the index of its colour in the colour table.
+    Transparent pixels are EMPTY, colours missing from the table are UNMATCHED.
+    """
+    if not colour_table:
+        classes = np.full(rgba.shape[:2], UNMATCHED, dtype=np.int64)
+        classes[rgba[..., 3] == 0] = EMPTY
+        return classes
+
+    rgb = rgba[..., :3].astype(np.int32)
+    packed = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+    table_keys = np.array(
+        [(r << 16) | (g << 8) | b for r, g, b in (e["rgb"] for e in colour_table)],
+        dtype=np.int32,
+    )
+    order = np.argsort(table_keys)
+    sorted_keys = table_keys[order]
+
+    positions = np.searchsorted(sorted_keys, packed)
+    positions = np.clip(positions, 0, len(sorted_keys) - 1)
+    matched = sorted_keys[positions] == packed
+
+    classes = np.where(matched, order[positions], UNMATCHED)
+    classes[rgba[..., 3] == 0] = EMPTY
+    return classes
+
+
+def decode_and_classify(content: bytes, colour_table: list) -> np.ndarray:
+    return classify_pixels(decode_image(content), colour_table)
+
+
+def sample_classes(classes: np.ndarray, xs, ys, bbox, resolution: float):
+    """
+    Sample the pixel class under each point.
+
+    Returns (values, is_edge) arrays. A point is on an edge when the 3x3 pixel
+    neighbourhood around it is not uniform or its colour is not in the table.
+    """
+    minx, _, _, maxy = bbox
+    height, width = classes.shape
+
+    cols = np.clip(((xs - minx) / resolution).astype(np.int64), 0, width - 1)
+    rows = np.clip(((maxy - ys) / resolution).astype(np.int64), 0, height - 1)
+
+    values = classes[rows, cols]
+    is_edge = values == UNMATCHED
+    for d_row in (-1, 0, 1):
+        for d_col in (-1, 0, 1):
+            neighbour = classes[
+                np.clip(rows + d_row, 0, height - 1),
+                np.clip(cols + d_col, 0, width - 1),
+            ]
+            is_edge |= neighbour != values
+    return values, is_edge
+
+
+def pixel_feature(entry: dict, layer_cfg: dict) -> dict:
+    """
+    Build the feature GetFeatureInfo would have returned for a colour table entry.
+    """
+    if layer_cfg.get("property_values"):
+        return {layer_cfg["property_name"]: entry["value"]}
+    # Layer presence only cantons
+    return {"layerName": layer_cfg.get("property_name")}
+
+
+def find_layer(config: dict, entry: dict) -> dict:
+    layer_name = entry.get("layer")
+    for layer_cfg in config["layers"]:
+        if layer_name is None or layer_cfg.get("name") == layer_name:
+            return layer_cfg
+    raise RuntimeError(f"Raster colour table refers to unknown layer '{layer_name}'")
+
+
+async def fetch_getmap(client: httpx.AsyncClient, config: dict, bbox, width, height):
+    """
+    Request a GetMap image for a bounding box. Returns (content, full_url).
+    """
+    raster_cfg = config["raster_sampling"]
+    layers = raster_cfg.get("layers") or ",".join(
+        layer["name"] for layer in config["layers"]
+    )
+    params = {
+        "SERVICE": "WMS",
+        "VERSION": "1.3.0",
+        "REQUEST": "GetMap",
+        "LAYERS": layers,
+        "STYLES": raster_cfg.get("style", ""),
+        "CRS": "EPSG:2056",
+        "BBOX": ",".join(str(v) for v in bbox),
+        "WIDTH": str(width),
+        "HEIGHT": str(height),
+        "FORMAT": raster_cfg.get("format", "image/png"),
+        "TRANSPARENT": "TRUE",
+    }
+    url = config.get("wms_url") or config["query_url"]
+    async with outbound.slot(url, config):
+        resp, content = await processing.get_bounded(
+            client, url, params, processing.max_body_size(config)
+        )
+        resp.raise_for_status()
+    full_url = str(resp.request.url)
+    return content, full_url
+
+
+async def classify_cluster(
+    client: httpx.AsyncClient, points: list, config: dict, features: list
+):
+    """
+    Classify the points of one cluster from a single GetMap image.
+
+    `features` are the SuitabilityFeature of the points, filled in place.
+    Returns the indexes (in `points`) that still need a GetFeatureInfo.
+    """
+    raster_cfg = config["raster_sampling"]
+    colour_table = raster_cfg["colour_table"]
+    resolution = float(raster_cfg.get("resolution", DEFAULT_RESOLUTION))
+
+    xs = np.array([p[0] for p in points], dtype=np.float64)
+    ys = np.array([p[1] for p in points], dtype=np.float64)
+    minx, miny, maxx, maxy, width, height = cluster_bbox(xs, ys, resolution)
+
+    try:
+        content, full_url = await fetch_getmap(
+            client, config, (minx, miny, maxx, maxy), width, height
+        )
+        classes = await offload.run(
+            decode_and_classify, content, colour_table, size=len(content)
+        )
+    except RASTER_ERRORS as e:
+        logger.warning(
+            "Raster sampling failed for canton %s, falling back to GetFeatureInfo: %s",
+            config["name"],
+            e,
+        )
+        return list(range(len(points)))
+
+    values, is_edge = sample_classes(
+        classes, xs, ys, (minx, miny, maxx, maxy), resolution
+    )
+
+    fallback = []
+    for index, (value, edge) in enumerate(zip(values.tolist(), is_edge.tolist())):
+        if edge:
+            fallback.append(index)
+            continue
+
+        if value == EMPTY:
+            ground_features = []
+        else:
+            entry = colour_table[value]
+            ground_features = [pixel_feature(entry, find_layer(config, entry))]
+
+        features[index].ground_category = processing.process_ground_category(
+            ground_features, config["layers"]
+        )
+        features[index].result_detail = ResultDetail(
+            message="Success",
+            full_url=full_url,
+            detail="raster sampling",
+        )
+    return fallback
+
+
+async def classify_points_raster(points: list, config: dict, features: list):
+    """
+    Classify points of a single canton by sampling GetMap images.
+
+    `features` holds one SuitabilityFeature per point and is filled in place.
+    Edge points are resolved with fetch_features_for_point.
+    """
+    raster_cfg = config["raster_sampling"]
+    resolution = float(raster_cfg.get("resolution", DEFAULT_RESOLUTION))
+    cell_size = resolution * (MAX_IMAGE_SIZE - 2 * EDGE_PADDING_PIXELS - 1)
+
+    client = clients.get_client()
+    semaphore = asyncio.Semaphore(settings.BULK_CONCURRENCY)
+
+    async def _classify(indexes):
+        async with semaphore:
+            missing = await classify_cluster(
+                client,
+                [points[i] for i in indexes],
+                config,
+                [features[i] for i in indexes],
+            )
+        return [indexes[i] for i in missing]
+
+    clusters = cluster_points(points, cell_size).values()
+    fallback = [
+        index
+        for missing in await asyncio.gather(*(_classify(c) for c in clusters))
+        for index in missing
+    ]
+
+    if fallback:
+        logger.info(
+            "Raster sampling: %d/%d points of canton %s on zone edges, using GetFeatureInfo",
+            len(fallback),
+            len(points),
+            config["name"],
+        )
+
+    async def _fetch(index):
+        coord_x, coord_y = points[index]
+        async with semaphore:
+            result = await cache.fetch_features_for_point(coord_x, coord_y, config)
+        features[index].ground_category = GroundCategory()
+        processing.apply_fetch_result(features[index], result, config)
+
+    await asyncio.gather(*(_fetch(i) for i in fallback))
+    return features
@@ -0,0 +1,289 @@
+"""
+Shared cache tier on a server speaking the Redis protocol (Redis, Valkey,
+KeyDB, ...), used by the nodes behind a load balancer.
+
+A minimal RESP2 client is included so that no extra dependency is needed.
+When the server cannot be reached the tier behaves as an empty cache for
+REDIS_RETRY_INTERVAL seconds, so requests fall back to the local tiers.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from urllib.parse import urlparse
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RedisError(Exception):
+    """Error reply sent by the server."""
+
+
+def encode_command(args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by the server")
+    kind, data = line[:1], line[1:-2]
+    if kind == b"+":
+        return data.decode("utf-8")
+    if kind == b"-":
+        return RedisError(data.decode("utf-8"))
+    if kind == b":":
+        return int(data)
+    if kind == b"$":
+        length = int(data)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind == b"*":
+        length = int(data)
+        if length < 0:
+            return None
+        return [await read_reply(reader) for _ in range(length)]
+    raise ConnectionError(f"Unexpected reply from the server: {line!r}")
+
+
+async def read_replies(reader: asyncio.StreamReader, count: int) -> list:
+    return [await read_reply(reader) for _ in range(count)]
+
+
+class RedisClient:
+    """
+    Pool of connections to one server, `redis://[:password@]host[:port][/db]`.
+    """
+
+    def __init__(self, url: str, timeout: float = 0.5, max_idle: int = 10):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.strip("/") or 0)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle = []
+        self._loop = None
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        if setup:
+            writer.write(b"".join(encode_command(c) for c in setup))
+            for _ in setup:
+                reply = await read_reply(reader)
+                if isinstance(reply, RedisError):
+                    writer.close()
+                    raise reply
+        return reader, writer
+
+    async def pipeline(self, *commands) -> list:
+        """Send all commands at once and read their replies, in order."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Connections are bound to the event loop that opened them
+            self._idle = []
+            self._loop = loop
+
+        connection = self._idle.pop() if self._idle else None
+        try:
+            if connection is None:
+                connection = await asyncio.wait_for(self._connect(), self.timeout)
+            reader, writer = connection
+            writer.write(b"".join(encode_command(c) for c in commands))
+            replies = await asyncio.wait_for(
+                read_replies(reader, len(commands)), self.timeout
+            )
+        except BaseException:
+            if connection is not None:
+                connection[1].close()
+            raise
+
+        if len(self._idle) < self.max_idle:
+            self._idle.append(connection)
+        else:
+            connection[1].close()
+        return replies
+
+    async def execute(self, *args):
+        reply = (await self.pipeline(args))[0]
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+
+# Deletes the lock only when it still holds our token
+UNLOCK_SCRIPT = (
+    'if redis.call("GET", KEYS[1]) == ARGV[1] then '
+    'return redis.call("DEL", KEYS[1]) else return 0 end'
+)
+
+
+class RedisCache:
+    """Cache tier on a Redis server, keys expire server side."""
+
+    name = "redis"
+
+    def __init__(
+        self,
+        url: str,
+        timeout: float = 0.5,
+        retry_interval: float = 30.0,
+        prefix: str = "drillapi:",
+        generation_interval: float = 1.0,
+    ):
+        self.client = RedisClient(url, timeout)
+        self.retry_interval = retry_interval
+        self.prefix = prefix
+        self._down_until = 0.0
+        self._lock_tokens = {}
+        self.generation_interval = generation_interval
+        self._generation = 0
+        self._generation_read = float("-inf")
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    async def _pipeline(self, *commands):
+        """Replies of the commands, or None when the server is unavailable."""
+        if not self.available:
+            return None
+        try:
+            replies = await self.client.pipeline(*commands)
+        except (OSError, EOFError, TimeoutError, RedisError) as e:
+            logger.warning(
+                "Redis cache unavailable, using local cache for %.0fs: %r",
+                self.retry_interval,
+                e,
+            )
+            metrics.increment("redis.unavailable")
+            self._down_until = time.monotonic() + self.retry_interval
+            return None
+
+        errors = [reply for reply in replies if isinstance(reply, RedisError)]
+        if errors:
+            logger.warning("Redis cache error: %s", errors[0])
+            metrics.increment("redis.error")
+            return None
+        return replies
+
+    async def get(self, key: str):
+        values = await self.get_many([key])
+        return values.get(key)
+
+    async def get_many(self, keys: list) -> dict:
+        commands = [
+            ("MGET", *(self.prefix + key for key in keys[start : start + 500]))
+            for start in range(0, len(keys), 500)
+        ]
+        replies = await self._pipeline(*commands) if commands else None
+        if replies is None:
+            return {}
+        values = {}
+        raw_values = [value for reply in replies for value in reply]
+        for key, raw in zip(keys, raw_values):
+            if raw is not None:
+                values[key] = json.loads(raw)
+        return values
+
+    async def set(self, key, value, ttl: float, canton: str, version: str):
+        await self._pipeline(
+            (
+                "SET",
+                self.prefix + key,
+                json.dumps(value),
+                "PX",
+                max(int(ttl * 1000), 1),
+            )
+        )
+
+    async def purge(self, canton: str | None = None, version: str | None = None) -> int:
+        """Delete the entries of a canton and/or a config version (SCAN + DEL)."""
+        pattern = f"{self.prefix}*:{canton or '*'}:{version or '*'}:*"
+        removed = 0
+        cursor = b"0"
+        while True:
+            replies = await self._pipeline(
+                ("SCAN", cursor, "MATCH", pattern, "COUNT", 1000)
+            )
+            if replies is None:
+                return removed
+            cursor, keys = replies[0]
+            if keys:
+                replies = await self._pipeline(("DEL", *keys))
+                removed += replies[0] if replies else 0
+            if cursor in (b"0", "0"):
+                return removed
+
+    async def generation(self) -> int:
+        """
+        Purge generation, read from the server at most every
+        `generation_interval` seconds, not on each memory tier hit.
+        """
+        if time.monotonic() - self._generation_read < self.generation_interval:
+            return self._generation
+        replies = await self._pipeline(("GET", f"{self.prefix}generation"))
+        if replies is not None:
+            self._generation = int(replies[0] or 0)
+            self._generation_read = time.monotonic()
+        return self._generation
+
+    async def bump_generation(self):
+        replies = await self._pipeline(("INCR", f"{self.prefix}generation"))
+        if replies is not None:
+            self._generation = replies[0]
+            self._generation_read = time.monotonic()
+
+    async def lock(self, key: str, ttl: float) -> bool:
+        """
+        Take the in-flight lock of a key for `ttl` seconds. Also True when the
+        server is unavailable, each node then fetches on its own.
+        """
+        token = uuid.uuid4().hex
+        replies = await self._pipeline(
+            (
+                "SET",
+                f"{self.prefix}lock:{key}",
+                token,
+                "NX",
+                "PX",
+                max(int(ttl * 1000), 1),
+            )
+        )
+        if replies is None:
+            return True
+        if replies[0] is None:
+            return False
+        self._lock_tokens[key] = token
+        return True
+
+    async def locked(self, key: str) -> bool:
+        """Whether a node holds the in-flight lock of a key."""
+        replies = await self._pipeline(("GET", f"{self.prefix}lock:{key}"))
+        return bool(replies and replies[0] is not None)
+
+    async def unlock(self, key: str):
+        token = self._lock_tokens.pop(key, None)
+        if token is None:
+            return
+        # Only release our own lock, it may have expired and been taken since.
+        # Compared and deleted in one script, atomically on the server
+        await self._pipeline(
+            ("EVAL", UNLOCK_SCRIPT, 1, f"{self.prefix}lock:{key}", token)
+        )
@@ -0,0 +1,54 @@
+"""
+Fast JSON responses for drill categories.
+
+FastAPI validates the returned model again against ``response_model`` and
+encodes it through ``jsonable_encoder`` and ``json.dumps``. Features are built
+by the service itself, so they are serialized directly to bytes by the
+pydantic-core serializer instead, with the same output. The ``canton_config``
+dict, the largest part of a response and the same for every point of a
+canton, is serialized once per config version and spliced in.
+"""
+
+from fastapi import Response
+from pydantic_core import to_json
+
+from ..models.models import SuitabilityFeature
+from . import cache
+
+# Key following canton_config in SuitabilityFeature, the fragment goes before it
+_NEXT_KEY = b',"ground_category":'
+
+# One entry per canton config version, a few dozens
+_fragments = {}
+
+
+def canton_config_json(canton_config) -> bytes:
+    if canton_config is None:
+        return b"null"
+    version = cache.config_version(canton_config)
+    fragment = _fragments.get(version)
+    if fragment is None:
+        fragment = _fragments[version] = to_json(canton_config)
+    return fragment
+
+
+def feature_json(feature: SuitabilityFeature) -> bytes:
+    """Same bytes as ``feature.model_dump_json()``."""
+    body = SuitabilityFeature.__pydantic_serializer__.to_json(
+        feature, exclude={"canton_config"}
+    )
+    index = body.index(_NEXT_KEY)
+    return (
+        body[:index]
+        + b',"canton_config":'
+        + canton_config_json(feature.canton_config)
+        + body[index:]
+    )
+
+
+def json_response(body: bytes, headers=None) -> Response:
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def features_json(features) -> bytes:
+    return b"[" + b",".join(feature_json(feature) for feature in features) + b"]"
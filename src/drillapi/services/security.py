@@ -1,12 +1,31 @@
+import functools
+
 from fastapi import Request, HTTPException, status
+from limits import parse
 from slowapi import Limiter
 from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
+from starlette.requests import HTTPConnection
 
 # Limiter
 limiter = Limiter(key_func=get_remote_address)
 
 
+@functools.lru_cache(maxsize=16)
+def _parse(limit: str):
+    return parse(limit)
+
+
+def hit(connection: HTTPConnection, limit: str, scope: str) -> bool:
+    """
+    Count one call of `scope` against `limit` for the client address, in the
+    storage of `limiter`. False once the limit is exceeded.
+    """
+    if not limiter.enabled:
+        return True
+    return limiter.limiter.hit(_parse(limit), scope, get_remote_address(connection))
+
+
 # Rate limit handler
 async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
     raise HTTPException(
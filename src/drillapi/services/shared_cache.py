@@ -0,0 +1,266 @@
+"""
+Result cache tier in a shared memory segment, read and written by all the
+uvicorn workers of a host (`--workers N`) without any external service.
+
+Layout of the segment:
+- header: magic, layout and the version of the canton registry
+  (cantons.CANTONS) the cached results were computed with
+- the purge generation, incremented by each purge
+- a fixed-size open-addressing hash table (linear probing) of results
+
+There is no lock between processes. Each slot carries a sequence number
+(odd while being written) and a CRC32 of its payload, readers treat a slot
+changing under them or failing the checksum as a miss.
+The segment name includes the registry version, so workers started with
+another canton configuration use another segment.
+
+Every attached process holds a shared flock on the segment. The last one to
+close it, at shutdown, removes it from /dev/shm. Locks of crashed workers are
+released by the kernel.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from multiprocessing import resource_tracker, shared_memory
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"DRILLSHM"
+# magic, slots, slot size, registry version
+HEADER = struct.Struct("<8sII16s")
+# purge generation
+GENERATION = struct.Struct("<Q")
+# sequence, key hash, expires, payload length, payload CRC32
+SLOT_HEADER = struct.Struct("<IQdII")
+MAX_PROBES = 8
+
+
+def registry_version(registry: dict) -> str:
+    dump = json.dumps(registry, sort_keys=True, default=str)
+    return hashlib.sha256(dump.encode("utf-8")).hexdigest()[:16]
+
+
+def key_hash(key: bytes) -> int:
+    # 0 marks an empty slot
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little") or 1
+
+
+def _open_segment(name: str, size: int):
+    """Create the segment, or attach to it. Returns (segment, created)."""
+    while True:
+        try:
+            segment = shared_memory.SharedMemory(name, create=True, size=size)
+            created = True
+        except FileExistsError:
+            segment = shared_memory.SharedMemory(name)
+            created = False
+        # The segment must outlive the worker that created it, workers are
+        # restarted independently
+        resource_tracker.unregister(segment._name, "shared_memory")
+        fcntl.flock(segment._fd, fcntl.LOCK_SH)
+        if os.fstat(segment._fd).st_nlink:
+            return segment, created
+        # Removed by the last worker shutting down meanwhile
+        segment.close()
+
+
+class SharedMemoryCache:
+    """Cache tier in a shared memory hash table of `slots` slots."""
+
+    name = "shm"
+
+    def __init__(
+        self, name: str, registry: dict, slots: int = 16384, slot_size: int = 2048
+    ):
+        self.version = registry_version(registry)
+        self.slots = slots
+        self.slot_size = slot_size
+        self.segment_name = f"{name}-{self.version}"
+        self.table_offset = HEADER.size + GENERATION.size
+        size = self.table_offset + slots * slot_size
+
+        self.segment, created = _open_segment(self.segment_name, size)
+        self.buf = self.segment.buf
+        if created:
+            HEADER.pack_into(
+                self.buf,
+                0,
+                MAGIC,
+                self.slots,
+                self.slot_size,
+                self.version.encode("ascii"),
+            )
+            self.ready = True
+        else:
+            self.ready = self._check_header()
+
+    def _check_header(self) -> bool:
+        """
+        False while the worker creating the segment has not written the
+        header yet, checked again on next use instead of waiting for it.
+        """
+        magic, slots, slot_size, version = HEADER.unpack_from(self.buf, 0)
+        if magic != MAGIC:
+            return False
+        if (slots, slot_size, version) != (
+            self.slots,
+            self.slot_size,
+            self.version.encode("ascii"),
+        ):
+            raise ValueError(
+                f"Shared memory segment {self.segment_name} has another layout"
+            )
+        return True
+
+    def _usable(self) -> bool:
+        if not self.ready:
+            self.ready = self._check_header()
+        return self.ready
+
+    def _slot_offset(self, index: int) -> int:
+        return self.table_offset + (index % self.slots) * self.slot_size
+
+    def _read(self, offset: int):
+        """Header and payload of a slot, or None when it is being written."""
+        header = SLOT_HEADER.unpack_from(self.buf, offset)
+        sequence, _, _, length, crc = header
+        if sequence & 1 or length > self.slot_size - SLOT_HEADER.size:
+            return None
+        start = offset + SLOT_HEADER.size
+        payload = bytes(self.buf[start : start + length])
+        if (
+            SLOT_HEADER.unpack_from(self.buf, offset)[0] != sequence
+            or zlib.crc32(payload) != crc
+        ):
+            metrics.increment("shared_cache.torn_read")
+            return None
+        return header, payload
+
+    async def get(self, key: str):
+        if not self._usable():
+            return None
+        encoded = key.encode("utf-8")
+        wanted = key_hash(encoded)
+        now = time.time()
+        for probe in range(MAX_PROBES):
+            offset = self._slot_offset(wanted + probe)
+            _, slot_hash, _, _, _ = SLOT_HEADER.unpack_from(self.buf, offset)
+            if slot_hash == 0:
+                return None
+            if slot_hash != wanted:
+                continue
+            slot = self._read(offset)
+            if slot is None:
+                return None
+            (_, _, expires, _, _), payload = slot
+            slot_key, _, data = payload.partition(b"\0")
+            if slot_key != encoded:
+                continue
+            return json.loads(data) if expires >= now else None
+        return None
+
+    async def get_many(self, keys: list) -> dict:
+        values = {}
+        for key in keys:
+            value = await self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    async def set(self, key, value, ttl: float, canton: str, version: str):
+        encoded = key.encode("utf-8")
+        payload = encoded + b"\0" + json.dumps(value).encode("utf-8")
+        if len(payload) > self.slot_size - SLOT_HEADER.size:
+            metrics.increment("shared_cache.too_large")
+            return
+        if not self._usable():
+            return
+        wanted = key_hash(encoded)
+        self._write(self._choose_slot(wanted), wanted, time.time() + ttl, payload)
+
+    def _choose_slot(self, wanted: int) -> int:
+        """Same key, else an empty slot, else the slot expiring first."""
+        now = time.time()
+        chosen = None
+        chosen_expires = None
+        for probe in range(MAX_PROBES):
+            offset = self._slot_offset(wanted + probe)
+            _, slot_hash, expires, _, _ = SLOT_HEADER.unpack_from(self.buf, offset)
+            if slot_hash in (0, wanted) or expires < now:
+                return offset
+            if chosen is None or expires < chosen_expires:
+                chosen, chosen_expires = offset, expires
+        return chosen
+
+    def _write(self, offset: int, slot_hash: int, expires: float, payload: bytes):
+        sequence = SLOT_HEADER.unpack_from(self.buf, offset)[0]
+        # Odd sequence: readers skip the slot until the write is complete
+        struct.pack_into("<I", self.buf, offset, sequence | 1)
+        start = offset + SLOT_HEADER.size
+        self.buf[start : start + len(payload)] = payload
+        SLOT_HEADER.pack_into(
+            self.buf,
+            offset,
+            ((sequence | 1) + 1) & 0xFFFFFFFF,
+            slot_hash,
+            expires,
+            len(payload),
+            zlib.crc32(payload),
+        )
+
+    async def purge(self, canton: str | None = None, version: str | None = None) -> int:
+        """Expire the entries of a canton and/or a config version."""
+        if not self._usable():
+            return 0
+        removed = 0
+        for index in range(self.slots):
+            offset = self._slot_offset(index)
+            slot = self._read(offset)
+            if slot is None or slot[0][1] == 0 or slot[0][2] < time.time():
+                continue
+            (_, slot_hash, _, _, _), payload = slot
+            parts = payload.partition(b"\0")[0].decode("utf-8").split(":")
+            if (canton is None or parts[1] == canton) and (
+                version is None or parts[2] == version
+            ):
+                # Keep the key hash so that probe chains stay intact
+                self._write(offset, slot_hash, 0.0, payload)
+                removed += 1
+        return removed
+
+    async def generation(self) -> int:
+        if not self._usable():
+            return 0
+        return GENERATION.unpack_from(self.buf, HEADER.size)[0]
+
+    async def bump_generation(self):
+        # Not atomic between processes: concurrent purges may increment it
+        # once, it still changes for the readers
+        if self._usable():
+            generation = GENERATION.unpack_from(self.buf, HEADER.size)[0]
+            GENERATION.pack_into(self.buf, HEADER.size, generation + 1)
+
+    def close(self):
+        """Detach from the segment, and remove it when no other process uses it."""
+        self.buf = None
+        try:
+            fcntl.flock(self.segment._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Still used by other workers
+            pass
+        else:
+            self.unlink()
+        self.segment.close()
+
+    def unlink(self):
+        # unlink() unregisters the segment from the resource tracker
+        resource_tracker.register(self.segment._name, "shared_memory")
+        self.segment.unlink()
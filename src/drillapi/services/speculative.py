@@ -0,0 +1,103 @@
+"""
+Speculative cantonal fetch.
+
+The canton of a point is guessed from a cheap local source and the cantonal
+request is started while geo.admin.ch identify is still running. The
+speculative result is only used when identify confirms the guessed canton,
+so the latency of the common path is max(identify, fetch) instead of the sum.
+"""
+
+import asyncio
+import logging
+from typing import NamedTuple
+
+from drillapi.cantons_configuration import cantons
+
+from ..config import settings
+from . import cache
+from .canton_grid import canton_grid
+
+logger = logging.getLogger(__name__)
+
+
+class Speculation(NamedTuple):
+    canton: str
+    task: asyncio.Task
+
+
+def guess_canton(coord_x: float, coord_y: float):
+    """
+    Canton guessed from previously identified grid cells, then from the
+    canton polygons when CANTON_BOUNDARIES_PATH is configured.
+    """
+    code = canton_grid.guess(coord_x, coord_y)
+    if code is None and settings.CANTON_BOUNDARIES_PATH:
+        from .canton_assignment import load_canton_assigner
+
+        assigner = load_canton_assigner(
+            str(settings.CANTON_BOUNDARIES_PATH), settings.CANTON_BORDER_TOLERANCE
+        )
+        codes, ambiguous = assigner.assign([coord_x], [coord_y])
+        code = None if ambiguous[0] else codes[0]
+    return code
+
+
+def start(coord_x: float, coord_y: float):
+    """
+    Start fetching the features of the guessed canton. Returns a Speculation or None.
+    """
+    if not settings.SPECULATIVE_FETCH:
+        return None
+
+    code = guess_canton(coord_x, coord_y)
+    canton_config = cantons.CANTONS["cantons_configurations"].get(code)
+    if not canton_config or not canton_config.get("active"):
+        return None
+
+    logger.debug("Speculative fetch for canton %s at (%s, %s)", code, coord_x, coord_y)
+    task = asyncio.create_task(
+        cache.fetch_features_for_point(coord_x, coord_y, canton_config)
+    )
+    # Discarded speculations must not log "exception was never retrieved"
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return Speculation(code, task)
+
+
+def observe(coord_x: float, coord_y: float, code_canton: str):
+    """Record the canton confirmed by geo.admin.ch for later guesses."""
+    if settings.SPECULATIVE_FETCH:
+        canton_grid.observe(coord_x, coord_y, code_canton)
+
+
+def confirm(speculation, codes: list):
+    """
+    Keep the speculation when identify returned its canton, cancel it otherwise.
+    """
+    if speculation is None or speculation.canton in codes:
+        return speculation
+
+    logger.debug(
+        "Speculative fetch missed: guessed %s, identified %s",
+        speculation.canton,
+        codes,
+    )
+    cancel(speculation)
+    return None
+
+
+async def fetch_features_for_point(
+    speculation, coord_x: float, coord_y: float, code_canton: str, config: dict
+):
+    """
+    Speculative result for the guessed canton, otherwise a regular fetch.
+    """
+    if speculation is not None and speculation.canton == code_canton:
+        return await speculation.task
+
+    return await cache.fetch_features_for_point(coord_x, coord_y, config)
+
+
+def cancel(speculation):
+    """Cancel a speculative fetch that is no longer needed (no-op when done)."""
+    if speculation is not None:
+        speculation.task.cancel()
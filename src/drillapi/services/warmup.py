@@ -0,0 +1,109 @@
+"""
+Startup warm-up, run in the background by the application lifespan.
+
+The host names of geo.admin.ch and of every active cantonal geoservice are
+resolved and a keep-alive connection is opened to each of them in parallel,
+so the first request to a canton after a deploy does not pay for DNS, TCP
+and TLS. Optionally, one ground control point per canton is queried to prime
+the caches. /ready reports the outcome once it is done or timed out.
+"""
+
+import asyncio
+import logging
+import time
+from urllib.parse import urlparse
+
+import httpx
+
+from drillapi.cantons_configuration import cantons
+
+from ..config import settings
+from . import cache, clients
+
+logger = logging.getLogger(__name__)
+
+GEOADMIN_URL = "https://api3.geo.admin.ch/rest/services/ech/MapServer/identify"
+
+state = {"ready": False, "timed_out": False, "duration": None, "hosts": {}}
+
+
+def warmup_urls() -> list:
+    """One URL per host: geo.admin.ch and active cantonal geoservices."""
+    urls = {urlparse(GEOADMIN_URL).netloc: GEOADMIN_URL}
+    for config in cantons.CANTONS["cantons_configurations"].values():
+        url = config.get("query_url")
+        if config.get("active") and url:
+            urls.setdefault(urlparse(url).netloc, url)
+    return list(urls.values())
+
+
+async def resolve_host(host: str, port: int):
+    return await asyncio.get_running_loop().getaddrinfo(host, port)
+
+
+async def warm_host(url: str):
+    """Resolve the host and open a keep-alive connection to it."""
+    parsed = urlparse(url)
+    host = parsed.hostname
+    port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    try:
+        await resolve_host(host, port)
+        # Any answer leaves an open connection in the pool
+        await clients.get_client().head(url, timeout=settings.WARMUP_TIMEOUT)
+        state["hosts"][host] = "ok"
+    except (OSError, httpx.HTTPError) as e:
+        # DNS failures are OSError (socket.gaierror)
+        logger.warning("Warm-up of %s failed: %r", host, e)
+        state["hosts"][host] = f"error: {e!r}"
+    except Exception as e:
+        # Invalid URL or configuration, the other hosts are still warmed up
+        logger.exception("Warm-up of %s failed", url)
+        state["hosts"][host or url] = f"error: {e!r}"
+
+
+async def prime_caches():
+    """Query the first ground control point of every active canton."""
+
+    async def _prime(config):
+        points = config.get("ground_control_point") or []
+        if points:
+            await cache.fetch_features_for_point(points[0][0], points[0][1], config)
+
+    await asyncio.gather(
+        *(
+            _prime(config)
+            for config in cantons.CANTONS["cantons_configurations"].values()
+            if config.get("active")
+        ),
+        return_exceptions=True,
+    )
+
+
+async def warm_up():
+    started = time.monotonic()
+    state.update(ready=False, timed_out=False, duration=None, hosts={})
+
+    async def _run():
+        await asyncio.gather(*(warm_host(url) for url in warmup_urls()))
+        if settings.WARMUP_GROUND_CONTROL_POINTS:
+            await prime_caches()
+
+    try:
+        await asyncio.wait_for(_run(), settings.WARMUP_TIMEOUT)
+    except TimeoutError:
+        logger.warning("Warm-up timed out after %.1fs", settings.WARMUP_TIMEOUT)
+        state["timed_out"] = True
+    except Exception:
+        logger.exception("Warm-up failed")
+    finally:
+        # Never keeps the instance out of rotation
+        state["duration"] = round(time.monotonic() - started, 3)
+        state["ready"] = True
+    logger.info(
+        "Warm-up done in %.2fs, %d hosts", state["duration"], len(state["hosts"])
+    )
+
+
+def mark_ready():
+    """Ready without warm-up (WARMUP_ENABLED=false)."""
+    state.update(ready=True, timed_out=False, duration=0.0, hosts={})
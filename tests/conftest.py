@@ -1,8 +1,13 @@
+import httpx
 import pytest
+import respx
 from fastapi.testclient import TestClient
 from drillapi.config import settings, Settings
 from drillapi.app import app
 
+IDENTIFY_URL = "https://api3.geo.admin.ch/rest/services/ech/MapServer/identify"
+JU_WMS_URL = "https://geoservices.jura.ch/wms"
+
 
 @pytest.fixture(autouse=True, scope="session")
 def override_global_settings():
@@ -10,6 +15,7 @@ def override_global_settings():
         RATE_LIMIT="100/min",
         ALLOWED_ORIGINS=["*"],
         ENVIRONMENT="TEST",
+        WARMUP_ENABLED=False,
     )
 
     for key, value in test_settings.model_dump().items():
@@ -21,3 +27,28 @@ def override_global_settings():
 @pytest.fixture(scope="session")
 def client():
     return TestClient(app)
+
+
+@pytest.fixture(scope="session")
+def ju_gml():
+    """GetFeatureInfo response (GML) of the Jura geoservice, category "Autorisé"."""
+    with open("tests/data/wms/getfeatureinfo_ju.gml", "rb") as f:
+        return f.read()
+
+
+@pytest.fixture
+def mock_ju(ju_gml):
+    """
+    geo.admin.ch identify answering JU and the Jura GetFeatureInfo, yields
+    the respx router with the "identify" and "wms" routes.
+    """
+    with respx.mock(assert_all_called=False) as mock:
+        mock.get(IDENTIFY_URL, name="identify").mock(
+            return_value=httpx.Response(
+                200, json={"results": [{"attributes": {"ak": "JU"}}]}
+            )
+        )
+        mock.get(JU_WMS_URL, name="wms").mock(
+            return_value=httpx.Response(200, content=ju_gml)
+        )
+        yield mock
@@ -0,0 +1,281 @@
+"""Tests for the experimental bulk classification.
+
+Covers:
+- /v1/drill-category/bulk per-point GetFeatureInfo path
+- /v1/drill-category/bulk with too many points
+- raster sampling of GetMap images, with GetFeatureInfo fallback on zone edges
+- raster sampling with an empty colour table falls back to GetFeatureInfo
+- GetMap images over the size limit of the canton fall back to GetFeatureInfo
+- the GetMap images of the clusters are fetched concurrently
+- browsers may POST to the bulk route (CORS preflight)
+"""
+
+import asyncio
+import io
+import logging
+
+import httpx
+import pytest
+import respx
+from conftest import IDENTIFY_URL, JU_WMS_URL
+
+from drillapi.cantons_configuration import cantons
+from drillapi.config import settings
+from drillapi.services import bulk
+
+# Synthetic canton: left of x=2600000 is allowed (green), right is forbidden (red)
+BORDER_X = 2600000
+GREEN = (0, 200, 0)
+RED = (230, 0, 0)
+
+RASTER_CANTON = {
+    "active": True,
+    "name": "RS",
+    "ground_control_point": [],
+    "wms_url": "https://raster.example.ch/wms",
+    "query_url": "https://raster.example.ch/wms",
+    "info_format": "application/json",
+    "bbox_delta": 10,
+    "style": "",
+    "raster_sampling": {
+        "resolution": 2,
+        "colour_table": [
+            {"rgb": list(GREEN), "value": "OK"},
+            {"rgb": list(RED), "value": "Forbidden"},
+        ],
+    },
+    "layers": [
+        {
+            "name": "suitability",
+            "property_name": "category",
+            "property_values": [
+                {"name": "OK", "desc": "OK", "target_harmonized_value": 1},
+                {
+                    "name": "Forbidden",
+                    "desc": "Forbidden",
+                    "target_harmonized_value": 3,
+                },
+            ],
+        }
+    ],
+}
+
+
+def _mock_canton_identify(canton_code: str):
+    canton_response = {"results": [{"attributes": {"ak": canton_code}}]}
+    respx.get(IDENTIFY_URL).mock(return_value=httpx.Response(200, json=canton_response))
+
+
+def _render_getmap(request: httpx.Request) -> httpx.Response:
+    """Render a two-zone PNG for the requested bbox, like a categorized WMS style."""
+    np = pytest.importorskip("numpy")
+    from PIL import Image
+
+    params = request.url.params
+    minx, _, maxx, _ = (float(v) for v in params["BBOX"].split(","))
+    width, height = int(params["WIDTH"]), int(params["HEIGHT"])
+
+    xs = minx + (np.arange(width) + 0.5) * (maxx - minx) / width
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+    image[:, xs < BORDER_X, :3] = GREEN
+    image[:, xs >= BORDER_X, :3] = RED
+    image[..., 3] = 255
+
+    buffer = io.BytesIO()
+    Image.fromarray(image, "RGBA").save(buffer, format="PNG")
+    return httpx.Response(200, content=buffer.getvalue())
+
+
+def _raster_wms(request: httpx.Request) -> httpx.Response:
+    if request.url.params["REQUEST"] == "GetMap":
+        return _render_getmap(request)
+    # GetFeatureInfo fallback
+    return httpx.Response(
+        200,
+        json={
+            "type": "FeatureCollection",
+            "features": [{"properties": {"category": "Forbidden"}}],
+        },
+    )
+
+
+@respx.mock
+def test_bulk_getfeatureinfo_path(client, ju_gml):
+    """Cantons without raster sampling are queried point by point."""
+    _mock_canton_identify("JU")
+
+    respx.get(JU_WMS_URL).mock(return_value=httpx.Response(200, content=ju_gml))
+
+    response = client.post(
+        "/v1/drill-category/bulk",
+        json={
+            "points": [
+                {"coord_x": 2574738, "coord_y": 1249285},
+                {"coord_x": 2574740, "coord_y": 1249290},
+            ]
+        },
+    )
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert len(payload) == 2
+    assert [p["canton"] for p in payload] == ["JU", "JU"]
+    assert [p["ground_category"]["harmonized_value"] for p in payload] == [1, 1]
+    assert payload[1]["coord_x"] == 2574740
+
+
+def test_bulk_too_many_points(client, monkeypatch):
+    """More than BULK_MAX_POINTS points are rejected."""
+    monkeypatch.setattr(settings, "BULK_MAX_POINTS", 1)
+
+    response = client.post(
+        "/v1/drill-category/bulk",
+        json={"points": [{"coord_x": 2600001, "coord_y": 1200000}] * 2},
+    )
+    assert response.status_code == 413
+
+
+def test_bulk_cors_preflight(client):
+    response = client.options(
+        "/v1/drill-category/bulk",
+        headers={
+            "Origin": "http://localhost:5173",
+            "Access-Control-Request-Method": "POST",
+        },
+    )
+    assert response.status_code == 200
+    assert "POST" in response.headers["access-control-allow-methods"]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_raster_sampling_with_edge_fallback(monkeypatch):
+    """Points are sampled from one GetMap image, edge points use GetFeatureInfo."""
+    pytest.importorskip("numpy")
+    pytest.importorskip("PIL")
+
+    monkeypatch.setattr(settings, "BULK_RASTER_SAMPLING", True)
+    monkeypatch.setitem(cantons.CANTONS["cantons_configurations"], "RS", RASTER_CANTON)
+    _mock_canton_identify("RS")
+    wms = respx.get("https://raster.example.ch/wms").mock(side_effect=_raster_wms)
+
+    points = [
+        (BORDER_X - 500, 1200000),
+        (BORDER_X + 500, 1200000),
+        (BORDER_X - 300, 1200100),
+        (BORDER_X + 0.5, 1200050),  # on the zone edge
+    ]
+
+    features = await bulk.classify_points(points)
+
+    values = [f.ground_category.harmonized_value for f in features]
+    assert values == [1, 3, 1, 3]
+    assert [f.result_detail.detail for f in features[:3]] == ["raster sampling"] * 3
+
+    requests = [call.request.url.params["REQUEST"] for call in wms.calls]
+    assert requests.count("GetMap") == 1
+    assert requests.count("GetFeatureInfo") == 1
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_raster_sampling_getmap_failure_falls_back(monkeypatch):
+    """When GetMap fails, every point is resolved with GetFeatureInfo."""
+    pytest.importorskip("numpy")
+    pytest.importorskip("PIL")
+
+    monkeypatch.setattr(settings, "BULK_RASTER_SAMPLING", True)
+    monkeypatch.setitem(cantons.CANTONS["cantons_configurations"], "RS", RASTER_CANTON)
+    _mock_canton_identify("RS")
+
+    def _broken_getmap(request):
+        if request.url.params["REQUEST"] == "GetMap":
+            return httpx.Response(500)
+        return _raster_wms(request)
+
+    wms = respx.get("https://raster.example.ch/wms").mock(side_effect=_broken_getmap)
+
+    features = await bulk.classify_points([(BORDER_X - 500, 1200000)])
+
+    assert features[0].ground_category.harmonized_value == 3
+    assert wms.call_count == 2
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_raster_sampling_empty_colour_table(monkeypatch):
+    """No colour matches an empty table, points use GetFeatureInfo."""
+    np = pytest.importorskip("numpy")
+    pytest.importorskip("PIL")
+    from drillapi.services import raster
+
+    opaque = np.full((2, 2, 4), 255, dtype=np.uint8)
+    assert (raster.classify_pixels(opaque, []) == raster.UNMATCHED).all()
+
+    config = {
+        **RASTER_CANTON,
+        "raster_sampling": {**RASTER_CANTON["raster_sampling"], "colour_table": []},
+    }
+    monkeypatch.setattr(settings, "BULK_RASTER_SAMPLING", True)
+    monkeypatch.setitem(cantons.CANTONS["cantons_configurations"], "RS", config)
+    _mock_canton_identify("RS")
+    wms = respx.get("https://raster.example.ch/wms").mock(side_effect=_raster_wms)
+
+    features = await bulk.classify_points([(BORDER_X - 500, 1200000)])
+
+    assert features[0].ground_category.harmonized_value == 3
+    requests = [call.request.url.params["REQUEST"] for call in wms.calls]
+    assert requests == ["GetMap", "GetFeatureInfo"]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_raster_sampling_size_limit(monkeypatch, caplog):
+    """GetMap reads are bounded by max_body_size like every other upstream call."""
+    pytest.importorskip("numpy")
+    pytest.importorskip("PIL")
+
+    config = {**RASTER_CANTON, "max_body_size": 1000}
+    monkeypatch.setattr(settings, "BULK_RASTER_SAMPLING", True)
+    monkeypatch.setitem(cantons.CANTONS["cantons_configurations"], "RS", config)
+    _mock_canton_identify("RS")
+
+    def _huge_getmap(request):
+        if request.url.params["REQUEST"] == "GetMap":
+            return httpx.Response(200, content=b"\x89PNG" + b"\0" * 5000)
+        return _raster_wms(request)
+
+    respx.get("https://raster.example.ch/wms").mock(side_effect=_huge_getmap)
+
+    with caplog.at_level(logging.WARNING, logger="drillapi.services.raster"):
+        features = await bulk.classify_points([(BORDER_X - 500, 1200000)])
+
+    assert features[0].ground_category.harmonized_value == 3
+    assert "larger than 1000 bytes" in caplog.text
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_raster_clusters_fetched_concurrently(monkeypatch):
+    pytest.importorskip("numpy")
+    pytest.importorskip("PIL")
+
+    monkeypatch.setattr(settings, "BULK_RASTER_SAMPLING", True)
+    monkeypatch.setitem(cantons.CANTONS["cantons_configurations"], "RS", RASTER_CANTON)
+    _mock_canton_identify("RS")
+    started = [asyncio.Event(), asyncio.Event()]
+
+    async def _getmap(request):
+        # Each cluster waits for the other one: only passes when concurrent
+        west = float(request.url.params["BBOX"].split(",")[0]) < BORDER_X - 5000
+        started[west].set()
+        await asyncio.wait_for(started[not west].wait(), timeout=5)
+        return _render_getmap(request)
+
+    respx.get("https://raster.example.ch/wms").mock(side_effect=_getmap)
+
+    features = await bulk.classify_points(
+        [(BORDER_X - 10000, 1200000), (BORDER_X + 10000, 1200000)]
+    )
+
+    assert [f.ground_category.harmonized_value for f in features] == [1, 3]
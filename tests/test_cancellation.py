@@ -0,0 +1,118 @@
+"""Tests for the cancellation of abandoned point lookups.
+
+Covers:
+- the upstream request is cancelled when the client disconnects
+- a newer request with the same session token supersedes the previous one (409)
+- requests of different sessions do not interfere
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from drillapi.app import app
+from drillapi.config import settings
+
+POINT = "/v1/drill-category/2574738/1249285"
+
+
+@pytest.fixture
+def slow_wms(mock_ju, ju_gml):
+    """The first GetFeatureInfo is slow, returns the cancelled requests."""
+    cancelled = []
+    started = []
+
+    async def _wms(request):
+        started.append(request.url.path)
+        if len(started) == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(request.url.path)
+                raise
+        return httpx.Response(200, content=ju_gml)
+
+    mock_ju["wms"].mock(side_effect=_wms)
+    return cancelled
+
+
+async def _asgi_get(path, disconnect_after):
+    """Call the app directly, the client disconnects after some seconds."""
+    started = time.monotonic()
+    messages = []
+
+    async def receive():
+        if time.monotonic() - started > disconnect_after:
+            return {"type": "http.disconnect"}
+        await asyncio.sleep(60)
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [(b"host", b"testserver")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    await app(scope, receive, send)
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_upstream(monkeypatch, slow_wms):
+    monkeypatch.setattr(settings, "CANCEL_ON_DISCONNECT", True)
+    monkeypatch.setattr(settings, "DISCONNECT_POLL_INTERVAL", 0.01)
+
+    started = time.monotonic()
+    messages = await _asgi_get(POINT, disconnect_after=0.05)
+    await asyncio.sleep(0.01)  # let the cancelled request unwind
+
+    assert time.monotonic() - started < 1
+    assert messages[0]["status"] == 499
+    assert slow_wms == ["/wms"]
+
+
+@pytest.mark.asyncio
+async def test_newer_session_request_supersedes(slow_wms):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://testserver"
+    ) as client:
+        headers = {settings.SESSION_HEADER: "session-1"}
+        first = asyncio.create_task(client.get(POINT, headers=headers))
+        await asyncio.sleep(0.05)
+        second = await client.get(POINT, headers=headers)
+        first = await first
+
+    assert first.status_code == 409
+    assert second.status_code == 200
+    assert second.json()["canton"] == "JU"
+    assert slow_wms == ["/wms"]
+
+
+@pytest.mark.asyncio
+async def test_other_sessions_not_cancelled(slow_wms):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://testserver"
+    ) as client:
+        first = asyncio.create_task(
+            client.get(POINT, headers={settings.SESSION_HEADER: "a"})
+        )
+        await asyncio.sleep(0.05)
+        second = await client.get(POINT, headers={settings.SESSION_HEADER: "b"})
+        assert not first.done()
+        first.cancel()
+
+    assert second.status_code == 200
+    assert slow_wms == []
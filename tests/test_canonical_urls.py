@@ -0,0 +1,108 @@
+"""Tests for canonical point URLs and HTTP caching headers.
+
+Covers:
+- coordinates are snapped and redirected (307) to the canonical URL
+- snapped coordinates stay within the accepted range
+- content-location mode answers directly for the snapped coordinates
+- Cache-Control, ETag and Vary headers, If-None-Match gets a 304
+- unavailable geoservices are not cacheable
+"""
+
+import httpx
+import pytest
+
+from drillapi.config import settings
+
+
+@pytest.fixture
+def wms(mock_ju):
+    return mock_ju["wms"]
+
+
+def test_redirect_to_canonical_url(client, monkeypatch, wms):
+    monkeypatch.setattr(settings, "CANONICAL_URL_SNAP", 10.0)
+
+    response = client.get(
+        "/v1/drill-category/2574741.3/1249287.9?exclude-inactive-cantons=false",
+        follow_redirects=False,
+    )
+
+    assert response.status_code == 307
+    assert "cache-control" not in response.headers
+    assert response.headers["location"].endswith(
+        "/v1/drill-category/2574740/1249290?exclude-inactive-cantons=false"
+    )
+    assert wms.call_count == 0
+
+    response = client.get(response.headers["location"], follow_redirects=False)
+    assert response.status_code == 200
+
+
+def test_redirect_cacheable_with_point_max_age(client, monkeypatch, wms):
+    monkeypatch.setattr(settings, "CANONICAL_URL_SNAP", 10.0)
+    monkeypatch.setattr(settings, "POINT_CACHE_MAX_AGE", 300)
+
+    response = client.get(
+        "/v1/drill-category/2574741.3/1249287.9", follow_redirects=False
+    )
+
+    assert response.status_code == 307
+    assert response.headers["cache-control"] == "public, max-age=300"
+
+
+@pytest.mark.parametrize(
+    "path, canonical",
+    [
+        ("2400004/1299999", "2400030/1299990"),
+        ("2899999/1070001", "2899980/1070010"),
+    ],
+)
+def test_snapped_coordinates_within_bounds(client, monkeypatch, path, canonical):
+    monkeypatch.setattr(settings, "CANONICAL_URL_SNAP", 30.0)
+
+    response = client.get(f"/v1/drill-category/{path}", follow_redirects=False)
+
+    assert response.status_code == 307
+    assert response.headers["location"].endswith(f"/v1/drill-category/{canonical}")
+
+
+def test_content_location_mode(client, monkeypatch, wms):
+    monkeypatch.setattr(settings, "CANONICAL_URL_SNAP", 10.0)
+    monkeypatch.setattr(settings, "CANONICAL_URL_MODE", "content-location")
+
+    response = client.get("/v1/drill-category/2574741.3/1249287.9")
+
+    assert response.status_code == 200
+    assert response.headers["content-location"].endswith(
+        "/v1/drill-category/2574740/1249290"
+    )
+    assert response.json()["coord_x"] == 2574740
+
+
+def test_cache_headers_and_not_modified(client, monkeypatch, wms):
+    monkeypatch.setattr(settings, "POINT_CACHE_MAX_AGE", 3600)
+
+    response = client.get("/v1/drill-category/2574738/1249285")
+    etag = response.headers["etag"]
+
+    assert response.headers["cache-control"] == "public, max-age=3600"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert etag.startswith('W/"')
+
+    response = client.get(
+        "/v1/drill-category/2574738/1249285", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+
+def test_unavailable_geoservice_not_cacheable(client, monkeypatch, wms):
+    monkeypatch.setattr(settings, "POINT_CACHE_MAX_AGE", 3600)
+    wms.mock(return_value=httpx.Response(503))
+
+    response = client.get("/v1/drill-category/2574738/1249285")
+
+    assert response.json()["ground_category"]["harmonized_value"] == 98
+    assert response.headers["cache-control"] == "no-store"
+    assert "etag" not in response.headers
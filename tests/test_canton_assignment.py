@@ -0,0 +1,101 @@
+"""Tests for the vectorized canton assignment.
+
+Covers:
+- points inside a single canton polygon are assigned
+- points close to a border, outside every canton or in a hole are ambiguous
+- bulk classification only calls geo.admin.ch identify for ambiguous points
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+import respx
+from conftest import IDENTIFY_URL
+
+from drillapi.config import settings
+from drillapi.services import bulk
+
+np = pytest.importorskip("numpy")
+
+from drillapi.services.canton_assignment import CantonAssigner
+
+
+def _square(minx, miny, maxx, maxy):
+    return [[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]]
+
+
+# Two neighbouring cantons, AA has a 1 km hole in its middle
+CANTONS_GEOJSON = {
+    "type": "FeatureCollection",
+    "features": [
+        {
+            "type": "Feature",
+            "properties": {"ak": "AA"},
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [
+                    _square(2600000, 1200000, 2610000, 1210000),
+                    _square(2604500, 1204500, 2605500, 1205500),
+                ],
+            },
+        },
+        {
+            "type": "Feature",
+            "properties": {"ak": "BB"},
+            "geometry": {
+                "type": "MultiPolygon",
+                "coordinates": [[_square(2610000, 1200000, 2620000, 1210000)]],
+            },
+        },
+    ],
+}
+
+
+@pytest.fixture
+def boundaries_path(tmp_path):
+    path = tmp_path / "cantons.geojson"
+    path.write_text(json.dumps(CANTONS_GEOJSON))
+    return path
+
+
+def test_assign_points_inside_cantons(boundaries_path):
+    assigner = CantonAssigner.from_geojson(boundaries_path, border_tolerance=50)
+
+    codes, ambiguous = assigner.assign(
+        np.array([2602000, 2615000, 2608000]), np.array([1202000, 1208000, 1201000])
+    )
+
+    assert codes.tolist() == ["AA", "BB", "AA"]
+    assert not ambiguous.any()
+
+
+def test_border_outside_and_hole_are_ambiguous(boundaries_path):
+    assigner = CantonAssigner.from_geojson(boundaries_path, border_tolerance=50)
+
+    xs = np.array([2609980, 2610020, 2590000, 2605000, 2604530])
+    ys = np.array([1205000, 1205000, 1205000, 1205000, 1205000])
+    codes, ambiguous = assigner.assign(xs, ys)
+
+    # near the AA/BB border, outside every canton, inside the hole, near the hole
+    assert ambiguous.tolist() == [True, True, True, True, True]
+    assert codes.tolist() == ["", "", "", "", ""]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_bulk_identifies_only_ambiguous_points(boundaries_path, monkeypatch):
+    """Points assigned locally skip the geo.admin.ch identify call."""
+    monkeypatch.setattr(settings, "CANTON_BOUNDARIES_PATH", boundaries_path)
+
+    identify = respx.get(IDENTIFY_URL).mock(
+        return_value=httpx.Response(200, json={"results": []})
+    )
+
+    points = [(2602000, 1202000), (2615000, 1208000), (2609990, 1205000)]
+    codes = await bulk.identify_cantons(points, asyncio.Semaphore(2))
+
+    assert codes == ["AA", "BB", None]
+    assert identify.call_count == 1
+    assert identify.calls[0].request.url.params["geometry"] == "2609990,1205000"
@@ -0,0 +1,162 @@
+"""Tests for points on a canton border.
+
+Covers:
+- geo.admin.ch identify returning two cantons evaluates both geoservices
+- the most restrictive category wins and each canton contribution is reported
+- both cantonal requests run concurrently
+- forbidden wins over everything, an unchecked canton (unavailable geoservice,
+  problem) over OK and WITH_RESTRICTIONS, which win over cantons without data
+"""
+
+import asyncio
+
+import httpx
+import respx
+from conftest import IDENTIFY_URL, JU_WMS_URL
+
+from drillapi.models.models import (
+    GroundCategory,
+    GroundSuitability,
+    ResultDetail,
+    SuitabilityFeature,
+)
+from drillapi.services.processing import combine_canton_features
+
+FR_QUERY_URL = "https://map.geo.fr.ch/arcgis/rest/services/PortailCarto/Theme_environnement/MapServer/17/query"
+FR_FORBIDDEN = {
+    "features": [{"attributes": {"DA_SGV_DESC": "SGV interdites"}}],
+}
+
+
+def _mock_border_identify(*codes):
+    respx.get(IDENTIFY_URL).mock(
+        return_value=httpx.Response(
+            200, json={"results": [{"attributes": {"ak": code}} for code in codes]}
+        )
+    )
+
+
+@respx.mock
+def test_border_point_most_restrictive_canton_wins(client, ju_gml):
+    _mock_border_identify("JU", "FR")
+    respx.get(JU_WMS_URL).mock(return_value=httpx.Response(200, content=ju_gml))
+    respx.get(FR_QUERY_URL).mock(return_value=httpx.Response(200, json=FR_FORBIDDEN))
+
+    response = client.get("/v1/drill-category/2574738/1249285")
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["canton"] == "FR"
+    assert payload["ground_category"]["harmonized_value"] == 3
+    contributions = {c["canton"]: c for c in payload["canton_contributions"]}
+    assert contributions["JU"]["harmonized_value"] == 1
+    assert contributions["FR"]["harmonized_value"] == 3
+
+
+@respx.mock
+def test_border_cantons_are_fetched_concurrently(client, ju_gml):
+    _mock_border_identify("JU", "FR")
+    ju_started = asyncio.Event()
+    fr_started = asyncio.Event()
+
+    async def _ju(request):
+        ju_started.set()
+        await asyncio.wait_for(fr_started.wait(), timeout=5)
+        return httpx.Response(200, content=ju_gml)
+
+    async def _fr(request):
+        fr_started.set()
+        await asyncio.wait_for(ju_started.wait(), timeout=5)
+        return httpx.Response(200, json={"features": []})
+
+    respx.get(JU_WMS_URL).mock(side_effect=_ju)
+    respx.get(FR_QUERY_URL).mock(side_effect=_fr)
+
+    response = client.get("/v1/drill-category/2574738/1249285")
+
+    payload = response.json()
+    # FR has no feature at this location (4, unknown), JU's category is kept
+    assert payload["canton"] == "JU"
+    assert payload["ground_category"]["harmonized_value"] == 1
+    assert len(payload["canton_contributions"]) == 2
+
+
+@respx.mock
+def test_single_canton_has_no_contributions(client, ju_gml):
+    _mock_border_identify("JU")
+    respx.get(JU_WMS_URL).mock(return_value=httpx.Response(200, content=ju_gml))
+
+    payload = client.get("/v1/drill-category/2574738/1249285").json()
+
+    assert payload["canton"] == "JU"
+    assert payload["canton_contributions"] == []
+
+
+def _feature(canton, value):
+    return SuitabilityFeature(
+        coord_x=2600000,
+        coord_y=1200000,
+        canton=canton,
+        ground_category=GroundCategory(harmonized_value=value),
+        result_detail=ResultDetail(),
+    )
+
+
+def test_forbidden_wins_over_unavailable_geoservice():
+    combined = combine_canton_features(
+        [
+            _feature("JU", GroundSuitability.GEOSERVICE_UNAVAILABLE),
+            _feature("FR", GroundSuitability.FORBIDDEN),
+        ]
+    )
+    assert combined.canton == "FR"
+    assert combined.ground_category.harmonized_value == GroundSuitability.FORBIDDEN
+
+
+def test_unavailable_geoservice_wins_over_category():
+    combined = combine_canton_features(
+        [
+            _feature("JU", GroundSuitability.OK),
+            _feature("FR", GroundSuitability.GEOSERVICE_UNAVAILABLE),
+        ]
+    )
+    # FR restrictions were never checked, not a bare OK
+    assert combined.canton == "FR"
+    assert (
+        combined.ground_category.harmonized_value
+        == GroundSuitability.GEOSERVICE_UNAVAILABLE
+    )
+    assert [c.canton for c in combined.canton_contributions] == ["JU", "FR"]
+
+
+def test_problem_wins_over_restrictions():
+    combined = combine_canton_features(
+        [
+            _feature("JU", GroundSuitability.WITH_RESTRICTIONS),
+            _feature("BE", GroundSuitability.PROBLEM),
+        ]
+    )
+    assert combined.canton == "BE"
+    assert combined.ground_category.harmonized_value == GroundSuitability.PROBLEM
+
+
+def test_category_wins_over_cantons_without_data():
+    combined = combine_canton_features(
+        [
+            _feature("JU", GroundSuitability.OK),
+            _feature("NE", GroundSuitability.NOT_AVAILABLE),
+            _feature("BE", GroundSuitability.UNKNOWN),
+        ]
+    )
+    assert combined.canton == "JU"
+    assert combined.ground_category.harmonized_value == GroundSuitability.OK
+
+
+def test_status_code_without_category():
+    combined = combine_canton_features(
+        [
+            _feature("JU", GroundSuitability.UNKNOWN),
+            _feature("FR", GroundSuitability.GEOSERVICE_UNAVAILABLE),
+        ]
+    )
+    assert combined.canton == "FR"
@@ -0,0 +1,172 @@
+"""Tests for the learned canton grid cache.
+
+Covers:
+- a cell is confirmed once its four corners are identified in the same canton
+- confirmed cells skip geo.admin.ch identify, corners are learned in the
+  background lane
+- corners on a canton border or without canton never confirm a cell
+- corners whose identify failed are not stored and are learned again
+- persistence to disk and hit rate reporting
+"""
+
+import asyncio
+
+import httpx
+import pytest
+import respx
+from conftest import IDENTIFY_URL
+
+from drillapi.config import settings
+from drillapi.services import canton_grid as canton_grid_service
+from drillapi.services import outbound
+from drillapi.services.canton_grid import CantonGrid, canton_grid
+
+
+@pytest.fixture(autouse=True)
+def grid_cache(monkeypatch):
+    monkeypatch.setattr(settings, "CANTON_GRID_CACHE", True)
+    canton_grid.clear()
+    yield
+    canton_grid.clear()
+
+
+def _identify(*codes):
+    return httpx.Response(
+        200, json={"results": [{"attributes": {"ak": code}} for code in codes]}
+    )
+
+
+async def _learning_done():
+    await asyncio.gather(*canton_grid_service._background_tasks)
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_confirmed_cell_skips_identify():
+    lanes = []
+
+    def side_effect(request):
+        lanes.append(outbound.lane.get())
+        return _identify("JU")
+
+    identify = respx.get(IDENTIFY_URL).mock(side_effect=side_effect)
+
+    results = await canton_grid_service.get_canton_from_coordinates(2574738, 1249285)
+    assert results[0]["attributes"]["ak"] == "JU"
+    await _learning_done()
+    # One identify for the point, four for the corners of its cell
+    assert identify.call_count == 5
+    assert lanes == [outbound.INTERACTIVE] + [outbound.BACKGROUND] * 4
+
+    results = await canton_grid_service.get_canton_from_coordinates(2574900, 1249400)
+    assert results == [{"attributes": {"ak": "JU"}}]
+    assert identify.call_count == 5
+    assert canton_grid.hits == 1
+    assert canton_grid.misses == 1
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_border_corner_never_confirms():
+    respx.get(IDENTIFY_URL).mock(return_value=_identify("JU", "BE"))
+
+    await canton_grid_service.get_canton_from_coordinates(2574738, 1249285)
+    await _learning_done()
+
+    assert canton_grid.unknown_corners(2574738, 1249285) == []
+    assert canton_grid.confirmed(2574738, 1249285) is None
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_corner_without_canton_never_confirms():
+    identify = respx.get(IDENTIFY_URL).mock(
+        side_effect=[_identify("JU"), _identify(), *[_identify("JU")] * 3]
+    )
+
+    await canton_grid_service.get_canton_from_coordinates(2574738, 1249285)
+    await _learning_done()
+
+    assert canton_grid.unknown_corners(2574738, 1249285) == []
+    assert canton_grid.confirmed(2574738, 1249285) is None
+    # The marked corner is not identified again
+    identify.side_effect = None
+    identify.return_value = _identify("JU")
+    await canton_grid_service.get_canton_from_coordinates(2574738, 1249285)
+    await _learning_done()
+    assert identify.call_count == 6
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_failed_corner_learned_again():
+    identify = respx.get(IDENTIFY_URL).mock(
+        side_effect=[
+            _identify("JU"),
+            httpx.Response(503),
+            httpx.ConnectTimeout("timeout"),
+            *[_identify("JU")] * 2,
+        ]
+    )
+
+    await canton_grid_service.get_canton_from_coordinates(2574738, 1249285)
+    await _learning_done()
+
+    assert len(canton_grid.unknown_corners(2574738, 1249285)) == 2
+    assert canton_grid.confirmed(2574738, 1249285) is None
+
+    # geo.admin.ch is back: the two corners are identified again
+    identify.side_effect = None
+    identify.return_value = _identify("JU")
+    await canton_grid_service.get_canton_from_coordinates(2574900, 1249400)
+    await _learning_done()
+    assert identify.call_count == 8
+    assert canton_grid.confirmed(2574738, 1249285) == "JU"
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_disabled_cache_always_identifies(monkeypatch):
+    monkeypatch.setattr(settings, "CANTON_GRID_CACHE", False)
+    identify = respx.get(IDENTIFY_URL).mock(return_value=_identify("JU"))
+    for corner in canton_grid.cell_corners(2574738, 1249285):
+        canton_grid.set_corner(corner, "JU")
+
+    await canton_grid_service.get_canton_from_coordinates(2574738, 1249285)
+
+    assert identify.call_count == 1
+
+
+def test_save_and_load(tmp_path):
+    path = tmp_path / "grid.json"
+    grid = CantonGrid(cell_size=500)
+    for corner in grid.cell_corners(2574738, 1249285):
+        grid.set_corner(corner, "JU")
+    grid.save(path)
+
+    loaded = CantonGrid(cell_size=500)
+    loaded.load(path)
+    assert loaded.confirmed(2574738, 1249285) == "JU"
+
+    other_size = CantonGrid(cell_size=1000)
+    other_size.load(path)
+    assert other_size.corners == {}
+
+
+def test_grid_is_bounded():
+    grid = CantonGrid(cell_size=500, max_cells=2)
+    for ix in range(5):
+        grid.set_corner((ix, 0), "JU")
+    assert list(grid.corners) == [(3, 0), (4, 0)]
+
+
+def test_hit_rate_in_metrics(client):
+    for corner in canton_grid.cell_corners(2574738, 1249285):
+        canton_grid.set_corner(corner, "JU")
+    canton_grid.confirmed(2574738, 1249285)
+    canton_grid.confirmed(2700000, 1200000)
+
+    response = client.get("/v1/metrics")
+
+    assert response.status_code == 200
+    assert response.json()["gauges"]["canton_grid"]["hit_rate"] == 0.5
@@ -0,0 +1,119 @@
+"""Tests for change detection and cache purging.
+
+Covers:
+- unchanged ground control points keep the cache
+- a changed ground control point purges the cached results of its canton only
+- a cached point answered differently by the geoservice purges its canton
+- the features hash does not depend on the order of the features
+- the admin purge route: disabled without ADMIN_TOKEN, token checked,
+  purge per canton
+"""
+
+import asyncio
+
+import httpx
+import pytest
+import respx
+from conftest import JU_WMS_URL
+
+from drillapi.cantons_configuration import cantons
+from drillapi.config import settings
+from drillapi.services import cache, change_detection
+
+JU_X = 2574738
+JU_Y = 1249285
+JU_CONFIG = {
+    **cantons.CANTONS["cantons_configurations"]["JU"],
+    "ground_control_point": [[JU_X, JU_Y, 1, "Autorisé"]],
+}
+
+
+@pytest.fixture(autouse=True)
+def result_cache(monkeypatch):
+    monkeypatch.setattr(settings, "RESULT_CACHE", True)
+    cache.reset_result_cache()
+    change_detection._control_hashes.clear()
+    yield
+    cache.reset_result_cache()
+    change_detection._control_hashes.clear()
+
+
+def _with_value(gml, value):
+    """The Jura response with another drilling limitation."""
+    return (
+        gml.decode("utf-8")
+        .replace("Autorisé</limitation_forage>", f"{value}</limitation_forage>")
+        .encode("utf-8")
+    )
+
+
+async def _cache_other_canton():
+    key = cache.cache_key("features", "FR", "v1", 2582124, 1164966)
+    entry = {"stored_at": 0, "result": {"features": []}}
+    await cache.get_result_cache().set(key, entry, 3600, "FR", "v1")
+    return key
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_changed_control_point_purges_canton(ju_gml):
+    wms = respx.get(JU_WMS_URL).mock(return_value=httpx.Response(200, content=ju_gml))
+    await cache.fetch_features_for_point(JU_X + 500, JU_Y, JU_CONFIG)
+    fr_key = await _cache_other_canton()
+
+    # First run records the hashes, second run sees the same data
+    assert not await change_detection.check_canton("JU", JU_CONFIG)
+    assert not await change_detection.check_canton("JU", JU_CONFIG)
+    assert await cache.get_cached_features(JU_X + 500, JU_Y, JU_CONFIG)
+
+    wms.mock(return_value=httpx.Response(200, content=_with_value(ju_gml, "Interdit")))
+    assert await change_detection.check_canton("JU", JU_CONFIG)
+
+    assert await cache.get_cached_features(JU_X + 500, JU_Y, JU_CONFIG) is None
+    tiers = cache.get_result_cache().tiers
+    assert await tiers[0].get(fr_key) is not None
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_changed_cached_point_purges_canton(ju_gml):
+    config = {**JU_CONFIG, "ground_control_point": []}
+    wms = respx.get(JU_WMS_URL).mock(return_value=httpx.Response(200, content=ju_gml))
+    await cache.fetch_features_for_point(JU_X, JU_Y, config)
+
+    assert not await change_detection.check_canton("JU", config)
+
+    wms.mock(return_value=httpx.Response(200, content=_with_value(ju_gml, "Interdit")))
+    assert await change_detection.check_canton("JU", config)
+    assert await cache.get_cached_features(JU_X, JU_Y, config) is None
+
+
+def test_features_hash_ignores_order():
+    first = {"layer": "a", "properties": {"value": "Autorisé"}}
+    second = {"layer": "b", "properties": {"value": "Interdit"}}
+
+    features_hash = change_detection.features_hash
+
+    assert features_hash([first, second]) == features_hash([second, first])
+    assert features_hash([first]) != features_hash([second])
+
+
+def test_admin_purge_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", None)
+    assert client.delete("/v1/admin/cache").status_code == 404
+
+
+def test_admin_purge_per_canton(client, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "secret")
+    asyncio.run(_cache_other_canton())
+
+    response = client.delete(
+        "/v1/admin/cache?canton=FR", headers={"Authorization": "Bearer wrong"}
+    )
+    assert response.status_code == 401
+
+    response = client.delete(
+        "/v1/admin/cache?canton=fr", headers={"Authorization": "Bearer secret"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"removed": 1}
@@ -5,6 +5,8 @@ Covers:
 - /checker/{canton} for a single valid canton
 - /checker/{canton} for a nonexistent canton
 - Checker when get_drill_category raises an exception
+- Checker bypasses the result cache and its stale results
+- Checker bypasses the HTTP cache, fresh upstream responses included
 """
 
 import pytest
@@ -12,6 +14,8 @@ import respx
 import httpx
 from fastapi.testclient import TestClient
 from drillapi.app import app
+from drillapi.config import settings
+from drillapi.services import cache, http_cache
 
 
 @pytest.fixture
@@ -111,3 +115,54 @@ def test_checker_all_cantons_page_loads(client):
     response = client.get("/checker/")
     assert response.status_code == 200
     assert "text/html" in response.headers["content-type"]
+
+
+@respx.mock
+def test_checker_bypasses_result_cache(client, ju_gml, monkeypatch):
+    """The checker reaches the geoservice on each run and never reports stale results."""
+    monkeypatch.setattr(settings, "RESULT_CACHE", True)
+    monkeypatch.setattr(settings, "RESULT_CACHE_STALE_WHILE_REVALIDATE", True)
+    cache.reset_result_cache()
+    _mock_canton_identify("JU")
+    wms = respx.get("https://geoservices.jura.ch/wms", params=None).mock(
+        return_value=httpx.Response(200, content=ju_gml)
+    )
+
+    try:
+        client.get("/checker/JU")
+        calls = wms.call_count
+        assert calls > 0
+
+        wms.mock(return_value=httpx.Response(503))
+        response = client.get("/checker/JU")
+    finally:
+        cache.reset_result_cache()
+
+    assert wms.call_count == 2 * calls
+    assert "got &#39;98&#39;" in response.text
+
+
+@respx.mock
+def test_checker_bypasses_http_cache(client, ju_gml, monkeypatch):
+    """A response cached per RFC 9111 is never reported as a live check."""
+    monkeypatch.setattr(settings, "HTTP_CACHE", True)
+    http_cache.response_store.clear()
+    _mock_canton_identify("JU")
+    wms = respx.get("https://geoservices.jura.ch/wms", params=None).mock(
+        return_value=httpx.Response(
+            200, content=ju_gml, headers={"Cache-Control": "max-age=3600"}
+        )
+    )
+
+    try:
+        client.get("/checker/JU")
+        calls = wms.call_count
+        assert calls > 0
+        client.get("/checker/JU")
+    finally:
+        http_cache.response_store.clear()
+
+    assert wms.call_count == 2 * calls
+    assert all(
+        call.request.headers["Cache-Control"] == "no-cache" for call in wms.calls
+    )
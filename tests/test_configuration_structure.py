@@ -1,5 +1,5 @@
 from typing import List, Optional, Union
-from pydantic import BaseModel, HttpUrl, field_validator
+from pydantic import BaseModel, HttpUrl, PositiveFloat, PositiveInt, field_validator
 from drillapi.cantons_configuration.cantons import CANTONS
 
 
@@ -27,6 +27,11 @@ class Cantonconfig(BaseModel):
     info_format: str
     style: Optional[str]
     layers: List[Layer]
+    max_body_size: PositiveInt | None = None
+    split_layers: bool | None = None
+    max_concurrency: PositiveInt | None = None
+    max_rate: PositiveFloat | None = None
+    rate_burst: PositiveInt | None = None
 
     @field_validator("layers")
     @classmethod
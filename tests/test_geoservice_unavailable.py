@@ -4,11 +4,14 @@ Verifies that when external cantonal geoservices fail (timeout, connection error
 invalid response), the backend returns a structured HTTP 200 response with
 harmonized_value=98 and the canton identifier, instead of raising HTTPException(502).
 Canton config is preserved so the frontend can access cantonal_energy_service_url.
+Responses larger than the size limit of the canton are aborted while being read.
 """
 
 import respx
 import httpx
 
+from drillapi.cantons_configuration import cantons
+
 
 def _mock_canton_identify(canton_code: str):
     """Mock the geo.admin.ch canton identification endpoint."""
@@ -153,3 +156,52 @@ def test_canton_preserved_in_geoservice_failure(client):
     assert payload["canton_config"]["name"] == "JU"
     assert payload["canton_config"]["cantonal_energy_service_url"] is not None
     assert payload["ground_category"]["harmonized_value"] == 98
+
+
+@respx.mock
+def test_wms_response_too_large_aborted_early(client, monkeypatch):
+    """A runaway WMS response is aborted once it exceeds max_body_size."""
+    monkeypatch.setitem(
+        cantons.CANTONS["cantons_configurations"]["JU"], "max_body_size", 10_000
+    )
+    _mock_canton_identify("JU")
+    chunks_read = []
+
+    async def _runaway_gml():
+        yield b"<wfs:FeatureCollection>"
+        for index in range(1000):
+            chunks_read.append(index)
+            yield b"<gml:featureMember>" + b" " * 1000 + b"</gml:featureMember>"
+
+    respx.get("https://geoservices.jura.ch/wms").mock(
+        side_effect=lambda request: httpx.Response(200, content=_runaway_gml())
+    )
+
+    response = client.get("/v1/drill-category/2574738/1249285")
+
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["ground_category"]["harmonized_value"] == 98
+    assert payload["result_detail"]["message"] == "Geoservice response too large"
+    assert "10000 bytes" in payload["result_detail"]["detail"]
+    assert len(chunks_read) < 20
+
+
+@respx.mock
+def test_announced_content_length_too_large(client, monkeypatch):
+    """A Content-Length above the limit is refused before reading the body."""
+    monkeypatch.setitem(
+        cantons.CANTONS["cantons_configurations"]["JU"], "max_body_size", 100
+    )
+    _mock_canton_identify("JU")
+    respx.get("https://geoservices.jura.ch/wms").mock(
+        return_value=httpx.Response(200, content=b"x" * 1000)
+    )
+
+    response = client.get("/v1/drill-category/2574738/1249285")
+
+    payload = response.json()
+    assert payload["result_detail"]["message"] == "Geoservice response too large"
+    assert payload["result_detail"]["full_url"].startswith(
+        "https://geoservices.jura.ch/wms?"
+    )
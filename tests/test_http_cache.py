@@ -0,0 +1,197 @@
+"""Tests for the HTTP cache of upstream geoservice responses.
+
+Covers:
+- fresh responses (max-age) are served without contacting the geoservice
+- stale responses are revalidated with If-None-Match / If-Modified-Since
+  and a 304 serves the stored body
+- no-store responses are never stored
+- responses over the size limit are passed on as read and not stored
+- with MAX_RESPONSE_BYTES or max_body_size, a runaway cacheable response is
+  aborted early
+- the connection limits of the client apply to the caching transport
+- freshness lifetime computation
+"""
+
+import httpx
+import pytest
+import respx
+from conftest import JU_WMS_URL
+
+from drillapi.cantons_configuration import cantons
+from drillapi.config import settings
+from drillapi.services import http_cache, processing
+
+JU_X = 2574738
+JU_Y = 1249285
+JU_CONFIG = cantons.CANTONS["cantons_configurations"]["JU"]
+
+
+@pytest.fixture(autouse=True)
+def enable_http_cache(monkeypatch):
+    monkeypatch.setattr(settings, "HTTP_CACHE", True)
+    http_cache.response_store.clear()
+    yield
+    http_cache.response_store.clear()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_fresh_response_served_from_cache(ju_gml):
+    wms = respx.get(JU_WMS_URL).mock(
+        return_value=httpx.Response(
+            200, content=ju_gml, headers={"Cache-Control": "max-age=600"}
+        )
+    )
+
+    first = await processing.fetch_features_for_point(JU_X, JU_Y, JU_CONFIG)
+    second = await processing.fetch_features_for_point(JU_X, JU_Y, JU_CONFIG)
+
+    assert first["features"] and first["features"] == second["features"]
+    assert wms.call_count == 1
+    # Another point is another URL
+    await processing.fetch_features_for_point(JU_X + 100, JU_Y, JU_CONFIG)
+    assert wms.call_count == 2
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_stale_response_revalidated_with_etag(ju_gml):
+    conditional_headers = []
+
+    def _wms(request):
+        conditional_headers.append(
+            (
+                request.headers.get("if-none-match"),
+                request.headers.get("if-modified-since"),
+            )
+        )
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304, headers={"ETag": '"v1"'})
+        return httpx.Response(
+            200,
+            content=ju_gml,
+            headers={
+                "ETag": '"v1"',
+                "Last-Modified": "Mon, 06 Oct 2025 10:00:00 GMT",
+                "Cache-Control": "no-cache",
+            },
+        )
+
+    respx.get(JU_WMS_URL).mock(side_effect=_wms)
+
+    first = await processing.fetch_features_for_point(JU_X, JU_Y, JU_CONFIG)
+    second = await processing.fetch_features_for_point(JU_X, JU_Y, JU_CONFIG)
+
+    assert conditional_headers == [
+        (None, None),
+        ('"v1"', "Mon, 06 Oct 2025 10:00:00 GMT"),
+    ]
+    assert second["features"] == first["features"]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_no_store_response_not_stored(ju_gml):
+    wms = respx.get(JU_WMS_URL).mock(
+        return_value=httpx.Response(
+            200,
+            content=ju_gml,
+            headers={"Cache-Control": "no-store, max-age=600", "ETag": '"v1"'},
+        )
+    )
+
+    await processing.fetch_features_for_point(JU_X, JU_Y, JU_CONFIG)
+    await processing.fetch_features_for_point(JU_X, JU_Y, JU_CONFIG)
+
+    assert wms.call_count == 2
+    assert http_cache.response_store.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_large_response_passed_on_unbuffered():
+    store = http_cache.ResponseStore(max_bytes=1000)
+    chunks_read = []
+
+    async def _body():
+        for index in range(10):
+            chunks_read.append(index)
+            yield b"x" * 300
+
+    def _handler(request):
+        return httpx.Response(
+            200, content=_body(), headers={"Cache-Control": "max-age=600"}
+        )
+
+    transport = http_cache.CachingTransport(httpx.MockTransport(_handler), store)
+    async with (
+        httpx.AsyncClient(transport=transport) as client,
+        client.stream("GET", JU_WMS_URL) as response,
+    ):
+        # Buffered up to the limit only, the rest is read by the caller
+        assert len(chunks_read) == 4
+        body = await response.aread()
+
+    assert len(body) == 3000
+    assert store.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("limited", ["settings", "canton"])
+@respx.mock
+async def test_size_limit_applies_with_http_cache(monkeypatch, limited):
+    if limited == "settings":
+        monkeypatch.setattr(settings, "MAX_RESPONSE_BYTES", 10_000)
+    else:
+        monkeypatch.setitem(JU_CONFIG, "max_body_size", 10_000)
+    chunks_read = []
+
+    async def _runaway_gml():
+        yield b"<wfs:FeatureCollection>"
+        for index in range(1000):
+            chunks_read.append(index)
+            yield b"<gml:featureMember>" + b" " * 1000 + b"</gml:featureMember>"
+
+    respx.get(JU_WMS_URL).mock(
+        side_effect=lambda request: httpx.Response(
+            200, content=_runaway_gml(), headers={"Cache-Control": "max-age=600"}
+        )
+    )
+
+    result = await processing.fetch_features_for_point(JU_X, JU_Y, JU_CONFIG)
+
+    assert result["too_large"]
+    assert len(chunks_read) < 20
+    assert http_cache.response_store.stats()["entries"] == 0
+
+
+def test_transport_keeps_connection_limits():
+    transport = http_cache.transport(httpx.Limits(max_connections=3))
+    assert transport.transport._pool._max_connections == 3
+
+
+@pytest.mark.parametrize(
+    "headers, lifetime",
+    [
+        ({"Cache-Control": "max-age=60, s-maxage=300"}, 300),
+        ({"Cache-Control": "max-age=60"}, 60),
+        ({"Cache-Control": "no-cache, max-age=60"}, 0),
+        (
+            {
+                "Date": "Mon, 06 Oct 2025 10:00:00 GMT",
+                "Expires": "Mon, 06 Oct 2025 11:00:00 GMT",
+            },
+            3600,
+        ),
+        ({"Expires": "0"}, 0),
+        (
+            {
+                "Date": "Mon, 06 Oct 2025 10:00:00 GMT",
+                "Last-Modified": "Mon, 06 Oct 2025 00:00:00 GMT",
+            },
+            3600,
+        ),
+        ({}, 0),
+    ],
+)
+def test_freshness_lifetime(headers, lifetime):
+    assert http_cache.freshness_lifetime(httpx.Headers(headers), 0.0) == lifetime
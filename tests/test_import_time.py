@@ -0,0 +1,50 @@
+"""Tests for the import time of the application (cold starts).
+
+Covers:
+- importing the app and the Lambda handler stays within budget, measured
+  with benchmarks/import_time.py (python -X importtime)
+- optional dependencies are only imported on first use
+"""
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+# Measured around 0.6s on a developer laptop, mostly FastAPI and pydantic
+BUDGET_SECONDS = 2.0
+
+# Only needed by the checker, the home page, GML parsing, bulk, the canton
+# boundaries and the result cache tiers
+LAZY_MODULES = ["jinja2", "owslib", "lxml", "numpy", "PIL", "sqlite3"]
+
+
+@pytest.fixture(scope="module")
+def import_times():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "benchmarks/import_time.py",
+            "drillapi.app",
+            "drillapi.lambda_handler",
+            "--runs",
+            "1",
+            "--json",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+@pytest.mark.parametrize("module", ["drillapi.app", "drillapi.lambda_handler"])
+def test_import_time_budget(import_times, module):
+    assert import_times[module]["median"] < BUDGET_SECONDS
+
+
+@pytest.mark.parametrize("module", ["drillapi.app", "drillapi.lambda_handler"])
+def test_optional_dependencies_not_imported(import_times, module):
+    loaded = set(import_times[module]["modules"])
+    assert loaded.isdisjoint(LAZY_MODULES)
@@ -0,0 +1,71 @@
+"""Tests for the fast JSON response path.
+
+Covers:
+- drill category and bulk responses are byte for byte the same as the
+  responses serialized by FastAPI
+- the canton_config fragment is serialized once per config version
+"""
+
+from drillapi.cantons_configuration import cantons
+from drillapi.config import settings
+from drillapi.models.models import GroundCategory, ResultDetail, SuitabilityFeature
+from drillapi.services import responses
+
+
+def _both_paths(client, monkeypatch, method, url, **kwargs):
+    monkeypatch.setattr(settings, "FAST_JSON_RESPONSE", False)
+    standard = client.request(method, url, **kwargs)
+    monkeypatch.setattr(settings, "FAST_JSON_RESPONSE", True)
+    fast = client.request(method, url, **kwargs)
+    return standard, fast
+
+
+def test_drill_category_same_bytes(client, monkeypatch, mock_ju):
+    standard, fast = _both_paths(
+        client, monkeypatch, "GET", "/v1/drill-category/2574738/1249285"
+    )
+
+    assert fast.status_code == standard.status_code == 200
+    assert fast.headers["content-type"] == standard.headers["content-type"]
+    assert fast.content == standard.content
+    assert fast.json()["canton_config"]["name"] == "JU"
+
+
+def test_bulk_same_bytes(client, monkeypatch, mock_ju):
+    payload = {
+        "points": [
+            {"coord_x": 2574738, "coord_y": 1249285},
+            {"coord_x": 2574838, "coord_y": 1249385},
+        ]
+    }
+    standard, fast = _both_paths(
+        client, monkeypatch, "POST", "/v1/drill-category/bulk", json=payload
+    )
+
+    assert fast.status_code == standard.status_code == 200
+    assert fast.content == standard.content
+    assert len(fast.json()) == 2
+
+
+def test_canton_config_serialized_once():
+    responses._fragments.clear()
+    config = cantons.CANTONS["cantons_configurations"]["JU"]
+    features = [
+        SuitabilityFeature(
+            coord_x=2574738 + i,
+            coord_y=1249285,
+            canton="JU",
+            canton_config=config,
+            ground_category=GroundCategory(),
+            result_detail=ResultDetail(),
+        )
+        for i in range(3)
+    ]
+
+    body = responses.features_json(features)
+
+    assert len(responses._fragments) == 1
+    assert body.count(b'"canton_config":{') == 3
+    assert responses.feature_json(features[0]) == (
+        features[0].model_dump_json().encode("utf-8")
+    )
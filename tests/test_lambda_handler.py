@@ -0,0 +1,72 @@
+"""Tests for the AWS Lambda entrypoint.
+
+Covers:
+- scheduled warm-up pings are answered without the ASGI stack
+- warm invocations reuse the shared HTTP client
+
+The cold-start import time is covered by test_import_time.py.
+"""
+
+import json
+
+from drillapi import lambda_handler
+from drillapi.services import clients, warmup
+
+
+def _http_event(path):
+    return {
+        "version": "2.0",
+        "routeKey": "$default",
+        "rawPath": path,
+        "rawQueryString": "",
+        "headers": {"host": "drillapi.example.org"},
+        "requestContext": {
+            "http": {
+                "method": "GET",
+                "path": path,
+                "protocol": "HTTP/1.1",
+                "sourceIp": "192.0.2.1",
+            },
+        },
+        "isBase64Encoded": False,
+    }
+
+
+def test_warmup_ping_skips_asgi(monkeypatch):
+    calls = []
+
+    async def _warm_up():
+        calls.append("warm_up")
+        warmup.state.update(ready=True, hosts={"geoservices.jura.ch": "ok"})
+
+    def _asgi(event, context):
+        raise AssertionError("the ASGI stack must not run for pings")
+
+    monkeypatch.setattr(warmup, "warm_up", _warm_up)
+    monkeypatch.setattr(lambda_handler, "asgi_handler", _asgi)
+    warmup.state["ready"] = False
+    event = {"source": "aws.events", "detail-type": "Scheduled Event"}
+
+    try:
+        response = lambda_handler.handler(event, None)
+        lambda_handler.handler(event, None)
+    finally:
+        warmup.mark_ready()
+
+    assert response == {"warm": True, "hosts": {"geoservices.jura.ch": "ok"}}
+    # Connections are opened on the first ping only
+    assert calls == ["warm_up"]
+
+
+def test_warm_invocations_reuse_client(mock_ju):
+    seen = []
+    for _ in range(2):
+        response = lambda_handler.handler(
+            _http_event("/v1/drill-category/2574738/1249285"), None
+        )
+        assert response["statusCode"] == 200
+        assert json.loads(response["body"])["canton"] == "JU"
+        seen.append(clients._clients[False][1])
+
+    assert seen[0] is seen[1]
+    assert not seen[0].is_closed
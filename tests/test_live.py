@@ -0,0 +1,142 @@
+"""Tests for the live drill category WebSocket route.
+
+Covers:
+- a position is answered with the same feature as the HTTP route
+- a burst of positions gives a single lookup, of the last position
+- a running lookup is cancelled by a newer position
+- invalid messages are answered with an error, the socket stays open
+- messages past RATE_LIMIT per client address close the socket (1008)
+- connections past LIVE_MAX_CONNECTIONS are closed (1013)
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from drillapi.config import settings
+from drillapi.routes import live
+from drillapi.services import security
+
+LIVE_URL = "/v1/drill-category/live"
+POSITION = {"coord_x": 2574738, "coord_y": 1249285}
+
+
+@pytest.fixture
+def upstream(mock_ju, ju_gml):
+    """JU GetFeatureInfo requests, with slow_first the first one hangs."""
+    state = {"slow_first": False, "requests": [], "cancelled": []}
+
+    async def _wms(request):
+        bbox = request.url.params["BBOX"]
+        state["requests"].append(bbox)
+        if state["slow_first"] and len(state["requests"]) == 1:
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                state["cancelled"].append(bbox)
+                raise
+        return httpx.Response(200, content=ju_gml)
+
+    mock_ju["wms"].mock(side_effect=_wms)
+    return state
+
+
+def test_position_answered_with_feature(client, mock_ju):
+    with client.websocket_connect(LIVE_URL) as websocket:
+        websocket.send_json(POSITION)
+        feature = websocket.receive_json()
+
+    expected = client.get("/v1/drill-category/2574738/1249285").json()
+    assert feature == expected
+    assert feature["canton"] == "JU"
+
+
+def test_burst_coalesced(client, monkeypatch, upstream):
+    monkeypatch.setattr(settings, "LIVE_COALESCE_INTERVAL", 0.2)
+
+    with client.websocket_connect(LIVE_URL) as websocket:
+        for i in range(1, 6):
+            websocket.send_json({"coord_x": 2574738 + i, "coord_y": 1249285})
+        feature = websocket.receive_json()
+        # Nothing else was sent before the answer to the next message
+        websocket.send_text("not a position")
+        assert "detail" in websocket.receive_json()
+
+    assert feature["coord_x"] == 2574743
+    assert len(upstream["requests"]) == 1
+
+
+def test_running_lookup_superseded(client, monkeypatch, upstream):
+    monkeypatch.setattr(settings, "LIVE_COALESCE_INTERVAL", 0)
+    upstream["slow_first"] = True
+
+    with client.websocket_connect(LIVE_URL) as websocket:
+        websocket.send_json({"coord_x": 2574700, "coord_y": 1249285})
+        # Let the first lookup reach the cantonal geoservice
+        while not upstream["requests"]:
+            time.sleep(0.01)
+        websocket.send_json(POSITION)
+        feature = websocket.receive_json()
+        websocket.send_text("{}")
+        assert "detail" in websocket.receive_json()
+
+    assert feature["coord_x"] == POSITION["coord_x"]
+    assert len(upstream["requests"]) == 2
+    assert upstream["cancelled"] == upstream["requests"][:1]
+
+
+def test_invalid_messages(client, mock_ju):
+    with client.websocket_connect(LIVE_URL) as websocket:
+        websocket.send_text("not json")
+        assert "detail" in websocket.receive_json()
+        websocket.send_json({"coord_x": 1, "coord_y": 2})
+        assert "detail" in websocket.receive_json()
+        websocket.send_json(POSITION)
+        assert websocket.receive_json()["canton"] == "JU"
+
+
+def test_messages_rate_limited(client, monkeypatch, mock_ju):
+    monkeypatch.setattr(live, "MESSAGE_RATE_LIMIT", "2/minute")
+    security.limiter.reset()
+
+    try:
+        with client.websocket_connect(LIVE_URL) as websocket:
+            websocket.send_json(POSITION)
+            assert websocket.receive_json()["canton"] == "JU"
+            websocket.send_text("not a position")
+            assert "detail" in websocket.receive_json()
+            websocket.send_json(POSITION)
+            with pytest.raises(WebSocketDisconnect) as closed:
+                websocket.receive_json()
+        assert closed.value.code == 1008
+
+        # The budget is per client address, not per socket
+        with client.websocket_connect(LIVE_URL) as websocket:
+            websocket.send_json(POSITION)
+            with pytest.raises(WebSocketDisconnect) as closed:
+                websocket.receive_json()
+        assert closed.value.code == 1008
+    finally:
+        security.limiter.reset()
+
+
+def test_connections_capped(client, monkeypatch, mock_ju):
+    monkeypatch.setattr(settings, "LIVE_MAX_CONNECTIONS", 1)
+
+    with client.websocket_connect(LIVE_URL) as websocket:
+        websocket.send_json(POSITION)
+        assert websocket.receive_json()["canton"] == "JU"
+        with (
+            pytest.raises(WebSocketDisconnect) as closed,
+            client.websocket_connect(LIVE_URL) as second,
+        ):
+            second.receive_json()
+        assert closed.value.code == 1013
+
+    # Closed sockets free their place
+    with client.websocket_connect(LIVE_URL) as websocket:
+        websocket.send_json(POSITION)
+        assert websocket.receive_json()["canton"] == "JU"
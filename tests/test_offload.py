@@ -0,0 +1,81 @@
+"""Tests for the parse executor.
+
+Covers:
+- small payloads and PARSE_EXECUTOR=inline stay on the event loop
+- large payloads are parsed in the thread pool, with queue and parse metrics
+- the process pool parses a cantonal GML response and forwards parse errors
+"""
+
+import threading
+
+import httpx
+import pytest
+import respx
+from conftest import JU_WMS_URL
+from fastapi import HTTPException
+
+from drillapi.cantons_configuration import cantons
+from drillapi.config import settings
+from drillapi.services import metrics, offload, processing
+
+JU_CONFIG = cantons.CANTONS["cantons_configurations"]["JU"]
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    metrics.reset()
+    yield
+    offload.shutdown()
+    metrics.reset()
+
+
+def _thread_name(_content):
+    return threading.current_thread().name
+
+
+@pytest.mark.asyncio
+async def test_small_payload_inline(monkeypatch):
+    monkeypatch.setattr(settings, "PARSE_EXECUTOR", "thread")
+
+    name = await offload.run(_thread_name, b"x" * 100, size=100)
+
+    assert name == threading.current_thread().name
+    assert not offload._executors
+    assert metrics.snapshot()["timings"]["parse.inline"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_large_payload_in_thread_pool(monkeypatch):
+    monkeypatch.setattr(settings, "PARSE_EXECUTOR", "thread")
+    size = settings.PARSE_OFFLOAD_MIN_BYTES
+
+    name = await offload.run(_thread_name, b"x" * size, size=size)
+
+    assert name.startswith("drillapi-parse")
+    timings = metrics.snapshot()["timings"]
+    assert timings["parse.queued"]["count"] == 1
+    assert timings["parse.duration"]["count"] == 1
+    assert "parse.inline" not in timings
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_process_pool_parses_gml(monkeypatch, ju_gml):
+    respx.get(JU_WMS_URL).mock(return_value=httpx.Response(200, content=ju_gml))
+    inline = await processing.fetch_features_for_point(2574738, 1249285, JU_CONFIG)
+
+    monkeypatch.setattr(settings, "PARSE_EXECUTOR", "process")
+    monkeypatch.setattr(settings, "PARSE_OFFLOAD_MIN_BYTES", 0)
+    offloaded = await processing.fetch_features_for_point(2574738, 1249285, JU_CONFIG)
+
+    assert offloaded["features"] == inline["features"]
+    assert metrics.snapshot()["timings"]["parse.duration"]["count"] == 1
+
+    with pytest.raises(HTTPException):
+        await offload.run(
+            processing.parse_wms_getfeatureinfo,
+            b"not xml <><>",
+            "application/vnd.ogc.gml",
+            JU_CONFIG,
+            size=12,
+        )
@@ -0,0 +1,429 @@
+"""Tests for the outbound limits per upstream host.
+
+Covers:
+- requests to a cantonal host never exceed the canton's max_concurrency
+- the token bucket spaces requests past the burst, with metrics
+- geo.admin.ch identify requests follow the UPSTREAM_* defaults
+- no limit and no metrics when nothing is configured
+- the adaptive limit grows when reached, backs off once per round trip on
+  slow responses and errors, and settles near a host's sustainable concurrency
+- cancelled waiters of the adaptive limit do not hold a slot
+- 429 and 5xx of raster GetMap requests and requests cancelled in flight cut
+  the adaptive limit
+- cantons sharing a host share one limiter with the strictest of their limits,
+  whatever canton comes first, tightened in place (requests in flight and
+  adaptive state kept)
+- requests waiting for a token of the bucket hold no concurrency slot
+- waiting interactive requests are served before background ones, which hold
+  at most UPSTREAM_BACKGROUND_SHARE of a host's concurrency
+- with a rate limit only, interactive requests do not wait behind queued
+  background requests for a token
+- without any host limit, lanes have no effect
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+import respx
+from conftest import IDENTIFY_URL, JU_WMS_URL
+
+from drillapi.cantons_configuration import cantons
+from drillapi.config import settings
+from drillapi.services import metrics, outbound, processing, raster
+
+
+def _ju_config(**limits):
+    return {**cantons.CANTONS["cantons_configurations"]["JU"], **limits}
+
+
+def _tracking(response):
+    """Side effect recording the highest number of concurrent requests."""
+    state = {"current": 0, "max": 0}
+
+    async def side_effect(request):
+        state["current"] += 1
+        state["max"] = max(state["max"], state["current"])
+        await asyncio.sleep(0.02)
+        state["current"] -= 1
+        return response
+
+    return side_effect, state
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_canton_max_concurrency(ju_gml):
+    metrics.reset()
+    side_effect, state = _tracking(httpx.Response(200, content=ju_gml))
+    respx.get(JU_WMS_URL).mock(side_effect=side_effect)
+    config = _ju_config(max_concurrency=2)
+
+    results = await asyncio.gather(
+        *(
+            processing.fetch_features_for_point(2574738 + i, 1249285, config)
+            for i in range(6)
+        )
+    )
+
+    assert all(result["error"] is None for result in results)
+    assert state["max"] == 2
+    timings = metrics.snapshot()["timings"]
+    assert timings["outbound.wait"]["count"] == 6
+    assert timings["outbound.wait.geoservices.jura.ch"]["max"] > 0.01
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_token_bucket(ju_gml):
+    metrics.reset()
+    side_effect, _ = _tracking(httpx.Response(200, content=ju_gml))
+    respx.get(JU_WMS_URL).mock(side_effect=side_effect)
+    config = _ju_config(max_rate=20, rate_burst=1)
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            processing.fetch_features_for_point(2574738, 1249285, config)
+            for _ in range(3)
+        )
+    )
+
+    # One request from the burst, then one every 50 ms
+    assert time.perf_counter() - started >= 0.09
+    assert metrics.snapshot()["counters"]["outbound.throttled"] == 2
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_identify_follows_defaults(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_MAX_CONCURRENCY", 1)
+    side_effect, state = _tracking(
+        httpx.Response(200, json={"results": [{"attributes": {"ak": "JU"}}]})
+    )
+    respx.get(IDENTIFY_URL).mock(side_effect=side_effect)
+
+    results = await asyncio.gather(
+        *(
+            processing.get_canton_from_coordinates(2574738 + i, 1249285)
+            for i in range(3)
+        )
+    )
+
+    assert all(result[0]["attributes"]["ak"] == "JU" for result in results)
+    assert state["max"] == 1
+    assert outbound.in_flight()["api3.geo.admin.ch"] == 0
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_unlimited_by_default(ju_gml):
+    metrics.reset()
+    side_effect, state = _tracking(httpx.Response(200, content=ju_gml))
+    respx.get(JU_WMS_URL).mock(side_effect=side_effect)
+
+    await asyncio.gather(
+        *(
+            processing.fetch_features_for_point(2574738, 1249285, _ju_config())
+            for _ in range(4)
+        )
+    )
+
+    assert state["max"] == 4
+    assert "outbound.wait" not in metrics.snapshot()["timings"]
+
+
+def test_adaptive_limit_aimd(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_ADAPTIVE_BACKOFF", 0.5)
+    limit = outbound.AdaptiveLimit(initial=2, maximum=10)
+    limit.in_flight = 2
+
+    for _ in range(10):
+        limit.record(0.01, overloaded=False)
+    assert 3 < limit.limit <= 10
+    grown = limit.limit
+
+    # Slower than twice the baseline
+    limit.record(0.05, overloaded=False)
+    assert limit.limit == pytest.approx(grown * 0.5)
+    # Same round trip, no second cut
+    limit.record(0.05, overloaded=True)
+    assert limit.limit == pytest.approx(grown * 0.5)
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limit_cancelled_waiter():
+    limit = outbound.AdaptiveLimit(initial=1, maximum=1)
+    await limit.acquire()
+    waiter = asyncio.ensure_future(limit.acquire())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.sleep(0)
+    limit.release()
+
+    assert limit.in_flight == 0
+    await asyncio.wait_for(limit.acquire(), 1)
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_adaptive_backoff_on_server_errors(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_ADAPTIVE", True)
+    metrics.reset()
+    respx.get(JU_WMS_URL).mock(return_value=httpx.Response(503))
+    config = _ju_config()
+
+    result = await processing.fetch_features_for_point(2574738, 1249285, config)
+
+    assert result["geoservice_unavailable"]
+    limiter = outbound.get_limiter("geoservices.jura.ch", config)
+    assert limiter.concurrency.limit < settings.UPSTREAM_ADAPTIVE_INITIAL
+    assert metrics.snapshot()["counters"]["outbound.backoff"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("status", [429, 503])
+@respx.mock
+async def test_adaptive_backoff_on_getmap_errors(monkeypatch, status):
+    monkeypatch.setattr(settings, "UPSTREAM_ADAPTIVE", True)
+    metrics.reset()
+    respx.get(JU_WMS_URL).mock(return_value=httpx.Response(status))
+    config = _ju_config(raster_sampling={"layers": "suitability"})
+
+    async with httpx.AsyncClient() as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            await raster.fetch_getmap(
+                client, config, (2574700, 1249200, 2574800, 1249300), 10, 10
+            )
+
+    limiter = outbound.get_limiter("geoservices.jura.ch", config)
+    assert limiter.concurrency.limit < settings.UPSTREAM_ADAPTIVE_INITIAL
+    assert metrics.snapshot()["counters"]["outbound.backoff"] == 1
+
+
+@pytest.mark.asyncio
+async def test_adaptive_backoff_on_cancelled_request(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_ADAPTIVE", True)
+    metrics.reset()
+    url = "https://hanging.example.org/wms"
+
+    async def request():
+        async with outbound.slot(url):
+            await asyncio.sleep(10)
+
+    with pytest.raises(TimeoutError):
+        await asyncio.wait_for(request(), 0.02)
+
+    limiter = outbound.get_limiter("hanging.example.org")
+    assert limiter.concurrency.limit < settings.UPSTREAM_ADAPTIVE_INITIAL
+    assert limiter.concurrency.in_flight == 0
+    assert metrics.snapshot()["counters"]["outbound.backoff"] == 1
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limit_finds_sustainable_concurrency(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_ADAPTIVE", True)
+    monkeypatch.setattr(settings, "UPSTREAM_ADAPTIVE_INITIAL", 1)
+    server = {"current": 0}
+
+    async def request():
+        async with outbound.slot("https://slow.example.org/wms"):
+            # Fast up to 4 concurrent requests, then queueing on the server
+            server["current"] += 1
+            await asyncio.sleep(0.005 * max(1, server["current"] - 3) ** 2)
+            server["current"] -= 1
+
+    async def worker():
+        for _ in range(20):
+            await request()
+
+    await asyncio.gather(*(worker() for _ in range(16)))
+
+    limit = outbound.adaptive_limits()["slow.example.org"]
+    assert 2 <= limit <= 8
+
+
+@pytest.mark.asyncio
+async def test_interactive_lane_served_first():
+    limit = outbound.ConcurrencyLimit(1)
+    granted = []
+
+    async def acquire(lane):
+        await limit.acquire(lane)
+        granted.append(lane)
+
+    await limit.acquire(outbound.INTERACTIVE)
+    waiters = [
+        asyncio.ensure_future(acquire(outbound.BACKGROUND)),
+        asyncio.ensure_future(acquire(outbound.INTERACTIVE)),
+    ]
+    await asyncio.sleep(0)
+    limit.release(outbound.INTERACTIVE)
+    await asyncio.sleep(0)
+    limit.release(outbound.INTERACTIVE)
+    await asyncio.gather(*waiters)
+
+    assert granted == [outbound.INTERACTIVE, outbound.BACKGROUND]
+
+
+@pytest.mark.asyncio
+async def test_background_share(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_BACKGROUND_SHARE", 0.5)
+    limit = outbound.ConcurrencyLimit(4)
+
+    await limit.acquire(outbound.BACKGROUND)
+    await limit.acquire(outbound.BACKGROUND)
+    third = asyncio.ensure_future(limit.acquire(outbound.BACKGROUND))
+    await asyncio.sleep(0)
+    assert not third.done()
+
+    # Spare capacity is kept for interactive requests
+    await asyncio.wait_for(limit.acquire(outbound.INTERACTIVE), 1)
+    await asyncio.wait_for(limit.acquire(outbound.INTERACTIVE), 1)
+    limit.release(outbound.BACKGROUND)
+    await asyncio.wait_for(third, 1)
+
+
+@pytest.mark.asyncio
+async def test_interactive_request_during_bulk(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_MAX_CONCURRENCY", 2)
+    metrics.reset()
+    url = "https://busy.example.org/wms"
+
+    async def request():
+        async with outbound.slot(url):
+            await asyncio.sleep(0.05)
+
+    with outbound.background():
+        bulk = [asyncio.ensure_future(request()) for _ in range(20)]
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await request()
+    interactive = time.perf_counter() - started
+
+    # Background requests keep a slot free, the queue is not in the way
+    assert interactive < 0.15
+    assert not all(task.done() for task in bulk)
+    await asyncio.gather(*bulk)
+    timings = metrics.snapshot()["timings"]
+    assert timings["outbound.wait.background"]["count"] == 20
+    assert timings["outbound.wait.interactive"]["count"] == 1
+
+
+@pytest.mark.asyncio
+async def test_shared_host_gets_strictest_limits():
+    url = "https://shared.example.org/wms"
+    strict = {"wms_url": url, "max_concurrency": 2, "max_rate": 50}
+    loose = {"wms_url": url, "max_concurrency": 8, "rate_burst": 3}
+
+    for first, second in ((strict, loose), (loose, strict)):
+        outbound._limiters.clear()
+        async with outbound.slot(url, first), outbound.slot(url, second):
+            # Tightened in place, the first request is still counted
+            assert outbound.in_flight()["shared.example.org"] == 2
+        limiter = outbound.get_limiter("shared.example.org", first)
+        assert limiter.in_flight == 0
+        assert limiter.concurrency.in_flight == 0
+        assert limiter is outbound.get_limiter("shared.example.org", second)
+        assert limiter.concurrency.limit == 2
+        assert limiter.bucket.rate == 50
+        assert limiter.bucket.burst == 3
+        assert list(outbound._limiters) == ["shared.example.org"]
+
+
+@pytest.mark.asyncio
+async def test_tightened_adaptive_limit_keeps_state(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_ADAPTIVE", True)
+    monkeypatch.setattr(settings, "UPSTREAM_ADAPTIVE_INITIAL", 8)
+    url = "https://adaptive.example.org/wms"
+    limiter = outbound.get_limiter("adaptive.example.org", {"wms_url": url})
+    limiter.concurrency.record(0.05, False)
+
+    tightened = outbound.get_limiter(
+        "adaptive.example.org", {"wms_url": url, "max_concurrency": 4}
+    )
+
+    assert tightened is limiter
+    assert limiter.concurrency.baseline == 0.05
+    assert limiter.concurrency.maximum == 4
+    assert limiter.concurrency.limit == 4
+
+
+@pytest.mark.asyncio
+async def test_throttled_request_holds_no_slot(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "UPSTREAM_MAX_RATE", 10)
+    monkeypatch.setattr(settings, "UPSTREAM_RATE_BURST", 1)
+    url = "https://throttled.example.org/wms"
+    limiter = outbound.get_limiter("throttled.example.org")
+
+    async with outbound.slot(url):
+        pass
+    # The next token is due in 0.1s, the slot stays free meanwhile
+    entered = asyncio.Event()
+    done = asyncio.Event()
+
+    async def request():
+        async with outbound.slot(url):
+            entered.set()
+            await done.wait()
+
+    task = asyncio.ensure_future(request())
+    await asyncio.sleep(0.02)
+    assert not entered.is_set()
+    assert limiter.concurrency.in_flight == 0
+    await asyncio.wait_for(entered.wait(), 1)
+    assert limiter.concurrency.in_flight == 1
+    done.set()
+    await task
+
+
+@pytest.mark.asyncio
+async def test_interactive_request_during_throttled_bulk(monkeypatch):
+    monkeypatch.setattr(settings, "UPSTREAM_MAX_RATE", 20)
+    monkeypatch.setattr(settings, "UPSTREAM_RATE_BURST", 1)
+    metrics.reset()
+    url = "https://rated.example.org/wms"
+
+    async def request():
+        async with outbound.slot(url):
+            pass
+
+    with outbound.background():
+        bulk = [asyncio.ensure_future(request()) for _ in range(10)]
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await request()
+    interactive = time.perf_counter() - started
+
+    # Next token, not after the ten background requests (0.5s)
+    assert interactive < 0.15
+    assert not all(task.done() for task in bulk)
+    await asyncio.gather(*bulk)
+    assert metrics.snapshot()["counters"]["outbound.throttled"] >= 9
+
+
+@pytest.mark.asyncio
+async def test_lanes_inactive_without_limits():
+    metrics.reset()
+    url = "https://unlimited.example.org/wms"
+    running = {"current": 0, "max": 0}
+
+    async def request():
+        async with outbound.slot(url):
+            running["current"] += 1
+            running["max"] = max(running["max"], running["current"])
+            await asyncio.sleep(0.02)
+            running["current"] -= 1
+
+    with outbound.background():
+        bulk = [asyncio.ensure_future(request()) for _ in range(20)]
+    await asyncio.sleep(0)
+    await request()
+    await asyncio.gather(*bulk)
+
+    # Nothing held back nor measured: no priority for the interactive request
+    assert running["max"] == 21
+    assert "outbound.wait.background" not in metrics.snapshot()["timings"]
+    assert "unlimited.example.org" not in outbound.in_flight()
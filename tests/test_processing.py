@@ -5,6 +5,8 @@ Covers:
 - get_canton_from_coordinates error handling (network, HTTP, JSON errors)
 - parse_wms_getfeatureinfo with GeoJSON FeatureCollection
 - parse_wms_getfeatureinfo with ESRI REST JSON
+- decode_json_features skips geometries and matches the generic JSON parsing,
+  invalid UTF-8 and invalid JSON fall back to it
 - parse_wms_getfeatureinfo with invalid XML/GML
 - parse_wms_getfeatureinfo ZH special case
 - process_ground_category with no matching features (fallback harmonized_value=4)
@@ -15,7 +17,9 @@ import json
 import pytest
 import respx
 import httpx
+from drillapi.services import processing
 from drillapi.services.processing import (
+    decode_json_features,
     normalize_string,
     get_canton_from_coordinates,
     parse_wms_getfeatureinfo,
@@ -134,6 +138,54 @@ def test_parse_esri_rest_json():
     assert features[0]["layerName"] == "geothermie"
 
 
+def test_decode_json_features_skips_geometry():
+    """Geometries are not decoded, properties and attributes are kept."""
+    geojson = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "layerName": "zones",
+                "geometry": {"type": "Polygon", "coordinates": [[[1, 2], [3, 4]]]},
+                "properties": {"category": "Autorisé", "depth": 100},
+            },
+            {"type": "Feature", "layerName": "empty", "properties": None},
+        ],
+    }
+
+    features = decode_json_features(json.dumps(geojson).encode("utf-8"))
+
+    assert features == [
+        {"category": "Autorisé", "depth": 100, "layerName": "zones"},
+        {"layerName": "empty"},
+    ]
+
+
+def test_decode_json_features_matches_generic_parsing():
+    """The ESRI fixture gives the same features as the generic JSON parsing."""
+    with open("tests/data/esri/identify_fr.json", "rb") as f:
+        content = f.read()
+
+    features = decode_json_features(content)
+
+    assert features
+    assert features == processing._parse_json(content.decode("utf-8"))
+
+
+def test_parse_json_fallback():
+    """Invalid UTF-8 is ignored as before, invalid JSON raises HTTPException(500)."""
+    from fastapi import HTTPException
+
+    content = b'{"features": [{"attributes": {"zone": "ok\xff"}}]}'
+    assert decode_json_features(content) is None
+    features = parse_wms_getfeatureinfo(content, "arcgis/json", {"name": "FR"})
+    assert features == [{"zone": "ok", "layerName": None}]
+
+    with pytest.raises(HTTPException) as exc_info:
+        parse_wms_getfeatureinfo(b"{not json", "application/json", {"name": "VD"})
+    assert exc_info.value.status_code == 500
+
+
 def test_parse_invalid_xml_raises_http_exception():
     """Invalid XML/GML content raises HTTPException(500)."""
     from fastapi import HTTPException
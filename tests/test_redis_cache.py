@@ -0,0 +1,296 @@
+"""Tests for the shared Redis protocol cache tier.
+
+Runs against a minimal in-process stand-in server (GET, SET PX NX, MGET,
+DEL, INCR, SCAN and the unlock script), no Redis installation is needed.
+
+Covers:
+- results fetched by one node are served to another node from the server
+- identify results are shared too
+- bulk requests read the cache with one pipelined round trip
+- a node waits for the in-flight lock held by another node, and fetches
+  itself as soon as the lock is released without a result
+- a purge on one node clears the memory tier of the other nodes
+- a node never releases a lock taken by another node after its own expired
+- an unreachable server degrades to local caching
+"""
+
+import asyncio
+import fnmatch
+import socket
+import threading
+import time
+
+import pytest
+
+from drillapi.cantons_configuration import cantons
+from drillapi.config import settings
+from drillapi.services import cache, metrics
+from drillapi.services.redis_cache import (
+    UNLOCK_SCRIPT,
+    RedisCache,
+    encode_command,
+    read_reply,
+)
+
+JU_X = 2574738
+JU_Y = 1249285
+# Client gone
+DISCONNECTED = (ConnectionError, asyncio.IncompleteReadError)
+
+
+class StandInServer:
+    """Subset of the Redis protocol, enough for the cache tier."""
+
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+        self.loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        async def _start():
+            self.server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+            self.port = self.server.sockets[0].getsockname()[1]
+            ready.set()
+
+        self.thread = threading.Thread(
+            target=lambda: (
+                self.loop.run_until_complete(_start()),
+                self.loop.run_forever(),
+            ),
+            daemon=True,
+        )
+        self.thread.start()
+        ready.wait(5)
+
+    def stop(self):
+        async def _shutdown():
+            self.server.close()
+            handlers = [
+                t for t in asyncio.all_tasks() if t is not asyncio.current_task()
+            ]
+            for task in handlers:
+                task.cancel()
+            await asyncio.gather(*handlers, return_exceptions=True)
+
+        asyncio.run_coroutine_threadsafe(_shutdown(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+
+    def _get(self, key):
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and expires < time.time():
+            del self.data[key]
+            return None
+        return value
+
+    async def _handle(self, reader, writer):
+        while True:
+            try:
+                command = await read_reply(reader)
+            except DISCONNECTED:
+                break
+            name, *args = [a.decode() if isinstance(a, bytes) else a for a in command]
+            self.commands.append(name.upper())
+            writer.write(self._reply(name.upper(), args))
+            await writer.drain()
+        writer.close()
+
+    def _reply(self, name, args) -> bytes:
+        if name == "GET":
+            return _bulk(self._get(args[0]))
+        if name == "MGET":
+            return b"*%d\r\n" % len(args) + b"".join(_bulk(self._get(k)) for k in args)
+        if name == "SET":
+            key, value, *options = args
+            options = [o.upper() for o in options]
+            if "NX" in options and self._get(key) is not None:
+                return b"$-1\r\n"
+            expires = None
+            if "PX" in options:
+                expires = time.time() + int(options[options.index("PX") + 1]) / 1000
+            self.data[key] = (value, expires)
+            return b"+OK\r\n"
+        if name == "DEL":
+            removed = sum(self.data.pop(k, None) is not None for k in args)
+            return b":%d\r\n" % removed
+        if name == "INCR":
+            value = int(self._get(args[0]) or 0) + 1
+            self.data[args[0]] = (str(value), None)
+            return b":%d\r\n" % value
+        if name == "EVAL" and args[0] == UNLOCK_SCRIPT:
+            key, token = args[2], args[3]
+            if self._get(key) != token:
+                return b":0\r\n"
+            del self.data[key]
+            return b":1\r\n"
+        if name == "SCAN":
+            pattern = args[args.index("MATCH") + 1]
+            keys = [k for k in self.data if fnmatch.fnmatchcase(k, pattern)]
+            return (
+                b"*2\r\n"
+                + _bulk("0")
+                + b"*%d\r\n" % len(keys)
+                + b"".join(_bulk(k) for k in keys)
+            )
+        return b"-ERR unknown command\r\n"
+
+
+def _bulk(value) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    data = value.encode("utf-8")
+    return b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    server = StandInServer()
+    monkeypatch.setattr(settings, "RESULT_CACHE", True)
+    monkeypatch.setattr(settings, "REDIS_URL", f"redis://127.0.0.1:{server.port}/0")
+    cache.reset_result_cache()
+    yield server
+    cache.reset_result_cache()
+    server.stop()
+
+
+def _new_node():
+    """Forget the local tiers, as another node behind the load balancer would."""
+    cache.reset_result_cache()
+
+
+def test_encode_command():
+    assert (
+        encode_command(("SET", "k", 1)) == b"*3\r\n$3\r\nSET\r\n$1\r\nk\r\n$1\r\n1\r\n"
+    )
+
+
+def test_results_shared_between_nodes(client, redis_server, mock_ju):
+    identify, wms = mock_ju["identify"], mock_ju["wms"]
+
+    first = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}")
+    _new_node()
+    second = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}")
+
+    assert first.json()["ground_category"] == second.json()["ground_category"]
+    assert identify.call_count == 1
+    assert wms.call_count == 1
+    assert any(key.startswith("drillapi:identify:") for key in redis_server.data)
+    assert any(key.startswith("drillapi:features:JU:") for key in redis_server.data)
+
+
+def test_bulk_uses_pipelined_multi_get(client, redis_server, mock_ju):
+    wms = mock_ju["wms"]
+    points = [{"coord_x": JU_X + i * 10, "coord_y": JU_Y} for i in range(5)]
+
+    client.post("/v1/drill-category/bulk", json={"points": points})
+    _new_node()
+    redis_server.commands.clear()
+    response = client.post("/v1/drill-category/bulk", json={"points": points})
+
+    assert response.status_code == 200
+    assert wms.call_count == 5
+    # The purge generation, then one MGET for identify and one for the
+    # cantonal results, nothing per point
+    assert redis_server.commands == ["GET", "MGET", "MGET"]
+
+
+@pytest.mark.asyncio
+async def test_waits_for_in_flight_lock(redis_server, monkeypatch, mock_ju):
+    monkeypatch.setattr(settings, "RESULT_CACHE_LOCK_TIMEOUT", 5.0)
+    wms = mock_ju["wms"]
+    config = {"name": "JU", "layers": []}
+    key = cache.cache_key("features", "JU", cache.config_version(config), JU_X, JU_Y)
+    other_node = RedisCache(settings.REDIS_URL)
+    assert await other_node.lock(key, 5.0)
+
+    async def _other_node_fetches():
+        await asyncio.sleep(0.2)
+        entry = {"stored_at": time.time(), "result": {"features": ["shared"]}}
+        await other_node.set(key, entry, 60, "JU", "")
+        await other_node.unlock(key)
+
+    result, _ = await asyncio.gather(
+        cache.fetch_features_for_point(JU_X, JU_Y, config), _other_node_fetches()
+    )
+
+    assert result == {"features": ["shared"]}
+    assert wms.call_count == 0
+
+
+@pytest.mark.asyncio
+async def test_fetches_when_lock_released_without_result(
+    redis_server, monkeypatch, mock_ju
+):
+    monkeypatch.setattr(settings, "RESULT_CACHE_LOCK_TIMEOUT", 5.0)
+    wms = mock_ju["wms"]
+    config = cantons.CANTONS["cantons_configurations"]["JU"]
+    key = cache.cache_key("features", "JU", cache.config_version(config), JU_X, JU_Y)
+    other_node = RedisCache(settings.REDIS_URL)
+    assert await other_node.lock(key, 5.0)
+
+    async def _other_node_fails():
+        await asyncio.sleep(0.2)
+        await other_node.unlock(key)
+
+    started = time.monotonic()
+    result, _ = await asyncio.gather(
+        cache.fetch_features_for_point(JU_X, JU_Y, config), _other_node_fails()
+    )
+
+    assert time.monotonic() - started < 2.0
+    assert wms.call_count == 1
+    assert not result.get("geoservice_unavailable")
+
+
+@pytest.mark.asyncio
+async def test_purge_reaches_other_nodes(redis_server):
+    node = cache.TieredCache([cache.MemoryCache(), RedisCache(settings.REDIS_URL)])
+    other = cache.TieredCache(
+        [cache.MemoryCache(), RedisCache(settings.REDIS_URL, generation_interval=0)]
+    )
+    await other.set("features:JU:v1:0:0", {"result": {}}, 60, "JU", "v1")
+    await other.get("features:JU:v1:0:0", 60, "JU", "v1")
+
+    await node.purge(canton="JU")
+
+    assert await other.get("features:JU:v1:0:0", 60, "JU", "v1") is None
+    assert redis_server.data["drillapi:generation"] == ("1", None)
+
+
+@pytest.mark.asyncio
+async def test_unlock_keeps_lock_of_another_node(redis_server):
+    node, other_node = RedisCache(settings.REDIS_URL), RedisCache(settings.REDIS_URL)
+    assert await node.lock("k", 0.05)
+    await asyncio.sleep(0.1)
+    assert await other_node.lock("k", 5.0)
+
+    await node.unlock("k")
+
+    assert await node.locked("k")
+    assert redis_server.commands[-2] == "EVAL"
+    await other_node.unlock("k")
+    assert not await node.locked("k")
+
+
+def test_unreachable_server_degrades_to_local_cache(client, monkeypatch, mock_ju):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    monkeypatch.setattr(settings, "RESULT_CACHE", True)
+    monkeypatch.setattr(settings, "REDIS_URL", f"redis://127.0.0.1:{port}")
+    cache.reset_result_cache()
+    metrics.reset()
+    wms = mock_ju["wms"]
+
+    try:
+        first = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}")
+        second = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}")
+    finally:
+        cache.reset_result_cache()
+
+    assert first.status_code == second.status_code == 200
+    assert second.json()["ground_category"]["harmonized_value"] == 1
+    assert wms.call_count == 1
+    # Marked down after the first error, not retried on every request
+    assert metrics.snapshot()["counters"]["redis.unavailable"] == 1
@@ -0,0 +1,212 @@
+"""Tests for the cantonal result cache.
+
+Covers:
+- a second request for the same (snapped) point is served from the cache
+- geoservice errors are not cached
+- the SQLite tier is shared between cache instances and back-fills memory,
+  keeping the expiry of the entry
+- a purge in one worker clears the memory tier and the HTTP cache of the
+  workers sharing its SQLite tier
+- a configuration change invalidates the cache key
+- compaction removes expired entries and enforces the size cap
+- last known good results are served, marked stale, when the geoservice fails
+- stale-while-revalidate answers from the cache and refreshes in the background
+  lane
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+import respx
+from conftest import JU_WMS_URL
+
+from drillapi.config import settings
+from drillapi.services import cache, http_cache, outbound
+
+JU_X = 2574738
+JU_Y = 1249285
+
+
+@pytest.fixture(autouse=True)
+def result_cache(monkeypatch):
+    monkeypatch.setattr(settings, "RESULT_CACHE", True)
+    cache.reset_result_cache()
+    yield
+    cache.reset_result_cache()
+
+
+@pytest.fixture
+def sqlite_path(monkeypatch, tmp_path):
+    path = tmp_path / "results.sqlite"
+    monkeypatch.setattr(settings, "RESULT_CACHE_PATH", path)
+    return path
+
+
+def test_second_request_is_cached(client, mock_ju):
+    wms = mock_ju["wms"]
+
+    first = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}")
+    # Less than RESULT_CACHE_SNAP / 2 away, same cache key
+    second = client.get(f"/v1/drill-category/{JU_X}.2/{JU_Y}.3")
+
+    assert first.status_code == second.status_code == 200
+    assert first.json()["ground_category"] == second.json()["ground_category"]
+    assert wms.call_count == 1
+
+
+def test_geoservice_errors_are_not_cached(client, mock_ju, ju_gml):
+    wms = mock_ju["wms"].mock(
+        side_effect=[httpx.Response(503), httpx.Response(200, content=ju_gml)]
+    )
+
+    first = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}")
+    second = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}")
+
+    assert first.json()["ground_category"]["harmonized_value"] == 98
+    assert second.json()["ground_category"]["harmonized_value"] == 1
+    assert wms.call_count == 2
+
+
+def test_sqlite_tier_survives_restart(client, sqlite_path, mock_ju):
+    wms = mock_ju["wms"]
+    client.get(f"/v1/drill-category/{JU_X}/{JU_Y}")
+
+    # New process: empty memory tier, same SQLite file
+    cache.reset_result_cache()
+    response = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}")
+
+    assert response.json()["ground_category"]["harmonized_value"] == 1
+    assert wms.call_count == 1
+    memory, sqlite = cache.get_result_cache().tiers
+    # geo.admin.ch identify and cantonal results
+    assert len(memory.entries) == sqlite.count() == 2
+
+
+def test_backfill_keeps_expiry(tmp_path):
+    memory = cache.MemoryCache()
+    sqlite = cache.SQLiteCache(tmp_path / "results.sqlite")
+    tiered = cache.TieredCache([memory, sqlite])
+    stored_at = time.time() - 50
+    entry = {"stored_at": stored_at, "result": {"features": []}}
+
+    async def _lookup():
+        expired = {**entry, "stored_at": stored_at - 100}
+        await sqlite.set("k", entry, 10, "JU", "v1")
+        await sqlite.set("expired", expired, 60, "JU", "v1")
+        await tiered.get("expired", 60, "JU", "v1")
+        return await tiered.get("k", 60, "JU", "v1")
+
+    assert asyncio.run(_lookup()) == entry
+    # Expires 60 seconds after it was stored, not 60 seconds after the hit
+    assert memory.entries["k"][1] == pytest.approx(stored_at + 60, abs=1)
+    assert "expired" not in memory.entries
+
+
+def test_purge_reaches_other_workers(tmp_path):
+    path = tmp_path / "results.sqlite"
+    worker = cache.TieredCache([cache.MemoryCache(), cache.SQLiteCache(path)])
+    other = cache.TieredCache([cache.MemoryCache(), cache.SQLiteCache(path)])
+    store = http_cache.ResponseStore(1024)
+    store.generation_source = other.generation
+    entry = {"stored_at": time.time(), "result": {"features": []}}
+
+    async def _purge():
+        await worker.set("features:JU:v1:0:0", entry, 60, "JU", "v1")
+        await worker.set("features:FR:v1:0:0", entry, 60, "FR", "v1")
+        await other.get("features:JU:v1:0:0", 60, "JU", "v1")
+        await store.check_generation()
+        store.put(
+            "https://geoservices.jura.ch/wms",
+            http_cache.CachedResponse(200, [], b"gml", time.time(), ()),
+        )
+
+        await worker.purge(canton="JU")
+
+        await store.check_generation()
+        return await other.get("features:JU:v1:0:0", 60, "JU", "v1")
+
+    assert asyncio.run(_purge()) is None
+    assert other.tiers[0].entries == {}
+    assert store.stats() == {"entries": 0, "bytes": 0}
+    # The purging worker keeps the entries of the other cantons
+    assert list(worker.tiers[0].entries) == ["features:FR:v1:0:0"]
+
+
+def test_config_version_changes_with_configuration():
+    config = {"name": "XX", "layers": [{"name": "a"}]}
+    changed = {"name": "XX", "layers": [{"name": "b"}]}
+
+    assert cache.config_version(config) == cache.config_version(dict(config))
+    assert cache.config_version(config) != cache.config_version(changed)
+
+
+def test_sqlite_compaction(tmp_path):
+    sqlite = cache.SQLiteCache(tmp_path / "results.sqlite", max_entries=2)
+
+    async def _fill():
+        await sqlite.set("expired", {}, -1, "JU", "v1")
+        for i in range(3):
+            await sqlite.set(f"k{i}", {"i": i}, 60, "JU", "v1")
+            await asyncio.sleep(0.01)
+
+    asyncio.run(_fill())
+    assert sqlite.count() == 4
+
+    assert sqlite.compact() == 2
+    assert asyncio.run(sqlite.get("k0")) is None
+    assert asyncio.run(sqlite.get("k2")) == {"i": 2}
+    assert asyncio.run(sqlite.purge(canton="JU", version="v1")) == 2
+
+
+def test_last_known_good_served_when_geoservice_fails(
+    client, monkeypatch, mock_ju, ju_gml
+):
+    monkeypatch.setattr(settings, "RESULT_CACHE_TTL", 0.0)
+    monkeypatch.setattr(settings, "RESULT_CACHE_STALE_TTL", 3600.0)
+    mock_ju["wms"].mock(
+        side_effect=[httpx.Response(200, content=ju_gml), httpx.Response(503)]
+    )
+
+    first = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}").json()
+    second = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}").json()
+
+    assert first["result_detail"]["stale"] is False
+    assert second["ground_category"]["harmonized_value"] == 1
+    assert second["result_detail"]["stale"] is True
+    assert second["result_detail"]["cached_at"]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_stale_while_revalidate(monkeypatch, ju_gml):
+    monkeypatch.setattr(settings, "RESULT_CACHE_TTL", 0.0)
+    monkeypatch.setattr(settings, "RESULT_CACHE_STALE_TTL", 3600.0)
+    monkeypatch.setattr(settings, "RESULT_CACHE_STALE_WHILE_REVALIDATE", True)
+    lanes = []
+
+    def side_effect(request):
+        lanes.append(outbound.lane.get())
+        return httpx.Response(200, content=ju_gml)
+
+    wms = respx.get(JU_WMS_URL).mock(side_effect=side_effect)
+    config = {
+        "name": "JU",
+        "info_format": "application/vnd.ogc.gml",
+        "query_url": JU_WMS_URL,
+        "bbox_delta": 1,
+        "layers": [{"name": "layer"}],
+    }
+
+    first = await cache.fetch_features_for_point(JU_X, JU_Y, config)
+    second = await cache.fetch_features_for_point(JU_X, JU_Y, config)
+
+    assert "stale" not in first
+    # Answered from the cache before the refresh completes
+    assert second["stale"] is True
+    assert wms.call_count == 1
+    await asyncio.gather(*cache._background_tasks)
+    assert wms.call_count == 2
+    # The refresh uses spare upstream capacity only
+    assert lanes == [outbound.INTERACTIVE, outbound.BACKGROUND]
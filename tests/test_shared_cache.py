@@ -0,0 +1,153 @@
+"""Tests for the shared memory cache tier.
+
+Covers:
+- an entry written by one process is read by another
+- the segment is removed by the last process closing it
+- a segment whose header is not written yet reads as misses until it is
+- torn or corrupted slots are read as misses
+- a full probe chain evicts the entry expiring first
+- purge by canton
+- the purge generation is shared by the processes attached to the segment
+- the tier is used by the result cache
+"""
+
+import asyncio
+import multiprocessing
+import os
+import uuid
+from multiprocessing import shared_memory
+
+import pytest
+
+from drillapi.config import settings
+from drillapi.services import cache
+from drillapi.services.shared_cache import (
+    HEADER,
+    SLOT_HEADER,
+    SharedMemoryCache,
+    registry_version,
+)
+
+REGISTRY = {"cantons_configurations": {"JU": {"name": "JU", "active": True}}}
+
+
+@pytest.fixture
+def segment_name():
+    name = f"drillapi-test-{uuid.uuid4().hex[:8]}"
+    yield name
+    try:
+        shared_memory.SharedMemory(f"{name}-{registry_version(REGISTRY)}").unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _write_from_child(name):
+    shared = SharedMemoryCache(name, REGISTRY, slots=16, slot_size=512)
+    asyncio.run(shared.set("features:JU:v1:1.00:2.00", {"x": 1}, 60, "JU", "v1"))
+    shared.close()
+
+
+def test_entry_shared_between_processes(segment_name):
+    shared = SharedMemoryCache(segment_name, REGISTRY, slots=16, slot_size=512)
+
+    child = multiprocessing.get_context("fork").Process(
+        target=_write_from_child, args=(segment_name,)
+    )
+    child.start()
+    child.join(10)
+
+    assert child.exitcode == 0
+    assert asyncio.run(shared.get("features:JU:v1:1.00:2.00")) == {"x": 1}
+
+
+def test_last_close_removes_segment(segment_name):
+    first = SharedMemoryCache(segment_name, REGISTRY, slots=16, slot_size=512)
+    second = SharedMemoryCache(segment_name, REGISTRY, slots=16, slot_size=512)
+    path = f"/dev/shm/{first.segment_name}"
+
+    first.close()
+    assert os.path.exists(path)
+    second.close()
+    assert not os.path.exists(path)
+
+
+def test_header_not_written_yet(segment_name):
+    creator = SharedMemoryCache(segment_name, REGISTRY, slots=16, slot_size=512)
+    key = "features:JU:v1:1.00:2.00"
+    asyncio.run(creator.set(key, {"x": 1}, 60, "JU", "v1"))
+    header = bytes(creator.buf[: HEADER.size])
+    creator.buf[: HEADER.size] = bytes(HEADER.size)
+
+    attached = SharedMemoryCache(segment_name, REGISTRY, slots=16, slot_size=512)
+    assert asyncio.run(attached.get(key)) is None
+
+    creator.buf[: HEADER.size] = header
+    assert asyncio.run(attached.get(key)) == {"x": 1}
+
+
+def test_corrupted_slot_is_a_miss(segment_name):
+    shared = SharedMemoryCache(segment_name, REGISTRY, slots=16, slot_size=512)
+    key = "features:JU:v1:1.00:2.00"
+    asyncio.run(shared.set(key, {"x": 1}, 60, "JU", "v1"))
+
+    offsets = [
+        shared._slot_offset(i)
+        for i in range(shared.slots)
+        if SLOT_HEADER.unpack_from(shared.buf, shared._slot_offset(i))[1]
+    ]
+    payload_start = offsets[0] + SLOT_HEADER.size
+    shared.buf[payload_start] ^= 0xFF
+
+    assert asyncio.run(shared.get(key)) is None
+
+
+def test_eviction_and_purge(segment_name):
+    shared = SharedMemoryCache(segment_name, REGISTRY, slots=4, slot_size=512)
+
+    async def _fill():
+        # More keys than slots: the shortest-lived entries are evicted
+        for i in range(4):
+            await shared.set(f"features:JU:v1:{i}:0", {"i": i}, 10, "JU", "v1")
+        await shared.set("features:FR:v1:0:0", {"fr": 1}, 60, "FR", "v1")
+        await shared.set("features:FR:v1:1:0", {"fr": 2}, 60, "FR", "v1")
+
+    asyncio.run(_fill())
+    assert asyncio.run(shared.get("features:FR:v1:0:0")) == {"fr": 1}
+    assert asyncio.run(shared.get("features:FR:v1:1:0")) == {"fr": 2}
+
+    assert asyncio.run(shared.purge(canton="JU")) == 2
+    assert asyncio.run(shared.purge(canton="FR")) == 2
+    assert asyncio.run(shared.get("features:FR:v1:0:0")) is None
+
+
+def test_generation_shared(segment_name):
+    shared = SharedMemoryCache(segment_name, REGISTRY, slots=4, slot_size=512)
+    other = SharedMemoryCache(segment_name, REGISTRY, slots=4, slot_size=512)
+
+    asyncio.run(shared.bump_generation())
+
+    assert asyncio.run(other.generation()) == 1
+    assert asyncio.run(shared.get("features:JU:v1:0:0")) is None
+
+
+def test_result_cache_uses_shared_memory(client, monkeypatch, segment_name, mock_ju):
+    monkeypatch.setattr(settings, "RESULT_CACHE", True)
+    monkeypatch.setattr(settings, "SHARED_MEMORY_CACHE", True)
+    monkeypatch.setattr(settings, "SHARED_MEMORY_NAME", segment_name)
+    monkeypatch.setattr(settings, "SHARED_MEMORY_SLOT_SIZE", 4096)
+    wms = mock_ju["wms"]
+
+    cache.reset_result_cache()
+    try:
+        client.get("/v1/drill-category/2574738/1249285")
+        # Another worker: empty memory tier, same segment
+        cache.reset_result_cache()
+        response = client.get("/v1/drill-category/2574738/1249285")
+        shared = cache.get_result_cache().tiers[1]
+    finally:
+        cache.reset_result_cache()
+
+    assert response.json()["ground_category"]["harmonized_value"] == 1
+    assert wms.call_count == 1
+    assert shared.name == "shm"
+    shared.unlink()
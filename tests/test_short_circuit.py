@@ -0,0 +1,171 @@
+"""Tests for the short-circuit evaluation of per-layer requests.
+
+Covers:
+- ESRI REST: a layer answering with the highest category cancels the other
+  layer requests and is reported as deciding layer
+- a failing layer does not matter once another layer has decided
+- WMS with split_layers: one request per layer, all awaited when no layer
+  reaches the highest category
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+import respx
+
+from drillapi.services import metrics, processing
+
+ESRI_URL = "https://esri.example.ch/arcgis/rest/services/geothermie/MapServer"
+WMS_URL = "https://wms.example.ch/wms"
+
+CATEGORIES = [
+    {"name": "OK", "desc": "Allowed", "target_harmonized_value": 1},
+    {"name": "Restricted", "desc": "Restricted", "target_harmonized_value": 2},
+    {"name": "Forbidden", "desc": "Forbidden", "target_harmonized_value": 3},
+]
+
+ESRI_CONFIG = {
+    "name": "ES",
+    "info_format": "arcgis/json",
+    "query_url": ESRI_URL,
+    "layers": [
+        {
+            "id": 1,
+            "name": "protection",
+            "property_name": "zone",
+            "property_values": CATEGORIES,
+        },
+        {
+            "id": 2,
+            "name": "groundwater",
+            "property_name": "zone",
+            "property_values": CATEGORIES,
+        },
+    ],
+}
+
+WMS_CONFIG = {
+    "name": "WS",
+    "info_format": "application/geo+json",
+    "query_url": WMS_URL,
+    "bbox_delta": 10,
+    "split_layers": True,
+    "layers": [
+        {"name": "protection", "property_name": "zone", "property_values": CATEGORIES},
+        {"name": "groundwater", "property_name": "zone", "property_values": CATEGORIES},
+    ],
+}
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def _esri(zone):
+    return httpx.Response(200, json={"features": [{"attributes": {"zone": zone}}]})
+
+
+def _geojson(zone):
+    return httpx.Response(
+        200,
+        json={
+            "type": "FeatureCollection",
+            "features": [{"type": "Feature", "properties": {"zone": zone}}],
+        },
+    )
+
+
+cancelled = []
+
+
+async def _slow(request):
+    try:
+        await asyncio.sleep(5)
+    except asyncio.CancelledError:
+        cancelled.append(request.url.path)
+        raise
+    return _esri("OK")
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_forbidden_layer_cancels_other_layers():
+    respx.get(f"{ESRI_URL}/1/query").mock(return_value=_esri("Forbidden"))
+    respx.get(f"{ESRI_URL}/2/query").mock(side_effect=_slow)
+    cancelled.clear()
+
+    started = time.monotonic()
+    result = await processing.fetch_features_for_point(2600000, 1200000, ESRI_CONFIG)
+
+    assert time.monotonic() - started < 1
+    assert result["deciding_layer"] == "protection"
+    await asyncio.sleep(0.01)  # let the cancelled request unwind
+    assert cancelled == ["/arcgis/rest/services/geothermie/MapServer/2/query"]
+    assert metrics.snapshot()["counters"]["layers.cancelled"] == 1
+
+    category = processing.process_ground_category(
+        result["features"], ESRI_CONFIG["layers"]
+    )
+    assert category.harmonized_value == 3
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_failed_layer_ignored_once_decided():
+    respx.get(f"{ESRI_URL}/1/query").mock(side_effect=httpx.ConnectTimeout("timeout"))
+
+    async def _forbidden_later(request):
+        await asyncio.sleep(0.05)
+        return _esri("Forbidden")
+
+    respx.get(f"{ESRI_URL}/2/query").mock(side_effect=_forbidden_later)
+
+    result = await processing.fetch_features_for_point(2600000, 1200000, ESRI_CONFIG)
+
+    assert not result.get("geoservice_unavailable")
+    assert result["deciding_layer"] == "groundwater"
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_split_wms_layers_all_awaited():
+    route = respx.get(WMS_URL)
+    route.side_effect = lambda request: _geojson(
+        "Restricted" if request.url.params["LAYERS"] == "protection" else "OK"
+    )
+
+    result = await processing.fetch_features_for_point(2600000, 1200000, WMS_CONFIG)
+
+    assert route.call_count == 2
+    assert sorted(call.request.url.params["QUERY_LAYERS"] for call in route.calls) == [
+        "groundwater",
+        "protection",
+    ]
+    assert "deciding_layer" not in result
+    category = processing.process_ground_category(
+        result["features"], WMS_CONFIG["layers"]
+    )
+    assert category.harmonized_value == 2
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_split_wms_layer_unavailable():
+    respx.get(WMS_URL).mock(
+        side_effect=lambda request: (
+            httpx.Response(503)
+            if request.url.params["LAYERS"] == "groundwater"
+            else _geojson("OK")
+        )
+    )
+
+    result = await processing.fetch_features_for_point(2600000, 1200000, WMS_CONFIG)
+
+    assert result["geoservice_unavailable"]
+    assert json.loads(json.dumps(result))["features"] == []
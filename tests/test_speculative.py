@@ -0,0 +1,87 @@
+"""Tests for the speculative cantonal fetch.
+
+Covers:
+- the cantonal request starts before geo.admin.ch identify has answered
+- a wrong guess is discarded and the identified canton is fetched
+- identify results feed the grid used for later guesses
+"""
+
+import asyncio
+
+import httpx
+import pytest
+import respx
+from conftest import IDENTIFY_URL, JU_WMS_URL
+
+from drillapi.config import settings
+from drillapi.services.canton_grid import canton_grid
+
+JU_X = 2574738
+JU_Y = 1249285
+
+
+@pytest.fixture(autouse=True)
+def speculative_fetch(monkeypatch):
+    monkeypatch.setattr(settings, "SPECULATIVE_FETCH", True)
+    canton_grid.clear()
+    yield
+    canton_grid.clear()
+
+
+def _identify_response(canton_code):
+    return httpx.Response(200, json={"results": [{"attributes": {"ak": canton_code}}]})
+
+
+@respx.mock
+def test_cantonal_fetch_runs_concurrently_with_identify(client, ju_gml):
+    """With a right guess, identify waits for the cantonal request that already started."""
+    canton_grid.observe(JU_X, JU_Y, "JU")
+    wms_started = asyncio.Event()
+
+    def _wms(request):
+        wms_started.set()
+        return httpx.Response(200, content=ju_gml)
+
+    async def _identify(request):
+        # Only answers once the speculative cantonal request is in flight
+        await asyncio.wait_for(wms_started.wait(), timeout=5)
+        return _identify_response("JU")
+
+    respx.get(IDENTIFY_URL).mock(side_effect=_identify)
+    wms = respx.get(JU_WMS_URL).mock(side_effect=_wms)
+
+    response = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}")
+
+    assert response.status_code == 200
+    assert response.json()["ground_category"]["harmonized_value"] == 1
+    assert wms.call_count == 1
+
+
+@respx.mock
+def test_wrong_guess_is_discarded(client, ju_gml):
+    """When identify contradicts the guess, the identified canton is fetched."""
+    canton_grid.observe(JU_X, JU_Y, "FR")
+
+    respx.get(IDENTIFY_URL).mock(return_value=_identify_response("JU"))
+    respx.get(
+        "https://map.geo.fr.ch/arcgis/rest/services/PortailCarto/Theme_environnement/MapServer/17/query"
+    ).mock(return_value=httpx.Response(200, json={"features": []}))
+    wms = respx.get(JU_WMS_URL).mock(return_value=httpx.Response(200, content=ju_gml))
+
+    response = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}")
+
+    payload = response.json()
+    assert payload["canton"] == "JU"
+    assert payload["ground_category"]["harmonized_value"] == 1
+    assert wms.call_count == 1
+    # The grid now knows the right canton for this cell
+    assert canton_grid.guess(JU_X, JU_Y) == "JU"
+
+
+def test_no_guess_fetches_after_identify(client, mock_ju):
+    """Without a guess the request behaves as before and learns the cell."""
+
+    response = client.get(f"/v1/drill-category/{JU_X}/{JU_Y}")
+
+    assert response.json()["ground_category"]["harmonized_value"] == 1
+    assert canton_grid.guess(JU_X + 10, JU_Y + 10) == "JU"
@@ -0,0 +1,119 @@
+"""Tests for the startup warm-up and the readiness endpoint.
+
+Covers:
+- every active cantonal host and geo.admin.ch are resolved and connected once
+- the warm-up times out without blocking readiness
+- unexpected errors, per host or of the whole warm-up, do not block readiness
+- /ready answers 503 until the warm-up is done
+"""
+
+import asyncio
+from urllib.parse import urlparse
+
+import httpx
+import pytest
+import respx
+from fastapi.testclient import TestClient
+
+from drillapi.app import app
+from drillapi.cantons_configuration import cantons
+from drillapi.config import settings
+from drillapi.services import warmup
+
+
+@pytest.fixture
+def resolved_hosts(monkeypatch):
+    """No DNS in tests: record the resolved host names instead."""
+    hosts = []
+
+    async def _getaddrinfo(host, port):
+        hosts.append(host)
+        return []
+
+    monkeypatch.setattr(warmup, "resolve_host", _getaddrinfo)
+    yield hosts
+    warmup.mark_ready()
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_warm_up_connects_every_host(resolved_hosts):
+    head = respx.head(url__regex=r".*").mock(return_value=httpx.Response(405))
+    active_hosts = {
+        urlparse(config["query_url"]).hostname
+        for config in cantons.CANTONS["cantons_configurations"].values()
+        if config.get("active")
+    }
+
+    await warmup.warm_up()
+
+    assert warmup.state["ready"] is True
+    assert warmup.state["timed_out"] is False
+    expected = active_hosts | {"api3.geo.admin.ch"}
+    assert set(resolved_hosts) == expected
+    assert len(resolved_hosts) == len(expected)
+    assert head.call_count == len(expected)
+    assert set(warmup.state["hosts"].values()) == {"ok"}
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_warm_up_timeout(resolved_hosts, monkeypatch):
+    monkeypatch.setattr(settings, "WARMUP_TIMEOUT", 0.1)
+
+    async def _slow(request):
+        await asyncio.sleep(5)
+        return httpx.Response(200)
+
+    respx.head(url__regex=r".*").mock(side_effect=_slow)
+
+    await warmup.warm_up()
+
+    assert warmup.state["ready"] is True
+    assert warmup.state["timed_out"] is True
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_warm_up_unexpected_host_error(monkeypatch):
+    respx.head(url__regex=r".*").mock(return_value=httpx.Response(405))
+
+    async def _invalid(host, port):
+        if host == "api3.geo.admin.ch":
+            raise ValueError("invalid host")
+        return []
+
+    monkeypatch.setattr(warmup, "resolve_host", _invalid)
+
+    await warmup.warm_up()
+
+    assert warmup.state["ready"] is True
+    assert warmup.state["hosts"]["api3.geo.admin.ch"].startswith("error: ValueError")
+    assert "ok" in warmup.state["hosts"].values()
+    warmup.mark_ready()
+
+
+@pytest.mark.asyncio
+async def test_warm_up_failure_still_ready(monkeypatch):
+    def _broken():
+        raise KeyError("query_url")
+
+    monkeypatch.setattr(warmup, "warmup_urls", _broken)
+
+    await warmup.warm_up()
+
+    assert warmup.state["ready"] is True
+    assert warmup.state["duration"] is not None
+    warmup.mark_ready()
+
+
+def test_ready_endpoint():
+    with TestClient(app) as client:
+        # WARMUP_ENABLED is false in tests: ready at startup
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["ready"] is True
+
+        warmup.state["ready"] = False
+        assert client.get("/ready").status_code == 503
+    warmup.mark_ready()